@@ -1,13 +1,39 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, make_response, send_from_directory
+from flask import Flask, render_template, stream_template, get_template_attribute, request, redirect, url_for, jsonify, make_response, send_from_directory
 import psycopg2
 import psycopg2.extras
 import psycopg2.pool
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from flask.json.provider import DefaultJSONProvider
+from hmac import compare_digest
+import csv
+import gzip
+import io
 import json
+import math
+import mimetypes
 import os
+import queue
+import random
+import select
+import statistics
+import sys
+import threading
+import time
+import zlib
 from dotenv import load_dotenv
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 load_dotenv()
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 
@@ -17,6 +43,8 @@ app = Flask(__name__, static_folder='static', static_url_path='/static')
 # One pool, 1-5 warm connections. No SELECT 1 ping on every request.
 # ─────────────────────────────────────────────────────────────────
 _pool = None
+# libpq's variable name; only local throwaway servers (plan_check.py) set it
+DB_SSLMODE = os.environ.get('PGSSLMODE', 'require')
 
 def _build_uri():
     uri = os.environ.get('DATABASE_URL', '')
@@ -33,7 +61,7 @@ def _get_pool():
             minconn=1,
             maxconn=5,
             dsn=_build_uri(),
-            sslmode='require',
+            sslmode=DB_SSLMODE,
             connect_timeout=5,
             keepalives=1,
             keepalives_idle=30,
@@ -57,31 +85,85 @@ def db():
     pool = _get_pool()
     conn = pool.getconn()
     try:
+        if getattr(_profiling, 'active', None):
+            conn.cursor_factory = _timed_cursor(conn.cursor_factory)
         yield conn
         conn.commit()
     except Exception:
         conn.rollback()
         raise
     finally:
+        conn.cursor_factory = psycopg2.extras.RealDictCursor
         pool.putconn(conn)
 
 @contextmanager
-def db_read():
+def db_read(tuples=False):
     """
     Read-only context: autocommit=True skips PostgreSQL's transaction
     overhead entirely — fastest possible for SELECT-only routes.
+    tuples=True makes conn.cursor() return plain tuple rows (see rows_json).
     """
     pool = _get_pool()
     conn = pool.getconn()
     old_autocommit = conn.autocommit
     try:
         conn.autocommit = True
+        if tuples:
+            conn.cursor_factory = psycopg2.extensions.cursor
+        if getattr(_profiling, 'active', None):
+            conn.cursor_factory = _timed_cursor(conn.cursor_factory)
         yield conn
     finally:
         conn.autocommit = old_autocommit
+        conn.cursor_factory = psycopg2.extras.RealDictCursor
         pool.putconn(conn)
 
 
+# ─────────────────────────────────────────────────────────────────
+# JSON
+# One provider for jsonify() and |tojson: Decimal → number, dates →
+# ISO 8601, RealDictRow/tuples serialized as they are. orjson when it is
+# installed, otherwise the stdlib encoder with the same rules.
+# ─────────────────────────────────────────────────────────────────
+class FastJSONProvider(DefaultJSONProvider):
+    sort_keys = False  # keep SELECT column order
+
+    @staticmethod
+    def default(o):
+        if isinstance(o, Decimal):
+            return float(o)
+        if hasattr(o, 'isoformat'):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            kwargs.setdefault('default', self.default)
+            kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+            kwargs.setdefault('sort_keys', self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+app.json = FastJSONProvider(app)
+
+
+def rows_json(c):
+    """
+    jsonify a tuple cursor's result (db_read(tuples=True)). ?compact=1 sends
+    {"columns": [...], "rows": [[...], ...]} with no per-row objects at all.
+    """
+    columns = [d[0] for d in c.description]
+    rows = c.fetchall()
+    if request.args.get('compact') == '1':
+        return jsonify({'columns': columns, 'rows': rows})
+    return jsonify([dict(zip(columns, r)) for r in rows])
+
+
 # ─────────────────────────────────────────────────────────────────
 # JINJA FILTERS
 # ─────────────────────────────────────────────────────────────────
@@ -99,15 +181,303 @@ def short_date_filter(value):
     return str(value)[:10]
 
 
+# ─────────────────────────────────────────────────────────────────
+# STATIC ASSETS
+# build_assets.py writes fingerprinted, precompressed copies to
+# static/dist plus a manifest; without one, plain /static files are used.
+# ─────────────────────────────────────────────────────────────────
+_ASSET_DIR = os.path.join(app.static_folder, 'dist')
+_ASSET_MAX_AGE = 31536000  # one year — filenames change when content does
+
+def _load_asset_manifest():
+    try:
+        with open(os.path.join(_ASSET_DIR, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+_asset_manifest = _load_asset_manifest()
+
+@app.template_global('asset')
+def asset(filename):
+    hashed = _asset_manifest.get(filename)
+    if hashed:
+        return url_for('static_dist', filename=hashed)
+    return url_for('static', filename=filename)
+
+@app.route('/static/dist/<path:filename>')
+def static_dist(filename):
+    mimetype = mimetypes.guess_type(filename)[0]
+    for encoding, ext in (('br', '.br'), ('gzip', '.gz')):
+        if encoding in request.accept_encodings and \
+                os.path.isfile(os.path.join(_ASSET_DIR, filename + ext)):
+            resp = send_from_directory(_ASSET_DIR, filename + ext, mimetype=mimetype,
+                                       max_age=_ASSET_MAX_AGE)
+            resp.headers['Content-Encoding'] = encoding
+            break
+    else:
+        resp = send_from_directory(_ASSET_DIR, filename, max_age=_ASSET_MAX_AGE)
+    resp.headers['Cache-Control'] = f'public, max-age={_ASSET_MAX_AGE}, immutable'
+    resp.headers['Vary'] = 'Accept-Encoding'
+    return resp
+
+
+# ─────────────────────────────────────────────────────────────────
+# RESPONSE COMPRESSION
+# HTML/JSON go out as br (when the brotli package is installed) or gzip.
+# Streamed pages are compressed chunk by chunk, flushed every ~8 KB so
+# the browser can start parsing before rendering finishes.
+# ─────────────────────────────────────────────────────────────────
+_COMPRESS_MIMETYPES = {'text/html', 'application/json'}
+_COMPRESS_MIN_SIZE = 500
+_STREAM_FLUSH_SIZE = 8192
+
+def _compressor(encoding):
+    """(compress, flush, finish) callables for one response body."""
+    if encoding == 'br':
+        c = brotli.Compressor(quality=5)
+        return c.process, c.flush, c.finish
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 → gzip container
+    return z.compress, lambda: z.flush(zlib.Z_SYNC_FLUSH), z.flush
+
+def _compress_stream(chunks, encoding):
+    compress, flush, finish = _compressor(encoding)
+    pending, size = [], 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        pending.append(chunk)
+        size += len(chunk)
+        if size >= _STREAM_FLUSH_SIZE:
+            yield compress(b''.join(pending)) + flush()
+            pending, size = [], 0
+    yield compress(b''.join(pending)) + finish()
+
+@app.after_request
+def compress_response(resp):
+    if resp.mimetype not in _COMPRESS_MIMETYPES or not 200 <= resp.status_code < 300 \
+            or resp.direct_passthrough or 'Content-Encoding' in resp.headers:
+        return resp
+    resp.vary.add('Accept-Encoding')
+    if brotli and 'br' in request.accept_encodings:
+        encoding = 'br'
+    elif 'gzip' in request.accept_encodings:
+        encoding = 'gzip'
+    else:
+        return resp
+
+    if resp.is_streamed:
+        resp.response = _compress_stream(resp.response, encoding)
+    else:
+        data = resp.get_data()
+        if len(data) < _COMPRESS_MIN_SIZE:
+            return resp
+        compress, _, finish = _compressor(encoding)
+        resp.set_data(compress(data) + finish())
+    resp.headers['Content-Encoding'] = encoding
+    return resp
+
+
+# ─────────────────────────────────────────────────────────────────
+# PROFILING
+# Opt-in sampling profiler. A request is profiled when PROFILE_SAMPLE_RATE
+# picks it, or when it carries PROFILE_TOKEN in an X-Profile header or a
+# ?_profile= parameter. A side thread samples the request thread's stack
+# every PROFILE_INTERVAL_MS; time inside cursor.execute() shows up as a
+# [postgres] leaf and is also timed exactly. Each profile is written as
+# collapsed stacks (flamegraph.pl / speedscope.app read them as-is) to
+# PROFILE_DIR/<endpoint>/ and listed at /admin/profiles?token=...
+# ─────────────────────────────────────────────────────────────────
+PROFILE_DIR         = os.environ.get('PROFILE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+PROFILE_INDEX       = os.path.join(PROFILE_DIR, 'index.jsonl')
+PROFILE_TOKEN       = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE') or 0)
+PROFILE_INTERVAL    = float(os.environ.get('PROFILE_INTERVAL_MS') or 5) / 1000
+PROFILE_KEEP        = 50   # newest files kept per endpoint
+_PROFILE_SKIP       = {None, 'static', 'static_dist', 'events', 'api_versions', 'ping', 'favicon',
+                       'list_profiles', 'profile_file'}
+
+_profiling = threading.local()
+_profile_index_lock = threading.Lock()
+_timed_cursors = {}
+
+
+def _timed_cursor(base):
+    """Subclass of a cursor class whose execute() is timed against the active profile."""
+    cls = _timed_cursors.get(base)
+    if cls is None:
+        def execute(self, query, vars=None):
+            prof = getattr(_profiling, 'active', None)
+            if prof is None:
+                return base.execute(self, query, vars)
+            prof.in_query = True
+            start = time.perf_counter()
+            try:
+                return base.execute(self, query, vars)
+            finally:
+                prof.db_seconds += time.perf_counter() - start
+                prof.queries += 1
+                prof.in_query = False
+        cls = _timed_cursors[base] = type('Timed' + base.__name__, (base,), {'execute': execute})
+    return cls
+
+
+class _Profile:
+    def __init__(self, endpoint, requested):
+        self.ident = threading.get_ident()
+        self.endpoint = endpoint
+        self.requested = requested
+        self.name = f"{endpoint}/{datetime.now():%Y%m%dT%H%M%S.%f}.folded"
+        self.stacks = {}
+        self.samples = 0
+        self.in_query = False
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.status = None
+        self._started = time.perf_counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(PROFILE_INTERVAL):
+            frame = sys._current_frames().get(self.ident)
+            if frame is None:
+                return
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.reverse()
+            if self.in_query:
+                stack.append('[postgres]')
+            key = ';'.join(stack)
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.wall_seconds = time.perf_counter() - self._started
+
+
+def _is_profile_admin(token):
+    return bool(PROFILE_TOKEN and token) and compare_digest(token, PROFILE_TOKEN)
+
+
+def _save_profile(prof):
+    path = os.path.join(PROFILE_DIR, prof.name)
+    folder = os.path.dirname(path)
+    os.makedirs(folder, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        for stack, count in sorted(prof.stacks.items()):
+            f.write(f"{stack} {count}\n")
+    entry = {
+        'file': prof.name, 'endpoint': prof.endpoint, 'method': request.method,
+        'path': request.path, 'status': prof.status, 'at': datetime.now().isoformat(timespec='seconds'),
+        'wall_ms': round(prof.wall_seconds * 1000, 1), 'db_ms': round(prof.db_seconds * 1000, 1),
+        'queries': prof.queries, 'samples': prof.samples, 'requested': prof.requested,
+    }
+    with _profile_index_lock:
+        with open(PROFILE_INDEX, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        # Timestamped names sort oldest first
+        files = sorted(n for n in os.listdir(folder) if n.endswith('.folded'))
+        for old in files[:-PROFILE_KEEP]:
+            os.remove(os.path.join(folder, old))
+
+
+@app.before_request
+def start_profile():
+    if request.endpoint in _PROFILE_SKIP:
+        return
+    requested = _is_profile_admin(request.headers.get('X-Profile') or request.args.get('_profile'))
+    if requested or (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        _profiling.active = _Profile(request.endpoint, requested)
+
+@app.after_request
+def tag_profile(resp):
+    prof = getattr(_profiling, 'active', None)
+    if prof is not None:
+        prof.status = resp.status_code
+        if prof.requested:
+            resp.headers['X-Profile'] = url_for('profile_file', name=prof.name, token=PROFILE_TOKEN)
+    return resp
+
+# Runs after streamed templates finish, so their rendering is in the profile
+@app.teardown_request
+def finish_profile(exc):
+    prof = getattr(_profiling, 'active', None)
+    if prof is None:
+        return
+    _profiling.active = None
+    prof.stop()
+    try:
+        _save_profile(prof)
+    except OSError as e:
+        print(f"Profile save error: {e}")
+
+
+def load_profile_index():
+    """Index entries whose file is still on disk, newest first."""
+    try:
+        with open(PROFILE_INDEX, encoding='utf-8') as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+    return [e for e in reversed(entries) if os.path.isfile(os.path.join(PROFILE_DIR, e['file']))]
+
+
+@app.route('/admin/profiles')
+def list_profiles():
+    token = request.args.get('token')
+    if not _is_profile_admin(token):
+        return "Not found", 404
+    entries = load_profile_index()
+    by_endpoint = {}
+    for e in entries:
+        by_endpoint.setdefault(e['endpoint'], []).append(e)
+    routes = [{
+        'endpoint': endpoint,
+        'count':    len(rows),
+        'p50_ms':   round(statistics.median(r['wall_ms'] for r in rows), 1),
+        'max_ms':   max(r['wall_ms'] for r in rows),
+        'db_p50_ms': round(statistics.median(r['db_ms'] for r in rows), 1),
+        'latest_ms': rows[0]['wall_ms'],
+    } for endpoint, rows in by_endpoint.items()]
+    routes.sort(key=lambda r: r['p50_ms'], reverse=True)
+    route = request.args.get('route')
+    if route:
+        entries = by_endpoint.get(route, [])
+    return render_template('profiles.html', routes=routes, profiles=entries[:200],
+                           route=route, token=token, sample_rate=PROFILE_SAMPLE_RATE)
+
+@app.route('/admin/profiles/<path:name>')
+def profile_file(name):
+    if not _is_profile_admin(request.args.get('token')) or not name.endswith('.folded'):
+        return "Not found", 404
+    return send_from_directory(PROFILE_DIR, name, mimetype='text/plain', as_attachment=True,
+                               download_name=name.replace('/', '-'))
+
+
 # ─────────────────────────────────────────────────────────────────
 # INIT DB
 # ─────────────────────────────────────────────────────────────────
 def init_db():
     with db() as conn:
         c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS items (
+        # Every sale, expense and catalog item belongs to one store; the
+        # first store (DEFAULT_STORE_ID) owns everything from before stores.
+        c.execute('''CREATE TABLE IF NOT EXISTS stores (
                         id SERIAL PRIMARY KEY,
                         name VARCHAR(255) NOT NULL UNIQUE,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        c.execute("INSERT INTO stores (name) SELECT 'Main' WHERE NOT EXISTS (SELECT 1 FROM stores)")
+        c.execute('''CREATE TABLE IF NOT EXISTS items (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
                         price DECIMAL(10,2) NOT NULL,
                         active BOOLEAN DEFAULT TRUE,
                         sort_order INTEGER DEFAULT 0
@@ -129,6 +499,75 @@ def init_db():
                         price DECIMAL(10,2),
                         subtotal DECIMAL(10,2)
                     )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS stock_movements (
+                        id SERIAL PRIMARY KEY,
+                        item_id INTEGER NOT NULL REFERENCES items(id) ON DELETE CASCADE,
+                        qty_change INTEGER NOT NULL,
+                        reason VARCHAR(32) NOT NULL,
+                        sale_id INTEGER,
+                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS table_versions (
+                        name VARCHAR(32) PRIMARY KEY,
+                        version BIGINT NOT NULL DEFAULT 0
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS period_snapshots (
+                        month DATE PRIMARY KEY,
+                        revenue DECIMAL(12,2) NOT NULL,
+                        expenses DECIMAL(12,2) NOT NULL,
+                        profit DECIMAL(12,2) NOT NULL,
+                        transactions INTEGER NOT NULL,
+                        item_mix JSONB NOT NULL DEFAULT '[]',
+                        revision INTEGER NOT NULL DEFAULT 1,
+                        closed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        # Per-day rollups of rows moved out by archive_transactions.py, so
+        # aggregates over archived months still add up. kind is one of
+        # 'sales', 'customer', 'item', 'expense'; key is the customer id,
+        # item name or category ('' for 'sales').
+        c.execute('''CREATE TABLE IF NOT EXISTS archived_totals (
+                        day DATE NOT NULL,
+                        kind VARCHAR(16) NOT NULL,
+                        key VARCHAR(255) NOT NULL DEFAULT '',
+                        quantity INTEGER NOT NULL DEFAULT 0,
+                        amount DECIMAL(12,2) NOT NULL DEFAULT 0,
+                        txns INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (kind, day, key)
+                    )''')
+        # Co-purchase counters behind /api/analytics/baskets: baskets is the
+        # number of sales containing both items (item_a <= item_b). The
+        # diagonal (item_a = item_b) counts sales with that item. Maintained
+        # by count_baskets(); the total comes from sales (see api_baskets).
+        c.execute('''CREATE TABLE IF NOT EXISTS item_pairs (
+                        item_a VARCHAR(255) NOT NULL,
+                        item_b VARCHAR(255) NOT NULL,
+                        baskets INTEGER NOT NULL DEFAULT 0,
+                        PRIMARY KEY (item_a, item_b)
+                    )''')
+        # Append-only change log behind /api/changes, filled by the
+        # log_change() triggers created at the end of init_db.
+        c.execute('''CREATE TABLE IF NOT EXISTS changes (
+                        id BIGSERIAL PRIMARY KEY,
+                        txid BIGINT NOT NULL DEFAULT txid_current(),
+                        table_name VARCHAR(32) NOT NULL,
+                        op CHAR(1) NOT NULL,
+                        row_id INTEGER NOT NULL,
+                        data JSONB,
+                        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                    )''')
+        c.execute('''CREATE TABLE IF NOT EXISTS customers (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        lifetime_revenue DECIMAL(12,2) NOT NULL DEFAULT 0,
+                        visit_count INTEGER NOT NULL DEFAULT 0,
+                        last_visit DATE
+                    )''')
+        # Expense categories, unique case-insensitively; expenses.category
+        # keeps the canonical name for display and search.
+        c.execute('''CREATE TABLE IF NOT EXISTS expense_categories (
+                        id SERIAL PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL
+                    )''')
         c.execute('''CREATE TABLE IF NOT EXISTS expenses (
                         id SERIAL PRIMARY KEY,
                         description TEXT NOT NULL,
@@ -155,11 +594,190 @@ def init_db():
                            WHERE table_name='sales' AND column_name='receipt_no')
             THEN ALTER TABLE sales ADD COLUMN receipt_no INTEGER; END IF;
         END $$;""")
+        c.execute("""DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='sales' AND column_name='customer_id')
+            THEN ALTER TABLE sales ADD COLUMN customer_id INTEGER REFERENCES customers(id); END IF;
+        END $$;""")
+        c.execute("""DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='items' AND column_name='on_hand')
+            THEN ALTER TABLE items ADD COLUMN on_hand INTEGER NOT NULL DEFAULT 0,
+                                   ADD COLUMN reorder_level INTEGER NOT NULL DEFAULT 0; END IF;
+        END $$;""")
+        c.execute("""DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='sale_items' AND column_name='sale_date')
+            THEN ALTER TABLE sale_items ADD COLUMN sale_date DATE; END IF;
+        END $$;""")
+        c.execute("""DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='sales' AND column_name='version')
+            THEN ALTER TABLE sales ADD COLUMN version INTEGER NOT NULL DEFAULT 1; END IF;
+        END $$;""")
+        c.execute("""DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='expenses' AND column_name='category_id')
+            THEN ALTER TABLE expenses ADD COLUMN category_id INTEGER REFERENCES expense_categories(id); END IF;
+        END $$;""")
+        # Existing rows land in the default store; a constant default is
+        # added without rewriting the table.
+        c.execute("""DO $$ DECLARE t text; BEGIN
+            FOREACH t IN ARRAY ARRAY['items', 'sales', 'sale_items', 'expenses'] LOOP
+                IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                               WHERE table_name = t AND column_name = 'store_id') THEN
+                    EXECUTE format('ALTER TABLE %I ADD COLUMN store_id INTEGER NOT NULL DEFAULT 1
+                                    REFERENCES stores(id)', t);
+                END IF;
+            END LOOP;
+        END $$;""")
+        # Rollups are kept per store; cross-store figures are sums of them
+        c.execute("""DO $$ BEGIN
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='period_snapshots' AND column_name='store_id') THEN
+                ALTER TABLE period_snapshots ADD COLUMN store_id INTEGER NOT NULL DEFAULT 1 REFERENCES stores(id),
+                    DROP CONSTRAINT period_snapshots_pkey, ADD PRIMARY KEY (store_id, month);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='archived_totals' AND column_name='store_id') THEN
+                ALTER TABLE archived_totals ADD COLUMN store_id INTEGER NOT NULL DEFAULT 1 REFERENCES stores(id),
+                    DROP CONSTRAINT archived_totals_pkey, ADD PRIMARY KEY (store_id, kind, day, key);
+            END IF;
+            IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                           WHERE table_name='item_pairs' AND column_name='store_id') THEN
+                ALTER TABLE item_pairs ADD COLUMN store_id INTEGER NOT NULL DEFAULT 1 REFERENCES stores(id),
+                    DROP CONSTRAINT item_pairs_pkey, ADD PRIMARY KEY (store_id, item_a, item_b);
+            END IF;
+        END $$;""")
+        # Item names are unique within a store
+        c.execute("ALTER TABLE items DROP CONSTRAINT IF EXISTS items_name_key")
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_items_store_name ON items(store_id, name)")
+        # Versions are per store now (see bump_versions)
+        c.execute("DELETE FROM table_versions WHERE name NOT LIKE '%@%'")
+        # The per-store ('', '') sales counter is gone: every checkout queued on it
+        c.execute("DELETE FROM item_pairs WHERE item_a = '' AND item_b = ''")
         # Backfill receipt_no for existing sales
         c.execute("UPDATE sales SET receipt_no = id WHERE receipt_no IS NULL")
+        # Receipt numbers come from a sequence: MAX(receipt_no) + 1 handed the
+        # same number to concurrent checkouts and started over once every
+        # live sale was archived. It starts past both the live numbers and
+        # every sale id ever issued, which covers archived sales.
+        c.execute("""DO $$ DECLARE n bigint; BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_class WHERE relname = 'sales_receipt_no_seq') THEN
+                CREATE SEQUENCE sales_receipt_no_seq;
+                n := GREATEST((SELECT COALESCE(MAX(receipt_no), 0) FROM sales),
+                              (SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM sales_id_seq));
+                PERFORM setval('sales_receipt_no_seq', GREATEST(n, 1), n > 0);
+            END IF;
+        END $$;""")
+        c.execute("ALTER TABLE sales ALTER COLUMN receipt_no SET DEFAULT nextval('sales_receipt_no_seq')")
 
         c.execute("UPDATE items SET sort_order=id WHERE sort_order=0")
 
+        # sale_items carries its sale's date so it can be range-partitioned
+        # alongside sales (see partition_tables.py)
+        c.execute("""UPDATE sale_items si SET sale_date = s.date FROM sales s
+                     WHERE si.sale_id = s.id AND si.sale_date IS NULL""")
+
+        # Every report filters or buckets by date within one store, so the
+        # store leads: a store's range scan never reads another store's rows
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sales_store_date ON sales(store_id, date)")
+        c.execute("DROP INDEX IF EXISTS idx_sales_date")
+        # (store_id, date, id) doubles as the keyset-pagination index for /expenses
+        c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_store_date_id ON expenses(store_id, date, id)")
+        c.execute("DROP INDEX IF EXISTS idx_expenses_date_id")
+        c.execute("DROP INDEX IF EXISTS idx_expenses_date")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_store_date ON sale_items(store_id, sale_date)")
+        # Deleting an item's sales finds its lines by name
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_store_item ON sale_items(store_id, item_name)")
+
+        # Customers are unique case-insensitively; text_pattern_ops lets the same
+        # index serve prefix LIKE lookups for autocomplete.
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_customers_name_lower ON customers (lower(name) text_pattern_ops)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sales_customer_date ON sales(customer_id, date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_stock_movements_item ON stock_movements(item_id, created_at)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_sale_items_sale ON sale_items(sale_id, sale_date)")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_changes_txid ON changes(txid, id)")
+        c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_expense_categories_name_lower ON expense_categories (lower(name))")
+        c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_store_category_date ON expenses(store_id, category_id, date)")
+        c.execute("DROP INDEX IF EXISTS idx_expenses_category_date")
+        # snapshot_months groups by month; without statistics on the expression
+        # the planner guesses 200 groups however narrow the date range
+        c.execute("CREATE STATISTICS IF NOT EXISTS sales_month_stats ON ((date_trunc('month', date::timestamp)::date)) FROM sales")
+        c.execute("CREATE STATISTICS IF NOT EXISTS expenses_month_stats ON ((date_trunc('month', date::timestamp)::date)) FROM expenses")
+
+        # Backfill customers from sales not linked yet (no-op once linked)
+        c.execute("""INSERT INTO customers (name, lifetime_revenue, visit_count, last_visit)
+                     SELECT MIN(trim(customer_name)), SUM(total), COUNT(*), MAX(date)
+                     FROM sales WHERE customer_id IS NULL
+                     GROUP BY lower(trim(customer_name))
+                     ON CONFLICT ((lower(name))) DO UPDATE SET
+                         lifetime_revenue = customers.lifetime_revenue + EXCLUDED.lifetime_revenue,
+                         visit_count      = customers.visit_count + EXCLUDED.visit_count,
+                         last_visit       = GREATEST(customers.last_visit, EXCLUDED.last_visit)""")
+        c.execute("""UPDATE sales s SET customer_id = cu.id FROM customers cu
+                     WHERE s.customer_id IS NULL AND lower(trim(s.customer_name)) = lower(cu.name)""")
+
+        # Backfill expense categories (no-op once linked). Case and whitespace
+        # variants merge into one category named after the most used spelling;
+        # archived rollups are keyed by name, so their variants merge too.
+        c.execute("""INSERT INTO expense_categories (name)
+                     SELECT mode() WITHIN GROUP (ORDER BY name) FROM (
+                         SELECT regexp_replace(trim(category), '\\s+', ' ', 'g') AS name
+                         FROM expenses WHERE category_id IS NULL
+                         UNION ALL
+                         SELECT regexp_replace(trim(key), '\\s+', ' ', 'g')
+                         FROM archived_totals WHERE kind = 'expense') x
+                     GROUP BY lower(name)
+                     ON CONFLICT ((lower(name))) DO NOTHING""")
+        c.execute("""UPDATE expenses e SET category_id = ec.id, category = ec.name FROM expense_categories ec
+                     WHERE e.category_id IS NULL
+                       AND lower(regexp_replace(trim(e.category), '\\s+', ' ', 'g')) = lower(ec.name)""")
+        c.execute("""WITH moved AS (DELETE FROM archived_totals a USING expense_categories ec
+                                    WHERE a.kind = 'expense' AND a.key <> ec.name
+                                      AND lower(regexp_replace(trim(a.key), '\\s+', ' ', 'g')) = lower(ec.name)
+                                    RETURNING a.store_id, a.day, ec.name, a.quantity, a.amount, a.txns)
+                     INSERT INTO archived_totals (store_id, day, kind, key, quantity, amount, txns)
+                     SELECT store_id, day, 'expense', name, SUM(quantity), SUM(amount), SUM(txns)
+                     FROM moved GROUP BY store_id, day, name
+                     ON CONFLICT (store_id, kind, day, key) DO UPDATE SET
+                         quantity = archived_totals.quantity + EXCLUDED.quantity,
+                         amount   = archived_totals.amount + EXCLUDED.amount,
+                         txns     = archived_totals.txns + EXCLUDED.txns""")
+
+        # Change log triggers, created after the backfills above so those
+        # don't flood the feed. The logical table name is passed in because
+        # on partitioned tables TG_TABLE_NAME is the partition.
+        # SET LOCAL microfauna.skip_changes = 'on' mutes them for a transaction.
+        c.execute("""CREATE OR REPLACE FUNCTION log_change() RETURNS trigger AS $$
+            BEGIN
+                IF current_setting('microfauna.skip_changes', true) = 'on' THEN
+                    RETURN NULL;
+                ELSIF TG_OP = 'DELETE' THEN
+                    INSERT INTO changes (table_name, op, row_id) VALUES (TG_ARGV[0], 'D', OLD.id);
+                ELSIF TG_OP = 'INSERT' OR NEW IS DISTINCT FROM OLD THEN
+                    INSERT INTO changes (table_name, op, row_id, data)
+                    VALUES (TG_ARGV[0], left(TG_OP, 1), NEW.id, to_jsonb(NEW));
+                END IF;
+                RETURN NULL;
+            END $$ LANGUAGE plpgsql""")
+        c.execute("""DO $$ DECLARE t text; BEGIN
+            FOREACH t IN ARRAY ARRAY['sales', 'sale_items', 'items', 'expenses'] LOOP
+                IF NOT EXISTS (SELECT 1 FROM pg_trigger
+                               WHERE tgname = 'log_changes' AND tgrelid = t::regclass) THEN
+                    EXECUTE format('CREATE TRIGGER log_changes AFTER INSERT OR UPDATE OR DELETE ON %I
+                                    FOR EACH ROW EXECUTE FUNCTION log_change(%L)', t, t);
+                END IF;
+            END LOOP;
+        END $$;""")
+
+        c.execute("SAVEPOINT partitions")
+        try:
+            ensure_partitions(c)
+        except psycopg2.Error as e:
+            c.execute("ROLLBACK TO SAVEPOINT partitions")
+            print(f"WARNING: could not create partitions: {e}")
+
         c.execute("SELECT COUNT(*) as cnt FROM items")
         if c.fetchone()['cnt'] == 0:
             for i, (name, price) in enumerate([
@@ -170,6 +788,167 @@ def init_db():
                     (name, price, i)
                 )
 
+# ─────────────────────────────────────────────────────────────────
+# PARTITIONS
+# Opt-in: partition_tables.py converts these tables to monthly range
+# partitions. Until then ensure_partitions() is a no-op.
+# ─────────────────────────────────────────────────────────────────
+PARTITIONED_TABLES = ('sales', 'sale_items', 'expenses')
+PARTITION_KEYS = {'sales': 'date', 'sale_items': 'sale_date', 'expenses': 'date'}
+PARTITION_MONTHS_AHEAD = 3
+
+def _month_range(start, end):
+    """First-of-month dates from start's month through end's month."""
+    month = start.replace(day=1)
+    while month <= end:
+        yield month
+        month = (month + timedelta(days=32)).replace(day=1)
+
+def _take_default_rows(c, tables, month, nxt):
+    """
+    Move the rows of [month, nxt) out of the tables into temp tables and
+    return the tables to put back, parents first. Rows that landed in a
+    DEFAULT partition block CREATE TABLE ... PARTITION OF for their month;
+    detaching the default instead fails while sale_items references it.
+    Taking sales also takes its sale_items, which the FK would cascade away.
+    """
+    if 'sales' in tables:
+        tables = set(tables) | {'sale_items'}
+    # Not a business change: keep the delete and re-insert out of the feed
+    c.execute("SET LOCAL microfauna.skip_changes = 'on'")
+    taken = []
+    for table in ('sale_items', 'sales', 'expenses'):
+        if table not in tables:
+            continue
+        key = PARTITION_KEYS[table]
+        c.execute(f"CREATE TEMP TABLE moved_{table} (LIKE {table}) ON COMMIT DROP")
+        c.execute(f"""WITH d AS (DELETE FROM {table} WHERE {key} >= %s AND {key} < %s RETURNING *)
+                      INSERT INTO moved_{table} SELECT * FROM d""", (month, nxt))
+        taken.insert(0, table)
+    return taken
+
+def ensure_partitions(c, start=None, end=None):
+    """
+    Create any missing monthly partitions from `start` (default: this month)
+    through PARTITION_MONTHS_AHEAD months ahead (or `end`, if that's later),
+    so new rows never land in
+    the default partition. Rows that already sit in a default partition
+    for one of those months are moved into its new partition. Only tables
+    that are already partitioned count.
+    """
+    c.execute("""SELECT cl.relname FROM pg_partitioned_table pt
+                 JOIN pg_class cl ON cl.oid = pt.partrelid
+                 WHERE cl.relname = ANY(%s)""", (list(PARTITIONED_TABLES),))
+    tables = [r['relname'] for r in c.fetchall()]
+    if not tables:
+        return []
+
+    today = datetime.now().date()
+    ahead = today.replace(day=1) + timedelta(days=31 * PARTITION_MONTHS_AHEAD)
+    if end and end > ahead:
+        ahead = end
+    wanted = [(t, m) for m in _month_range(start or today, ahead) for t in tables]
+    c.execute("SELECT relname FROM pg_class WHERE relname = ANY(%s)",
+              ([f"{t}_{m:%Y%m}" for t, m in wanted] + [f"{t}_default" for t in tables],))
+    existing = {r['relname'] for r in c.fetchall()}
+
+    created = []
+    for month in sorted({m for _, m in wanted}):
+        missing = [t for t, m in wanted if m == month and f"{t}_{month:%Y%m}" not in existing]
+        if not missing:
+            continue
+        nxt = (month + timedelta(days=32)).replace(day=1)
+        blocked = []
+        for table in missing:
+            if f"{table}_default" in existing:
+                key = PARTITION_KEYS[table]
+                c.execute(f"SELECT 1 FROM {table}_default WHERE {key} >= %s AND {key} < %s LIMIT 1",
+                          (month, nxt))
+                if c.fetchone():
+                    blocked.append(table)
+        taken = _take_default_rows(c, blocked, month, nxt) if blocked else []
+        for table in missing:
+            name = f"{table}_{month:%Y%m}"
+            c.execute(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)",
+                      (month, nxt))
+            created.append(name)
+        for table in taken:
+            c.execute(f"INSERT INTO {table} SELECT * FROM moved_{table}")
+            c.execute(f"DROP TABLE moved_{table}")
+        if taken:
+            c.execute("SET LOCAL microfauna.skip_changes = 'off'")
+    return created
+
+
+# ─────────────────────────────────────────────────────────────────
+# ARCHIVE
+# archive_transactions.py moves closed months out of sales, sale_items and
+# expenses into compressed files under ARCHIVE_DIR (gzip CSV, or Parquet
+# when pyarrow is installed) and leaves archived_totals rows behind.
+# These readers pull the rows back for receipts and exports.
+# ─────────────────────────────────────────────────────────────────
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive')
+ARCHIVE_MANIFEST = os.path.join(ARCHIVE_DIR, 'manifest.json')
+ARCHIVED_TABLES = ('sales', 'sale_items', 'expenses')
+
+def load_archive_manifest():
+    try:
+        with open(ARCHIVE_MANIFEST, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'batches': []}
+
+def _read_archive_file(name):
+    path = os.path.join(ARCHIVE_DIR, name)
+    if name.endswith('.parquet'):
+        # Imported here: pyarrow is optional and slow to import on cold start
+        import pyarrow.parquet as pq
+        yield from pq.read_table(path).to_pylist()
+        return
+    with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            yield {k: (v if v != '' else None) for k, v in row.items()}
+
+def read_archive(table, start=None, end=None):
+    """Archived rows of `table` for months start..end ('YYYY-MM', inclusive)."""
+    for batch in load_archive_manifest()['batches']:
+        if (start and batch['month'] < start) or (end and batch['month'] > end):
+            continue
+        entry = batch['tables'].get(table)
+        if entry and entry['rows']:
+            yield from _read_archive_file(entry['file'])
+
+_ARCHIVE_INT_COLUMNS = ('id', 'sale_id', 'customer_id', 'receipt_no', 'quantity', 'version', 'store_id')
+_ARCHIVE_MONEY_COLUMNS = ('total', 'discount', 'price', 'subtotal', 'amount')
+
+def _typed_archive_row(row):
+    """CSV archives come back as text; restore the numeric columns (Parquet keeps its types)."""
+    out = dict(row)
+    for k, v in row.items():
+        if isinstance(v, str):
+            if k in _ARCHIVE_INT_COLUMNS:
+                out[k] = int(v)
+            elif k in _ARCHIVE_MONEY_COLUMNS:
+                out[k] = Decimal(v)
+    return out
+
+def archived_sale(sale_id):
+    """(sale, items) for an archived sale, or None. Only opens the batch whose id range covers it."""
+    for batch in load_archive_manifest()['batches']:
+        entry = batch['tables'].get('sales')
+        if not entry or not entry['rows'] or not entry['min_id'] <= sale_id <= entry['max_id']:
+            continue
+        sale = next((r for r in _read_archive_file(entry['file']) if int(r['id']) == sale_id), None)
+        if not sale:
+            continue
+        items_entry = batch['tables'].get('sale_items')
+        items = [r for r in _read_archive_file(items_entry['file'])
+                 if int(r['sale_id']) == sale_id] if items_entry and items_entry['rows'] else []
+        items.sort(key=lambda r: int(r['id']))
+        return _typed_archive_row(sale), [_typed_archive_row(r) for r in items]
+    return None
+
+
 try:
     init_db()
     print("DB initialized.")
@@ -180,11 +959,327 @@ except Exception as e:
 # ─────────────────────────────────────────────────────────────────
 # HELPERS
 # ─────────────────────────────────────────────────────────────────
-def get_active_items():
-    with db_read() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM items WHERE active=TRUE ORDER BY sort_order ASC, id ASC")
-        return [dict(r) for r in c.fetchall()]
+DEFAULT_STORE_ID = 1
+
+def current_store():
+    """Store id for this request: ?store=, else the store cookie, else the default store."""
+    try:
+        return int(request.args.get('store') or request.cookies.get('store') or DEFAULT_STORE_ID)
+    except ValueError:
+        return DEFAULT_STORE_ID
+
+
+def get_active_items(store_id, c=None):
+    """A store's active catalog in display order; pass a cursor to reuse its connection."""
+    if c is None:
+        with db_read() as conn:
+            return get_active_items(store_id, conn.cursor())
+    c.execute("SELECT * FROM items WHERE store_id=%s AND active=TRUE ORDER BY sort_order ASC, id ASC",
+              (store_id,))
+    return [dict(r) for r in c.fetchall()]
+
+
+def record_customer_visit(c, name, total, sale_date):
+    """
+    Upsert the customer for a new sale and bump its lifetime aggregates
+    in the same statement. Returns the customer id.
+    """
+    c.execute("""INSERT INTO customers (name, lifetime_revenue, visit_count, last_visit)
+                 VALUES (%s, %s, 1, %s)
+                 ON CONFLICT ((lower(name))) DO UPDATE SET
+                     lifetime_revenue = customers.lifetime_revenue + EXCLUDED.lifetime_revenue,
+                     visit_count      = customers.visit_count + 1,
+                     last_visit       = GREATEST(customers.last_visit, EXCLUDED.last_visit)
+                 RETURNING id""", (name, total, sale_date))
+    return c.fetchone()['id']
+
+
+def record_customer_visits(c, visits):
+    """
+    record_customer_visit for many (name, total, sale_date) visits in one
+    statement. Visits are folded per customer first — an upsert can't touch
+    the same row twice. Returns {lower(name): customer id}.
+    """
+    folded = {}
+    for name, total, sale_date in visits:
+        first, revenue, count, last = folded.get(name.lower(), (name, 0, 0, str(sale_date)))
+        folded[name.lower()] = (first, revenue + total, count + 1, max(last, str(sale_date)))
+    rows = psycopg2.extras.execute_values(
+        c,
+        """INSERT INTO customers (name, lifetime_revenue, visit_count, last_visit) VALUES %s
+           ON CONFLICT ((lower(name))) DO UPDATE SET
+               lifetime_revenue = customers.lifetime_revenue + EXCLUDED.lifetime_revenue,
+               visit_count      = customers.visit_count + EXCLUDED.visit_count,
+               last_visit       = GREATEST(customers.last_visit, EXCLUDED.last_visit)
+           RETURNING id, lower(name) AS key""",
+        list(folded.values()),
+        template="(%s, %s, %s, %s::date)", page_size=len(folded), fetch=True
+    )
+    return {r['key']: r['id'] for r in rows}
+
+
+def get_customer_id(c, name):
+    """Id for a customer name, creating an empty customer row if needed."""
+    c.execute("""INSERT INTO customers (name) VALUES (%s)
+                 ON CONFLICT ((lower(name))) DO UPDATE SET name = customers.name
+                 RETURNING id""", (name,))
+    return c.fetchone()['id']
+
+
+def normalize_category(name):
+    """Collapse whitespace the way init_db's category merge does."""
+    return ' '.join(name.split())
+
+
+def get_expense_category(c, name):
+    """(id, name) of the expense category matching name case-insensitively, created if needed."""
+    name = normalize_category(name)
+    if not name:
+        raise ValueError('Category is required')
+    c.execute("""INSERT INTO expense_categories (name) VALUES (%s)
+                 ON CONFLICT ((lower(name))) DO UPDATE SET name = expense_categories.name
+                 RETURNING id, name""", (name,))
+    return c.fetchone()
+
+
+def refresh_customers(c, customer_ids):
+    """
+    Recompute lifetime aggregates for the given customers from their sales
+    plus any archived_totals stubs. Used after edits/deletes, where a running
+    total can't be decremented safely (last_visit). Each customer is an
+    idx_sales_customer_date lookup.
+    """
+    customer_ids = [cid for cid in set(customer_ids) if cid is not None]
+    if not customer_ids:
+        return
+    c.execute("""UPDATE customers cu
+                 SET lifetime_revenue = a.revenue, visit_count = a.visits, last_visit = a.last_visit
+                 FROM (SELECT cu2.id, COALESCE(SUM(v.amount),0) AS revenue,
+                              COALESCE(SUM(v.txns),0) AS visits, MAX(v.day) AS last_visit
+                       FROM customers cu2
+                       LEFT JOIN (SELECT customer_id, total AS amount, 1 AS txns, date AS day FROM sales
+                                  WHERE customer_id = ANY(%(ids)s)
+                                  UNION ALL
+                                  SELECT key::int, amount, txns, day FROM archived_totals
+                                  WHERE kind = 'customer' AND key = ANY(%(keys)s)) v
+                              ON v.customer_id = cu2.id
+                       WHERE cu2.id = ANY(%(ids)s) GROUP BY cu2.id) a
+                 WHERE cu.id = a.id""",
+              {'ids': customer_ids, 'keys': [str(cid) for cid in customer_ids]})
+
+
+def recompute_sale_totals(c, sale_ids, only_drifted=False, delete_empty=True):
+    """
+    Set sales.total = max(0, SUM(sale_items.subtotal) - discount) for the
+    given sales in one statement, bumping their version. only_drifted skips
+    sales whose stored total already matches; delete_empty removes sales
+    left without line items. Returns the touched rows (action 'updated' or
+    'deleted', id, customer_id, date, old_total, total) for the caller's
+    refresh_customers / reclose_periods.
+    """
+    sale_ids = sorted(set(sale_ids))
+    if not sale_ids:
+        return []
+    c.execute("""
+        WITH t AS (SELECT s.id, s.total AS old_total, COUNT(si.id) AS lines,
+                          GREATEST(0, COALESCE(SUM(si.subtotal), 0) - COALESCE(s.discount, 0)) AS total
+                   FROM sales s LEFT JOIN sale_items si ON si.sale_id = s.id
+                   WHERE s.id = ANY(%(ids)s) GROUP BY s.id),
+             gone AS (DELETE FROM sales s USING t
+                      WHERE s.id = t.id AND t.lines = 0 AND %(delete_empty)s
+                      RETURNING s.id, s.customer_id, s.date, t.old_total, NULL::numeric AS total),
+             fixed AS (UPDATE sales s SET total = t.total, version = s.version + 1 FROM t
+                       WHERE s.id = t.id AND t.lines > 0
+                         AND (NOT %(only_drifted)s OR s.total IS DISTINCT FROM t.total)
+                       RETURNING s.id, s.customer_id, s.date, t.old_total, t.total)
+        SELECT 'deleted' AS action, * FROM gone
+        UNION ALL
+        SELECT 'updated', * FROM fixed""",
+        {'ids': sale_ids, 'only_drifted': only_drifted, 'delete_empty': delete_empty})
+    return c.fetchall()
+
+
+def count_baskets(c, store_id, removed=(), added=()):
+    """
+    Move a store's item_pairs counters for sales whose set of items changed:
+    each basket (an iterable of item names) in `removed` is subtracted and
+    each in `added` counted, as one upsert. Work is per basket, never per
+    sale in the table. Rows are written in key order, like adjust_stock.
+    Only the pairs in the baskets are touched, so checkouts without an item
+    in common never wait on each other here.
+    """
+    delta = {}
+    for sign, baskets in ((-1, removed), (1, added)):
+        for names in baskets:
+            names = sorted({n for n in names if n})
+            if not names:
+                continue
+            for pair in [(a, b) for i, a in enumerate(names) for b in names[i:]]:
+                delta[pair] = delta.get(pair, 0) + sign
+    rows = sorted((store_id, a, b, n) for (a, b), n in delta.items() if n)
+    if not rows:
+        return
+    psycopg2.extras.execute_values(
+        c,
+        """INSERT INTO item_pairs (store_id, item_a, item_b, baskets) VALUES %s
+           ON CONFLICT (store_id, item_a, item_b) DO UPDATE SET baskets = item_pairs.baskets + EXCLUDED.baskets""",
+        rows, page_size=len(rows)
+    )
+
+
+def adjust_stock(c, store_id, deltas, reason, sale_id=None):
+    """
+    Apply {item_name: qty_change} to a store's items.on_hand and append the matching
+    stock_movements rows — one statement regardless of how many items.
+    Rows are locked in id order so concurrent checkouts touching the same
+    items queue up instead of deadlocking; call it together with
+    count_baskets just before bump_versions, so the locks are held only
+    until commit. Names no longer in the catalog (renamed items) are skipped.
+    Returns [{'name', 'on_hand'}] for items this change took below zero;
+    the write still goes through, the caller decides how to warn.
+    """
+    return adjust_stock_many(c, store_id, [(name, qty, sale_id) for name, qty in deltas.items()], reason)
+
+
+def adjust_stock_many(c, store_id, movements, reason):
+    """
+    adjust_stock for (item_name, qty_change, sale_id) rows that may span
+    several sales, so an item can appear more than once: one movement row
+    each, and on_hand moves by their sum. Still a single statement, and
+    returns the items that went below zero the same way.
+    """
+    rows = sorted((store_id, name, qty, reason, sale_id) for name, qty, sale_id in movements if qty)
+    if not rows:
+        return []
+    return psycopg2.extras.execute_values(
+        c,
+        """WITH d(store_id, name, delta, reason, sale_id) AS (VALUES %s),
+                locked AS (SELECT id, name FROM items
+                           WHERE (store_id, name) IN (SELECT store_id, name FROM d)
+                           ORDER BY id FOR UPDATE),
+                moved AS (INSERT INTO stock_movements (item_id, qty_change, reason, sale_id)
+                          SELECT l.id, d.delta, d.reason, d.sale_id FROM locked l JOIN d ON d.name = l.name),
+                moved_stock AS (UPDATE items SET on_hand = items.on_hand + t.delta
+                                FROM (SELECT l.id, SUM(d.delta) AS delta FROM locked l JOIN d ON d.name = l.name
+                                      GROUP BY l.id) t
+                                WHERE items.id = t.id
+                                RETURNING items.name, items.on_hand, t.delta)
+           SELECT name, on_hand FROM moved_stock WHERE delta < 0 AND on_hand < 0 ORDER BY name""",
+        rows,
+        template="(%s::integer, %s, %s::integer, %s, %s::integer)", page_size=len(rows), fetch=True
+    )
+
+
+def bump_versions(c, *tables, store_id=None):
+    """
+    Mark tables as changed for one store's dashboard fragment cache (every
+    store when store_id is None) and NOTIFY the new versions to /events
+    listeners (delivered on commit, dropped on rollback). Versions are named
+    "<table>@<store id>", so a write in one store never invalidates another
+    store's cache. Call it as the last statement of the write transaction:
+    the version rows stay locked only until commit, and readers never see a
+    version ahead of the data.
+    """
+    c.execute("""WITH v AS (INSERT INTO table_versions (name, version)
+                            SELECT t || '@' || s.id, 1 FROM unnest(%(tables)s::text[]) t, stores s
+                            WHERE %(store)s::integer IS NULL OR s.id = %(store)s
+                            ORDER BY 1
+                            ON CONFLICT (name) DO UPDATE SET version = table_versions.version + 1
+                            RETURNING name, version)
+                 SELECT pg_notify(%(channel)s, json_object_agg(name, version)::text) FROM v""",
+              {'tables': sorted(tables), 'store': store_id, 'channel': NOTIFY_CHANNEL})
+
+
+def store_versions(c, store_id):
+    """{table: version} for one store, as bump_versions names them."""
+    c.execute("SELECT name, version FROM table_versions WHERE name LIKE %s", (f'%@{store_id}',))
+    return {r['name'].rsplit('@', 1)[0]: r['version'] for r in c.fetchall()}
+
+
+def snapshot_months(c, months, store_id=None):
+    """
+    Write (or rewrite) the P&L snapshot of each month — first-of-month
+    dates — for one store, or for every store when store_id is None, from
+    the live tables plus archived_totals, in one statement. Rewrites bump
+    revision. The date bounds go in as literals rather than being derived
+    in the statement, so the planner can estimate the range scans.
+    """
+    if not months:
+        return
+    months = sorted(str(m)[:10] for m in months)
+    last = date.fromisoformat(months[-1])
+    hi = (last.replace(day=28) + timedelta(days=4)).replace(day=1)
+    c.execute("""
+        WITH m AS (SELECT st.id AS store_id, mo.month
+                   FROM (SELECT DISTINCT unnest(%(months)s::date[]) AS month) mo, stores st
+                   WHERE %(store)s::integer IS NULL OR st.id = %(store)s),
+             a AS (SELECT store_id, date_trunc('month', day::timestamp)::date AS month, kind, key,
+                          quantity, amount, txns
+                   FROM archived_totals
+                   WHERE kind IN ('sales', 'item', 'expense') AND day >= %(lo)s AND day < %(hi)s
+                     AND (%(store)s::integer IS NULL OR store_id = %(store)s)),
+             s AS (SELECT store_id, month, SUM(revenue) AS revenue, SUM(txns) AS txns
+                   FROM (SELECT store_id, date_trunc('month', date::timestamp)::date AS month,
+                                SUM(total) AS revenue, COUNT(*) AS txns
+                         FROM sales WHERE date >= %(lo)s AND date < %(hi)s
+                           AND (%(store)s::integer IS NULL OR store_id = %(store)s)
+                         GROUP BY 1, 2
+                         UNION ALL
+                         SELECT store_id, month, amount, txns FROM a WHERE kind = 'sales') x GROUP BY 1, 2),
+             e AS (SELECT store_id, month, SUM(amount) AS expenses
+                   FROM (SELECT store_id, date_trunc('month', date::timestamp)::date AS month, SUM(amount) AS amount
+                         FROM expenses WHERE date >= %(lo)s AND date < %(hi)s
+                           AND (%(store)s::integer IS NULL OR store_id = %(store)s)
+                         GROUP BY 1, 2
+                         UNION ALL
+                         SELECT store_id, month, amount FROM a WHERE kind = 'expense') x GROUP BY 1, 2),
+             mix AS (SELECT store_id, month, jsonb_agg(jsonb_build_object(
+                                'item_name', item_name, 'quantity', qty, 'sales', sales)
+                                ORDER BY sales DESC) AS item_mix
+                     FROM (SELECT store_id, month, item_name, SUM(qty) AS qty, SUM(sales) AS sales
+                           FROM (SELECT s.store_id, date_trunc('month', s.date::timestamp)::date AS month,
+                                        si.item_name, si.quantity AS qty, si.subtotal AS sales
+                                 FROM sale_items si JOIN sales s ON s.id = si.sale_id
+                                 WHERE s.date >= %(lo)s AND s.date < %(hi)s
+                                   AND si.sale_date >= %(lo)s AND si.sale_date < %(hi)s
+                                   AND (%(store)s::integer IS NULL OR s.store_id = %(store)s)
+                                   AND (%(store)s::integer IS NULL OR si.store_id = %(store)s)
+                                 UNION ALL
+                                 SELECT store_id, month, key, quantity, amount FROM a WHERE kind = 'item') y
+                           GROUP BY 1, 2, 3) x
+                     GROUP BY store_id, month)
+        INSERT INTO period_snapshots (store_id, month, revenue, expenses, profit, transactions, item_mix)
+        SELECT m.store_id, m.month, COALESCE(s.revenue,0), COALESCE(e.expenses,0),
+               COALESCE(s.revenue,0) - COALESCE(e.expenses,0), COALESCE(s.txns,0),
+               COALESCE(mix.item_mix, '[]'::jsonb)
+        FROM m LEFT JOIN s USING (store_id, month) LEFT JOIN e USING (store_id, month)
+               LEFT JOIN mix USING (store_id, month)
+        ON CONFLICT (store_id, month) DO UPDATE SET
+            revenue = EXCLUDED.revenue, expenses = EXCLUDED.expenses, profit = EXCLUDED.profit,
+            transactions = EXCLUDED.transactions, item_mix = EXCLUDED.item_mix,
+            revision = period_snapshots.revision + 1, closed_at = CURRENT_TIMESTAMP
+    """, {'months': months, 'lo': months[0], 'hi': hi, 'store': store_id})
+
+
+def reclose_periods(c, dates, store_id=None):
+    """
+    Re-close any already-closed month touched by a write, inside the same
+    transaction, so snapshots never disagree with the rows behind them.
+    Pass the store the write was in so only its snapshots are rebuilt.
+    Months close for all stores at once, so a store opened after a close
+    gets its snapshot row the first time it writes into a closed month.
+    """
+    months = sorted({str(d)[:7] + '-01' for d in dates if d})
+    if not months:
+        return
+    start = open_period_start(c)
+    snapshot_months(c, [m for m in months if start and m < str(start)], store_id)
+
+
+def open_period_start(c):
+    """First day not covered by a snapshot, or None when nothing is closed."""
+    c.execute("SELECT (MAX(month) + INTERVAL '1 month')::date AS start FROM period_snapshots")
+    return c.fetchone()['start']
 
 
 def get_sale_data(sale_id):
@@ -192,68 +1287,222 @@ def get_sale_data(sale_id):
         c = conn.cursor()
         c.execute("SELECT * FROM sales WHERE id=%s", (sale_id,))
         sale = c.fetchone()
-        if not sale:
+        if sale:
+            c.execute("SELECT * FROM sale_items WHERE sale_id=%s AND sale_date=%s", (sale_id, sale['date']))
+            items = [dict(r) for r in c.fetchall()]
+    if not sale:
+        archived = archived_sale(sale_id)
+        if not archived:
             return None
-        c.execute("SELECT * FROM sale_items WHERE sale_id=%s", (sale_id,))
-        items = [dict(r) for r in c.fetchall()]
+        sale, items = archived
 
-    discount = float(sale.get('discount') or 0)
-    subtotal_sum = sum(float(i['subtotal']) for i in items)
     return {
         'sale_id':       sale['id'],
         'receipt_no':    sale['receipt_no'],
         'customer_name': sale['customer_name'],
         'date':          str(sale['date'])[:10],
         'notes':         sale['notes'] or '',
-        'discount':      discount,
-        'subtotal':      subtotal_sum,
-        'total':         float(sale['total']),
-        'items': [
-            {'name': i['item_name'], 'quantity': i['quantity'],
-             'price': float(i['price']), 'subtotal': float(i['subtotal'])}
-            for i in items
-        ],
+        'discount':      sale['discount'] or Decimal(0),
+        'subtotal':      sum(i['subtotal'] for i in items),
+        'total':         sale['total'],
+        'items': [{'name': i['item_name'], 'quantity': i['quantity'],
+                   'price': i['price'], 'subtotal': i['subtotal']} for i in items],
     }
 
 
 # ─────────────────────────────────────────────────────────────────
-# DASHBOARD
+# STORES
+# Pages, APIs and writes work on the current store (current_store()),
+# chosen with the switcher on the dashboard and remembered in a cookie.
+# Customers, expense categories and the change feed are shared.
 # ─────────────────────────────────────────────────────────────────
-@app.route('/')
-def dashboard():
+STORE_COOKIE_MAX_AGE = 365 * 24 * 3600
+
+def list_stores():
+    with db_read() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, name FROM stores ORDER BY id")
+        return c.fetchall()
+
+
+def _select_store(store_id):
+    resp = redirect(request.referrer or url_for('dashboard'))
+    resp.set_cookie('store', str(store_id), max_age=STORE_COOKIE_MAX_AGE, samesite='Lax')
+    return resp
+
+
+@app.route('/stores/select', methods=['POST'])
+def select_store():
+    try:
+        store_id = int(request.form['store_id'])
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'store_id must be a store id'}), 400
+    if store_id not in {s['id'] for s in list_stores()}:
+        return jsonify({'success': False, 'error': 'Store not found'}), 404
+    return _select_store(store_id)
+
+
+@app.route('/stores/add', methods=['POST'])
+def add_store():
+    """Open a store with a copy of the current store's catalog (no stock) and switch to it."""
+    name = request.form.get('name', '').strip()
+    if not name:
+        return jsonify({'success': False, 'error': 'Store name is required'}), 400
+    try:
+        with db() as conn:
+            c = conn.cursor()
+            c.execute("INSERT INTO stores (name) VALUES (%s) RETURNING id", (name,))
+            store_id = c.fetchone()['id']
+            c.execute("""INSERT INTO items (store_id, name, price, active, sort_order, reorder_level)
+                         SELECT %s, name, price, active, sort_order, reorder_level
+                         FROM items WHERE store_id=%s""", (store_id, current_store()))
+    except psycopg2.errors.UniqueViolation:
+        return jsonify({'success': False, 'error': f'A store named {name} already exists'}), 400
+    return _select_store(store_id)
+
+
+@app.route('/api/stores/summary')
+def api_stores_summary():
+    """
+    Revenue, expenses, profit and transactions per store, plus the
+    cross-store total summed from those rows. Each store is aggregated
+    separately (LATERAL) so its open period is one idx_*_store_date range,
+    and closed months come from its period_snapshots rows.
+    """
     with db_read() as conn:
         c = conn.cursor()
         c.execute("""
-            SELECT
-                (SELECT COALESCE(SUM(total),0)  FROM sales)    AS revenue,
-                (SELECT COUNT(*)                FROM sales)    AS txn_count,
-                (SELECT COALESCE(SUM(amount),0) FROM expenses) AS expenses
-        """)
-        stats = c.fetchone()
-        total_revenue      = stats['revenue']
-        total_transactions = stats['txn_count']
-        total_expenses     = stats['expenses']
-
-        c.execute("SELECT id,customer_name,date,total FROM sales ORDER BY date DESC,id DESC LIMIT 5")
-        recent_sales = c.fetchall()
-        c.execute("SELECT id,description,amount,category,date FROM expenses ORDER BY date DESC,id DESC LIMIT 5")
-        recent_expenses = c.fetchall()
-        c.execute("""SELECT si.item_name, i.id as item_id,
-                            SUM(si.quantity) as total_qty, SUM(si.subtotal) as total_sales
-                     FROM sale_items si LEFT JOIN items i ON si.item_name=i.name
-                     GROUP BY si.item_name,i.id ORDER BY total_qty DESC LIMIT 5""")
-        top_items = c.fetchall()
-        c.execute("""SELECT category, SUM(amount) as total,
-                            STRING_AGG(id::text,',') as expense_ids
-                     FROM expenses GROUP BY category ORDER BY total DESC LIMIT 5""")
-        expense_breakdown = c.fetchall()
-
-    net_profit = total_revenue - total_expenses
-    return render_template('dashboard.html',
-                           revenue=total_revenue, transactions=total_transactions,
-                           expenses=total_expenses, net_profit=net_profit,
-                           recent_sales=recent_sales, recent_expenses=recent_expenses,
-                           top_items=top_items, expense_breakdown=expense_breakdown)
+            WITH o AS (SELECT COALESCE((MAX(month) + INTERVAL '1 month')::date, '-infinity'::date) AS start
+                       FROM period_snapshots)
+            SELECT st.id, st.name,
+                   p.revenue + s.revenue AS revenue, p.expenses + e.expenses AS expenses,
+                   p.revenue + s.revenue - p.expenses - e.expenses AS profit,
+                   p.txns + s.txns AS transactions
+            FROM stores st, o,
+            LATERAL (SELECT COALESCE(SUM(revenue),0) AS revenue, COALESCE(SUM(expenses),0) AS expenses,
+                            COALESCE(SUM(transactions),0) AS txns
+                     FROM period_snapshots WHERE store_id = st.id) p,
+            LATERAL (SELECT COALESCE(SUM(total),0) AS revenue, COUNT(*) AS txns
+                     FROM sales WHERE store_id = st.id AND date >= o.start) s,
+            LATERAL (SELECT COALESCE(SUM(amount),0) AS expenses
+                     FROM expenses WHERE store_id = st.id AND date >= o.start) e
+            ORDER BY st.id""")
+        stores = c.fetchall()
+    totals = {k: sum(s[k] for s in stores) for k in ('revenue', 'expenses', 'profit', 'transactions')}
+    return jsonify({'stores': stores, 'total': totals})
+
+
+# ─────────────────────────────────────────────────────────────────
+# DASHBOARD FRAGMENTS
+# Each section is rendered from its macro in dashboard_fragments.html and
+# cached per process and store, keyed by that store's versions of the
+# tables it reads.
+# ─────────────────────────────────────────────────────────────────
+def _fragment_stats(c, store_id):
+    # Closed months come from period_snapshots; only the open period is scanned
+    c.execute("""
+        WITH o AS (SELECT COALESCE((MAX(month) + INTERVAL '1 month')::date, '-infinity'::date) AS start
+                   FROM period_snapshots),
+             p AS (SELECT COALESCE(SUM(revenue),0) AS revenue, COALESCE(SUM(transactions),0) AS txns,
+                          COALESCE(SUM(expenses),0) AS expenses
+                   FROM period_snapshots WHERE store_id = %(store)s)
+        SELECT
+            p.revenue + (SELECT COALESCE(SUM(total),0) FROM sales, o
+                         WHERE store_id = %(store)s AND date >= o.start)         AS revenue,
+            p.txns + (SELECT COUNT(*) FROM sales, o
+                      WHERE store_id = %(store)s AND date >= o.start)            AS txn_count,
+            p.expenses + (SELECT COALESCE(SUM(amount),0) FROM expenses, o
+                          WHERE store_id = %(store)s AND date >= o.start)        AS expenses
+        FROM p
+    """, {'store': store_id})
+    stats = c.fetchone()
+    return dict(revenue=stats['revenue'], expenses=stats['expenses'],
+                net_profit=stats['revenue'] - stats['expenses'],
+                transactions=stats['txn_count'])
+
+def _fragment_recent_sales(c, store_id):
+    c.execute("""SELECT id,customer_name,date,total FROM sales WHERE store_id=%s
+                 ORDER BY date DESC,id DESC LIMIT 5""", (store_id,))
+    return dict(recent_sales=c.fetchall())
+
+def _fragment_recent_expenses(c, store_id):
+    c.execute("""SELECT id,description,amount,category,date FROM expenses WHERE store_id=%s
+                 ORDER BY date DESC,id DESC LIMIT 5""", (store_id,))
+    return dict(recent_expenses=c.fetchall())
+
+def _fragment_top_items(c, store_id):
+    c.execute("""SELECT si.item_name, i.id as item_id,
+                        SUM(si.quantity) as total_qty, SUM(si.subtotal) as total_sales
+                 FROM (SELECT item_name, quantity, subtotal FROM sale_items WHERE store_id = %(store)s
+                       UNION ALL
+                       SELECT key, quantity, amount FROM archived_totals
+                       WHERE store_id = %(store)s AND kind = 'item') si
+                 LEFT JOIN items i ON i.store_id = %(store)s AND si.item_name=i.name
+                 GROUP BY si.item_name,i.id ORDER BY total_qty DESC LIMIT 5""", {'store': store_id})
+    return dict(top_items=c.fetchall())
+
+def _fragment_expense_breakdown(c, store_id):
+    # Count plus one id: enough for the Edit action (a direct link when the
+    # category has a single live expense) without listing every id
+    c.execute("""SELECT ec.id AS category_id, ec.name AS category, SUM(x.amount) AS total,
+                        SUM(x.cnt) AS expense_count, MIN(x.first_id) AS expense_id
+                 FROM (SELECT category_id, SUM(amount) AS amount, COUNT(*) AS cnt, MIN(id) AS first_id
+                       FROM expenses WHERE store_id = %(store)s GROUP BY category_id
+                       UNION ALL
+                       SELECT ec2.id, SUM(a.amount), 0, NULL
+                       FROM archived_totals a JOIN expense_categories ec2 ON lower(ec2.name) = lower(a.key)
+                       WHERE a.store_id = %(store)s AND a.kind = 'expense' GROUP BY ec2.id) x
+                 JOIN expense_categories ec ON ec.id = x.category_id
+                 GROUP BY ec.id, ec.name ORDER BY total DESC LIMIT 5""", {'store': store_id})
+    return dict(expense_breakdown=c.fetchall())
+
+# fragment -> (tables it depends on, loader returning the macro's arguments)
+DASHBOARD_FRAGMENTS = {
+    'stats':             (('sales', 'expenses'), _fragment_stats),
+    'recent_sales':      (('sales',),            _fragment_recent_sales),
+    'recent_expenses':   (('expenses',),         _fragment_recent_expenses),
+    'top_items':         (('sales', 'items'),    _fragment_top_items),
+    'expense_breakdown': (('expenses',),         _fragment_expense_breakdown),
+}
+_fragment_cache = {}  # (store id, name) -> (version key, rendered Markup)
+
+
+def render_fragments(names, store_id):
+    """(the store's table versions, {name: html}) for the given dashboard fragments."""
+    fragments = {}
+    with db_read() as conn:
+        c = conn.cursor()
+        # Versions are read before any data, so a cached fragment is never
+        # newer than its key says — at worst it is re-rendered once more.
+        versions = store_versions(c, store_id)
+        for name in names:
+            tables, load = DASHBOARD_FRAGMENTS[name]
+            key = tuple(versions.get(t, 0) for t in tables)
+            cached = _fragment_cache.get((store_id, name))
+            if cached and cached[0] == key:
+                fragments[name] = cached[1]
+                continue
+            html = get_template_attribute('dashboard_fragments.html', name)(**load(c, store_id))
+            _fragment_cache[(store_id, name)] = (key, html)
+            fragments[name] = html
+    return versions, fragments
+
+
+@app.route('/')
+def dashboard():
+    store_id = current_store()
+    versions, fragments = render_fragments(DASHBOARD_FRAGMENTS, store_id)
+    return render_template('dashboard.html', fragments=fragments, versions=versions,
+                           store_id=store_id, stores=list_stores(), live_events=LIVE_EVENTS)
+
+
+@app.route('/api/dashboard/fragments')
+def api_dashboard_fragments():
+    """Re-rendered fragments that depend on any of ?tables=sales,expenses — for live updates."""
+    changed = set(request.args.get('tables', '').split(','))
+    names = [n for n, (tables, _) in DASHBOARD_FRAGMENTS.items() if changed & set(tables)]
+    versions, fragments = render_fragments(names, current_store())
+    return jsonify({'versions': versions, 'fragments': fragments})
 
 
 # ─────────────────────────────────────────────────────────────────
@@ -263,80 +1512,616 @@ def dashboard():
 def api_monthly_sales():
     with db_read() as conn:
         c = conn.cursor()
+        store_id = current_store()
+        c.execute("""SELECT to_char(month,'YYYY-MM') as month, revenue, transactions
+                     FROM period_snapshots WHERE store_id=%s ORDER BY month DESC LIMIT 12""", (store_id,))
+        data = c.fetchall()
+        data.reverse()
         c.execute("""SELECT to_char(date,'YYYY-MM') as month, SUM(total) as revenue, COUNT(*) as transactions
-                     FROM sales GROUP BY to_char(date,'YYYY-MM') ORDER BY month DESC LIMIT 12""")
-        data = [dict(r) for r in c.fetchall()]
-    data.reverse()
-    return jsonify(data)
+                     FROM sales WHERE store_id = %s AND date >= COALESCE(%s, '-infinity'::date)
+                     GROUP BY to_char(date,'YYYY-MM') ORDER BY month DESC LIMIT 12""",
+                  (store_id, open_period_start(c)))
+        data += reversed(c.fetchall())
+    return jsonify(data[-12:])
 
 @app.route('/api/charts/item-sales')
 def api_item_sales():
-    with db_read() as conn:
+    with db_read(tuples=True) as conn:
         c = conn.cursor()
-        c.execute("SELECT item_name, SUM(quantity) as total_qty, SUM(subtotal) as total_sales FROM sale_items GROUP BY item_name ORDER BY total_sales DESC")
-        return jsonify([dict(r) for r in c.fetchall()])
+        c.execute("""SELECT item_name, SUM(quantity) as total_qty, SUM(subtotal) as total_sales
+                     FROM (SELECT item_name, quantity, subtotal FROM sale_items WHERE store_id = %(store)s
+                           UNION ALL
+                           SELECT key, quantity, amount FROM archived_totals
+                           WHERE store_id = %(store)s AND kind = 'item') x
+                     GROUP BY item_name ORDER BY total_sales DESC""", {'store': current_store()})
+        return rows_json(c)
 
 @app.route('/api/charts/expense-breakdown')
 def api_expense_breakdown():
-    with db_read() as conn:
+    with db_read(tuples=True) as conn:
         c = conn.cursor()
-        c.execute("SELECT category, SUM(amount) as total FROM expenses GROUP BY category ORDER BY total DESC")
-        return jsonify([dict(r) for r in c.fetchall()])
+        c.execute("""SELECT ec.name AS category, SUM(x.amount) as total
+                     FROM (SELECT category_id, SUM(amount) AS amount FROM expenses
+                           WHERE store_id = %(store)s GROUP BY category_id
+                           UNION ALL
+                           SELECT ec2.id, SUM(a.amount)
+                           FROM archived_totals a JOIN expense_categories ec2 ON lower(ec2.name) = lower(a.key)
+                           WHERE a.store_id = %(store)s AND a.kind = 'expense' GROUP BY ec2.id) x
+                     JOIN expense_categories ec ON ec.id = x.category_id
+                     GROUP BY ec.id, ec.name ORDER BY total DESC""", {'store': current_store()})
+        return rows_json(c)
 
 @app.route('/api/charts/monthly-comparison')
 def api_monthly_comparison():
     with db_read() as conn:
         c = conn.cursor()
-        # Single query instead of two separate ones
+        store_id = current_store()
+        c.execute("""SELECT to_char(month,'YYYY-MM') AS month, revenue, expenses, profit
+                     FROM period_snapshots WHERE store_id=%s ORDER BY month DESC LIMIT 12""", (store_id,))
+        closed = c.fetchall()
+        closed.reverse()
+        # Live aggregate for the open period only
         c.execute("""
             SELECT month,
                    SUM(revenue)  AS revenue,
                    SUM(expenses) AS expenses,
                    SUM(revenue) - SUM(expenses) AS profit
             FROM (
-                SELECT to_char(date,'YYYY-MM') AS month, total AS revenue, 0 AS expenses FROM sales
+                SELECT to_char(date,'YYYY-MM') AS month, total AS revenue, 0 AS expenses
+                FROM sales WHERE store_id = %(store)s AND date >= COALESCE(%(start)s, '-infinity'::date)
                 UNION ALL
-                SELECT to_char(date,'YYYY-MM') AS month, 0 AS revenue, amount AS expenses FROM expenses
+                SELECT to_char(date,'YYYY-MM') AS month, 0 AS revenue, amount AS expenses
+                FROM expenses WHERE store_id = %(store)s AND date >= COALESCE(%(start)s, '-infinity'::date)
             ) combined
-            GROUP BY month ORDER BY month
-        """)
-        result = [dict(r) for r in c.fetchall()]
-    return jsonify(result[-12:])
+            GROUP BY month ORDER BY month DESC LIMIT 12
+        """, {'store': store_id, 'start': open_period_start(c)})
+        live = c.fetchall()
+        live.reverse()
+    return jsonify((closed + live)[-12:])
+
+
+# ─────────────────────────────────────────────────────────────────
+# PERIOD CLOSE
+# Closed months are frozen into period_snapshots; writes that touch a
+# closed month re-close it in the same transaction (reclose_periods).
+# ─────────────────────────────────────────────────────────────────
+@app.route('/periods/close', methods=['POST'])
+def close_periods():
+    """
+    Close every month through `through` (YYYY-MM, default: last month)
+    that isn't closed yet. Months are closed contiguously so the open
+    period is always "everything after the last snapshot".
+    """
+    this_month = datetime.now().date().replace(day=1)
+    try:
+        through = datetime.strptime(request.values['through'], '%Y-%m').date() \
+                  if request.values.get('through') else (this_month - timedelta(days=1)).replace(day=1)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'through must be YYYY-MM'}), 400
+    if through >= this_month:
+        return jsonify({'success': False, 'error': 'The current month is still open'}), 400
+
+    with db() as conn:
+        c = conn.cursor()
+        start = open_period_start(c)
+        if start is None:
+            c.execute("""SELECT date_trunc('month', LEAST(
+                             (SELECT MIN(date) FROM sales), (SELECT MIN(date) FROM expenses)))::date AS start""")
+            start = c.fetchone()['start']
+        months = []
+        while start is not None and start <= through:
+            months.append(start)
+            start = (start + timedelta(days=32)).replace(day=1)
+        snapshot_months(c, months)
+    return jsonify({'success': True, 'closed': [str(m)[:7] for m in months]})
+
+
+@app.route('/api/periods')
+def api_periods():
+    with db_read(tuples=True) as conn:
+        c = conn.cursor()
+        c.execute("""SELECT to_char(month,'YYYY-MM') AS month, revenue, expenses, profit,
+                            transactions, item_mix, revision, closed_at
+                     FROM period_snapshots WHERE store_id=%s ORDER BY month""", (current_store(),))
+        return rows_json(c)
+
+
+# Label column and to_char format per granularity (names match the old period routes)
+_ANALYTICS_LABELS = {
+    'day':   ('day',        'YYYY-MM-DD'),
+    'week':  ('week_start', 'YYYY-MM-DD'),
+    'month': ('month',      'YYYY-MM'),
+    'year':  ('year',       'YYYY'),
+}
+# Widest range allowed per granularity, in buckets
+_ANALYTICS_MAX_BUCKETS = {'day': 366, 'week': 260, 'month': 240, 'year': 100}
+# metric name -> (output column, source CTE, expression)
+_ANALYTICS_METRICS = {
+    'revenue':  ('revenue',      's', 'COALESCE(s.revenue,0)'),
+    'txns':     ('transactions', 's', 'COALESCE(s.txns,0)'),
+    'expenses': ('expenses',     'e', 'COALESCE(e.expenses,0)'),
+    'profit':   ('profit',       'se', 'COALESCE(s.revenue,0) - COALESCE(e.expenses,0)'),
+}
+
+
+def _bucket_count(start, end, granularity):
+    if granularity == 'day':
+        return (end - start).days + 1
+    if granularity == 'week':
+        return (end - start).days // 7 + 2
+    if granularity == 'month':
+        return (end.year - start.year) * 12 + end.month - start.month + 1
+    return end.year - start.year + 1
+
+
+def analytics_series(start, end, granularity, metrics, store_id):
+    """
+    One store's gap-filled series between two dates (inclusive), one row
+    per bucket. Buckets come from generate_series so empty days/weeks show
+    up as zeros; the sales/expenses CTEs only touch the store's rows inside
+    the range (idx_*_store_date*), plus the archived_totals stubs for any
+    archived days in it.
+    """
+    label, fmt = _ANALYTICS_LABELS[granularity]
+    sources = ''.join(_ANALYTICS_METRICS[m][1] for m in metrics)
+    columns = ', '.join(f"{_ANALYTICS_METRICS[m][2]} AS {_ANALYTICS_METRICS[m][0]}" for m in metrics)
+
+    ctes = ["""buckets AS (
+                SELECT generate_series(date_trunc(%(g)s, %(start)s::timestamp),
+                                       date_trunc(%(g)s, %(end)s::timestamp),
+                                       %(step)s::interval)::date AS bucket)"""]
+    joins = ''
+    if 's' in sources:
+        ctes.append("""s AS (
+                SELECT date_trunc(%(g)s, day::timestamp)::date AS bucket,
+                       SUM(amount) AS revenue, SUM(txns) AS txns
+                FROM (SELECT date AS day, total AS amount, 1 AS txns FROM sales
+                      WHERE store_id = %(store)s AND date BETWEEN %(start)s AND %(end)s
+                      UNION ALL
+                      SELECT day, amount, txns FROM archived_totals
+                      WHERE store_id = %(store)s AND kind = 'sales' AND day BETWEEN %(start)s AND %(end)s) x
+                GROUP BY 1)""")
+        joins += ' LEFT JOIN s USING (bucket)'
+    if 'e' in sources:
+        ctes.append("""e AS (
+                SELECT date_trunc(%(g)s, day::timestamp)::date AS bucket,
+                       SUM(amount) AS expenses
+                FROM (SELECT date AS day, amount FROM expenses
+                      WHERE store_id = %(store)s AND date BETWEEN %(start)s AND %(end)s
+                      UNION ALL
+                      SELECT day, amount FROM archived_totals
+                      WHERE store_id = %(store)s AND kind = 'expense' AND day BETWEEN %(start)s AND %(end)s) x
+                GROUP BY 1)""")
+        joins += ' LEFT JOIN e USING (bucket)'
 
-@app.route('/api/analytics/daily')
-def api_analytics_daily():
     with db_read() as conn:
         c = conn.cursor()
-        c.execute("""SELECT to_char(date,'YYYY-MM-DD') as day, SUM(total) as revenue, COUNT(*) as transactions
-                     FROM sales WHERE date>=NOW()-INTERVAL '30 days'
-                     GROUP BY to_char(date,'YYYY-MM-DD') ORDER BY day""")
-        return jsonify([dict(r) for r in c.fetchall()])
+        c.execute(f"""WITH {', '.join(ctes)}
+                      SELECT to_char(bucket,%(fmt)s) AS {label}, {columns}
+                      FROM buckets{joins} ORDER BY bucket""",
+                  {'g': granularity, 'start': start, 'end': end, 'store': store_id,
+                   'step': f'1 {granularity}', 'fmt': fmt})
+        return c.fetchall()
+
+
+@app.route('/api/analytics')
+def api_analytics():
+    try:
+        end   = datetime.strptime(request.args['to'], '%Y-%m-%d').date() \
+                if request.args.get('to') else datetime.now().date()
+        start = datetime.strptime(request.args['from'], '%Y-%m-%d').date() \
+                if request.args.get('from') else end - timedelta(days=30)
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    granularity = request.args.get('granularity', 'day')
+    metrics = [m for m in request.args.get('metrics', 'revenue,txns').split(',') if m]
+
+    if granularity not in _ANALYTICS_LABELS:
+        return jsonify({'error': f'Unknown granularity: {granularity}'}), 400
+    unknown = [m for m in metrics if m not in _ANALYTICS_METRICS]
+    if not metrics:
+        return jsonify({'error': 'No metrics requested'}), 400
+    if unknown:
+        return jsonify({'error': f'Unknown metrics: {",".join(unknown)}'}), 400
+    if start > end:
+        return jsonify({'error': '"from" must not be after "to"'}), 400
+    if _bucket_count(start, end, granularity) > _ANALYTICS_MAX_BUCKETS[granularity]:
+        return jsonify({'error': f'Range too wide for {granularity} granularity '
+                                 f'(max {_ANALYTICS_MAX_BUCKETS[granularity]} buckets)'}), 400
+
+    return jsonify(analytics_series(start, end, granularity, metrics, current_store()))
+
+
+BASKETS_MAX_LIMIT = 500
+
+@app.route('/api/analytics/baskets')
+def api_baskets():
+    """
+    Item pairs bought together in the current store, from its item_pairs
+    counters — cost grows with the catalog, not with sales, apart from an
+    index-only count of the store's sales for the total. ?item= keeps pairs
+    with that item (as item_a); ?min_baskets= (default 2) and ?limit= (default 50).
+    support = P(a and b), confidence = P(b | a), lift = confidence / P(b),
+    over the store's live and archived sales.
+    """
+    item = request.args.get('item', '')
+    try:
+        min_baskets = int(request.args.get('min_baskets', 2))
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': 'min_baskets and limit must be whole numbers'}), 400
+    if not 1 <= limit <= BASKETS_MAX_LIMIT:
+        return jsonify({'error': f'limit must be between 1 and {BASKETS_MAX_LIMIT}'}), 400
 
-@app.route('/api/analytics/weekly')
-def api_analytics_weekly():
     with db_read() as conn:
         c = conn.cursor()
-        c.execute("""SELECT to_char(date_trunc('week',date),'YYYY-MM-DD') as week_start,
-                            SUM(total) as revenue, COUNT(*) as transactions
-                     FROM sales WHERE date>=NOW()-INTERVAL '12 weeks'
-                     GROUP BY date_trunc('week',date) ORDER BY week_start""")
-        return jsonify([dict(r) for r in c.fetchall()])
+        c.execute("""WITH p AS (SELECT item_a, item_b, baskets FROM item_pairs WHERE store_id = %(store)s),
+                          n AS (SELECT NULLIF((SELECT COUNT(*) FROM sales WHERE store_id = %(store)s)
+                                            + (SELECT COALESCE(SUM(txns), 0) FROM archived_totals
+                                               WHERE store_id = %(store)s AND kind = 'sales'), 0) AS total),
+                          single AS (SELECT item_a AS item, NULLIF(baskets, 0) AS baskets FROM p
+                                     WHERE item_a = item_b)
+                     SELECT p.item_a, p.item_b, p.baskets,
+                            ROUND(p.baskets::numeric / n.total, 4) AS support,
+                            ROUND(p.baskets::numeric / sa.baskets, 4) AS confidence_ab,
+                            ROUND(p.baskets::numeric / sb.baskets, 4) AS confidence_ba,
+                            ROUND(p.baskets::numeric * n.total / (sa.baskets * sb.baskets), 3) AS lift
+                     FROM p
+                     JOIN single sa ON sa.item = p.item_a
+                     JOIN single sb ON sb.item = p.item_b
+                     CROSS JOIN n
+                     WHERE p.item_a < p.item_b AND p.baskets >= %(min)s
+                       AND (%(item)s = '' OR %(item)s IN (p.item_a, p.item_b))
+                     ORDER BY lift DESC, p.baskets DESC
+                     LIMIT %(limit)s""", {'store': current_store(), 'min': max(min_baskets, 1),
+                                          'item': item, 'limit': limit})
+        pairs = c.fetchall()
+
+    if item:
+        # Orient every pair as item → other
+        for r in pairs:
+            if r['item_b'] == item:
+                r['item_a'], r['item_b'] = r['item_b'], r['item_a']
+                r['confidence_ab'], r['confidence_ba'] = r['confidence_ba'], r['confidence_ab']
+    return jsonify(pairs)
+
+
+# Presets kept for the dashboard's Sales Report tab
+@app.route('/api/analytics/daily')
+def api_analytics_daily():
+    today = datetime.now().date()
+    return jsonify(analytics_series(today - timedelta(days=30), today, 'day', ['revenue', 'txns'],
+                                    current_store()))
+
+@app.route('/api/analytics/weekly')
+def api_analytics_weekly():
+    today = datetime.now().date()
+    return jsonify(analytics_series(today - timedelta(weeks=12), today, 'week', ['revenue', 'txns'],
+                                    current_store()))
 
 @app.route('/api/analytics/monthly')
 def api_analytics_monthly():
-    with db_read() as conn:
-        c = conn.cursor()
-        c.execute("""SELECT to_char(date,'YYYY-MM') as month, SUM(total) as revenue, COUNT(*) as transactions
-                     FROM sales WHERE date>=NOW()-INTERVAL '12 months'
-                     GROUP BY to_char(date,'YYYY-MM') ORDER BY month""")
-        return jsonify([dict(r) for r in c.fetchall()])
+    today = datetime.now().date()
+    return jsonify(analytics_series(today.replace(year=today.year - 1, day=1), today, 'month',
+                                    ['revenue', 'txns'], current_store()))
 
 @app.route('/api/analytics/yearly')
 def api_analytics_yearly():
+    store_id = current_store()
+    with db_read() as conn:
+        c = conn.cursor()
+        # Archived years count too; LEAST/GREATEST skip whichever side is empty
+        c.execute("""SELECT LEAST((SELECT MIN(date) FROM sales WHERE store_id = %(store)s),
+                                  (SELECT MIN(day) FROM archived_totals
+                                   WHERE store_id = %(store)s AND kind = 'sales')) AS first,
+                            GREATEST((SELECT MAX(date) FROM sales WHERE store_id = %(store)s),
+                                     (SELECT MAX(day) FROM archived_totals
+                                      WHERE store_id = %(store)s AND kind = 'sales')) AS last""",
+                  {'store': store_id})
+        bounds = c.fetchone()
+    if not bounds['first']:
+        return jsonify([])
+    return jsonify(analytics_series(bounds['first'], bounds['last'], 'year', ['revenue', 'txns'], store_id))
+
+
+# ─────────────────────────────────────────────────────────────────
+# FORECAST
+# Per-item daily demand, fitted for every item at once as one
+# (items × days) array per store. Each store's fit is cached per process
+# until its next sale write bumps its 'sales' version, or the day rolls over.
+# ─────────────────────────────────────────────────────────────────
+FORECAST_HISTORY_DAYS = 112   # 16 full weeks, so every weekday is seen 16 times
+FORECAST_MAX_HORIZON  = 90
+FORECAST_ALPHA        = 0.3   # exponential smoothing weight on the newest day
+FORECAST_TREND_DAYS   = 28
+_WEEKDAYS = ('Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun')
+_forecast_cache = {}  # store id -> (version key, fitted models)
+
+def _daily_item_series(c, start, end, store_id):
+    """
+    One row per item the store sold in [start, end]: its gap-filled daily
+    quantities. The days without sales are filled in here rather than by
+    joining against a generated calendar, which the planner can't estimate.
+    """
+    c.execute("""
+        WITH q AS (SELECT item_name, day, SUM(qty)::int AS qty
+                   FROM (SELECT item_name, sale_date AS day, quantity AS qty FROM sale_items
+                         WHERE store_id = %(store)s AND sale_date BETWEEN %(start)s AND %(end)s
+                         UNION ALL
+                         SELECT key, day, quantity FROM archived_totals
+                         WHERE store_id = %(store)s AND kind = 'item' AND day BETWEEN %(start)s AND %(end)s) x
+                   WHERE item_name IS NOT NULL GROUP BY 1, 2)
+        SELECT q.item_name, i.on_hand,
+               array_agg(q.day - %(start)s::date) AS offsets, array_agg(q.qty) AS quantities
+        FROM q LEFT JOIN items i ON i.store_id = %(store)s AND i.name = q.item_name
+        GROUP BY q.item_name, i.on_hand ORDER BY q.item_name""",
+              {'start': start, 'end': end, 'store': store_id})
+    days = (end - start).days + 1
+    rows = []
+    for r in c.fetchall():
+        series = [0] * days
+        for offset, qty in zip(r['offsets'], r['quantities']):
+            series[offset] = qty
+        rows.append({'item_name': r['item_name'], 'on_hand': r['on_hand'], 'series': series})
+    return rows
+
+def fit_forecasts(rows, start):
+    """
+    Fit every item in one pass: 7/28-day moving averages, simple
+    exponential smoothing (closed form, as a dot product with decaying
+    weights), a least-squares trend over the last FORECAST_TREND_DAYS and
+    weekday seasonality factors. Projection h days ahead =
+    (level + trend × h) × weekday factor, clamped at 0.
+    """
+    # Imported here: only this endpoint needs it and it is slow to import on cold start
+    import numpy as np
+
+    names = [r['item_name'] for r in rows]
+    y = np.array([r['series'] for r in rows], dtype=float).reshape(len(rows), -1)
+    n = y.shape[1]
+
+    avg_7, avg_28 = y[:, -7:].mean(axis=1), y[:, -28:].mean(axis=1)
+
+    # level_T = Σ α(1-α)^(T-t) y_t + (1-α)^T y_0
+    decay = (1 - FORECAST_ALPHA) ** np.arange(n - 1, -1, -1)
+    weights = FORECAST_ALPHA * decay
+    weights[0] = decay[0]
+    level = y @ weights
+
+    x = np.arange(FORECAST_TREND_DAYS, dtype=float)
+    x -= x.mean()
+    recent = y[:, -FORECAST_TREND_DAYS:]
+    trend = (recent - recent.mean(axis=1, keepdims=True)) @ x / (x @ x)
+
+    dow = (start.weekday() + np.arange(n)) % 7
+    onehot = (dow[:, None] == np.arange(7)).astype(float)
+    weekday_mean = (y @ onehot) / onehot.sum(axis=0)
+    overall = y.mean(axis=1, keepdims=True)
+    factors = np.divide(weekday_mean, overall, out=np.ones_like(weekday_mean), where=overall > 0)
+
+    first = start + timedelta(days=n)
+    ahead_dow = (first.weekday() + np.arange(FORECAST_MAX_HORIZON)) % 7
+    h = np.arange(1, FORECAST_MAX_HORIZON + 1)
+    projected = np.round(np.maximum(0, (level[:, None] + trend[:, None] * h) * factors[:, ahead_dow]), 2)
+
+    dates = [str(first + timedelta(days=i)) for i in range(FORECAST_MAX_HORIZON)]
+    return {
+        name: {
+            'item_name':       name,
+            'on_hand':         rows[i]['on_hand'],
+            'history_days':    n,
+            'avg_7d':          round(float(avg_7[i]), 2),
+            'avg_28d':         round(float(avg_28[i]), 2),
+            'level':           round(float(level[i]), 2),
+            'trend_per_day':   round(float(trend[i]), 3),
+            'weekday_factors': dict(zip(_WEEKDAYS, np.round(factors[i], 2).tolist())),
+            'projection':      projected[i].tolist(),
+            'dates':           dates,
+        }
+        for i, name in enumerate(names)
+    }
+
+def get_forecasts(store_id):
+    # History ends yesterday: today's partial count would drag the level down
+    end = datetime.now().date() - timedelta(days=1)
+    start = end - timedelta(days=FORECAST_HISTORY_DAYS - 1)
+    with db_read() as conn:
+        c = conn.cursor()
+        # The models carry on_hand, so a restock has to invalidate them as well as a sale
+        versions = store_versions(c, store_id)
+        key = (versions.get('sales', 0), versions.get('items', 0), end)
+        cached = _forecast_cache.get(store_id)
+        if cached and cached[0] == key:
+            return cached[1]
+        rows = _daily_item_series(c, start, end, store_id)
+    models = fit_forecasts(rows, start) if rows else {}
+    _forecast_cache[store_id] = (key, models)
+    return models
+
+
+@app.route('/api/forecast')
+def api_forecast():
+    item = request.args.get('item', '')
+    try:
+        horizon = int(request.args.get('horizon', 14))
+    except ValueError:
+        return jsonify({'error': 'horizon must be a whole number of days'}), 400
+    if not 1 <= horizon <= FORECAST_MAX_HORIZON:
+        return jsonify({'error': f'horizon must be between 1 and {FORECAST_MAX_HORIZON}'}), 400
+
+    models = get_forecasts(current_store())
+    if item and item not in models:
+        return jsonify({'error': f'No sales in the last {FORECAST_HISTORY_DAYS} days for {item}'}), 404
+
+    result = []
+    for name in ([item] if item else models):
+        m = models[name]
+        forecast = m['projection'][:horizon]
+        total = round(sum(forecast), 2)
+        out = {k: v for k, v in m.items() if k not in ('projection', 'dates')}
+        out['forecast'] = [{'date': d, 'quantity': q} for d, q in zip(m['dates'], forecast)]
+        out['forecast_total'] = total
+        if m['on_hand'] is not None:
+            out['restock_needed'] = max(0, math.ceil(total - m['on_hand']))
+        result.append(out)
+    result.sort(key=lambda r: r['forecast_total'], reverse=True)
+    return jsonify(result[0] if item else result)
+
+
+# ─────────────────────────────────────────────────────────────────
+# CHANGE FEED
+# Cursor is "<txid>-<id>" of the last change seen. Only transactions older
+# than the oldest one still running are returned, so a change can never
+# commit behind a cursor a client already holds; a long transaction
+# delays the feed rather than losing entries.
+# ─────────────────────────────────────────────────────────────────
+CHANGES_PAGE_MAX = 1000
+_CHANGE_OPS = {'I': 'insert', 'U': 'update', 'D': 'delete'}
+
+@app.route('/api/changes')
+def api_changes():
+    since = request.args.get('since', '')
+    try:
+        txid, last_id = (int(x) for x in since.split('-')) if since else (0, 0)
+    except ValueError:
+        return jsonify({'error': 'since must be a cursor from a previous response'}), 400
+    try:
+        limit = int(request.args.get('limit', 200))
+    except ValueError:
+        return jsonify({'error': 'limit must be a whole number'}), 400
+    if not 1 <= limit <= CHANGES_PAGE_MAX:
+        return jsonify({'error': f'limit must be between 1 and {CHANGES_PAGE_MAX}'}), 400
+
     with db_read() as conn:
         c = conn.cursor()
-        c.execute("SELECT to_char(date,'YYYY') as year, SUM(total) as revenue, COUNT(*) as transactions FROM sales GROUP BY to_char(date,'YYYY') ORDER BY year")
-        return jsonify([dict(r) for r in c.fetchall()])
+        c.execute("""SELECT id, txid, table_name, op, row_id, data, changed_at FROM changes
+                     WHERE (txid, id) > (%s, %s)
+                       AND txid < txid_snapshot_xmin(txid_current_snapshot())
+                     ORDER BY txid, id LIMIT %s""", (txid, last_id, limit + 1))
+        rows = c.fetchall()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows:
+        since = f"{rows[-1]['txid']}-{rows[-1]['id']}"
+    return jsonify({
+        'changes': [{'table': r['table_name'], 'op': _CHANGE_OPS[r['op']], 'id': r['row_id'],
+                     'row': r['data'], 'changed_at': r['changed_at']} for r in rows],
+        'cursor': since or '0-0',
+        'has_more': has_more,
+    })
+
+
+# ─────────────────────────────────────────────────────────────────
+# LIVE UPDATES
+# bump_versions() NOTIFYs {table: version} on every write. Each worker
+# process keeps one LISTEN connection in a background thread and fans
+# notifications out to its /events streams. Streams end after
+# EVENTS_MAX_SECONDS and EventSource reconnects, so they never pin a
+# worker for long; run gunicorn with --worker-class gthread so open
+# streams don't block other requests.
+#
+# Both need a long-lived process. Serverless functions (the Vercel
+# deploy in vercel.json) are frozen between requests and cut off after a
+# timeout, so there LIVE_EVENTS is off by default: /events answers 404
+# and the dashboard polls /api/versions instead. Set LIVE_EVENTS=on or
+# off to override the detection.
+# ─────────────────────────────────────────────────────────────────
+LIVE_EVENTS        = os.environ.get('LIVE_EVENTS', 'off' if os.environ.get('VERCEL') else 'on') == 'on'
+NOTIFY_CHANNEL     = 'table_changes'
+EVENTS_MAX_SECONDS = 300
+EVENTS_KEEPALIVE   = 15
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+_listener = None
+
+def _broadcast(payload):
+    with _subscribers_lock:
+        for q in _subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                pass  # a stalled client; the next event carries newer versions
+
+def _listen_forever():
+    while True:
+        conn = None
+        try:
+            conn = psycopg2.connect(_build_uri(), sslmode=DB_SSLMODE, connect_timeout=5,
+                                    keepalives=1, keepalives_idle=30,
+                                    keepalives_interval=5, keepalives_count=3)
+            conn.autocommit = True
+            c = conn.cursor()
+            c.execute(f"LISTEN {NOTIFY_CHANNEL}")
+            # Anything missed while (re)connecting: send the current versions
+            c.execute("SELECT COALESCE(json_object_agg(name, version), '{}')::text FROM table_versions")
+            _broadcast(c.fetchone()[0])
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    _broadcast(conn.notifies.pop(0).payload)
+        except psycopg2.Error as e:
+            print(f"WARNING: change listener reconnecting: {e}")
+            time.sleep(5)
+        finally:
+            if conn is not None:
+                conn.close()
+
+def _ensure_listener():
+    global _listener
+    with _subscribers_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_listen_forever, name='change-listener', daemon=True)
+            _listener.start()
+
+
+@app.route('/api/versions')
+def api_versions():
+    """{table: version} for the store — what dashboards poll when LIVE_EVENTS is off."""
+    with db_read() as conn:
+        return jsonify(store_versions(conn.cursor(), current_store()))
+
+
+@app.route('/events')
+def events():
+    if not LIVE_EVENTS:
+        return jsonify({'error': 'Live events are off (LIVE_EVENTS); poll /api/versions'}), 404
+    _ensure_listener()
+    q = queue.Queue(maxsize=100)
+    with _subscribers_lock:
+        _subscribers.add(q)
+    try:
+        # Read after subscribing so no write falls between the two
+        with db_read() as conn:
+            c = conn.cursor()
+            c.execute("SELECT name, version FROM table_versions")
+            initial = json.dumps({r['name']: r['version'] for r in c.fetchall()})
+    except Exception:
+        with _subscribers_lock:
+            _subscribers.discard(q)
+        raise
+
+    def stream():
+        try:
+            yield f"retry: 3000\nevent: versions\ndata: {initial}\n\n"
+            deadline = time.monotonic() + EVENTS_MAX_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    payload = q.get(timeout=EVENTS_KEEPALIVE)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: versions\ndata: {payload}\n\n"
+        finally:
+            with _subscribers_lock:
+                _subscribers.discard(q)
+
+    resp = app.response_class(stream(), mimetype='text/event-stream')
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['X-Accel-Buffering'] = 'no'
+    return resp
 
 
 # ─────────────────────────────────────────────────────────────────
@@ -362,13 +2147,15 @@ def reorder_items():
         if not ids:
             return jsonify({'success': False}), 400
         ids = [int(i) for i in ids]  # dataset.id from JS is a string — must cast for the integer PK
+        store_id = current_store()
         with db() as conn:
             c = conn.cursor()
             psycopg2.extras.execute_values(
                 c,
-                "UPDATE items SET sort_order=data.ord FROM (VALUES %s) AS data(id, ord) WHERE items.id=data.id",
-                [(item_id, idx) for idx, item_id in enumerate(ids)],
-                template="(%s::integer, %s::integer)"
+                """UPDATE items SET sort_order=data.ord FROM (VALUES %s) AS data(id, ord, store_id)
+                   WHERE items.id=data.id AND items.store_id=data.store_id""",
+                [(item_id, idx, store_id) for idx, item_id in enumerate(ids)],
+                template="(%s::integer, %s::integer, %s::integer)"
             )
         return jsonify({'success': True})
     except Exception as e:
@@ -410,6 +2197,45 @@ def download_receipt(sale_id):
         f'attachment; filename=receipt_{sale_id}_{data["customer_name"].replace(" ","_")}.txt'
     return resp
 
+@app.route('/archive/export/<table>')
+def export_archive(table):
+    """Archived rows as one CSV download; ?from=YYYY-MM&to=YYYY-MM narrows the months."""
+    if table not in ARCHIVED_TABLES:
+        return jsonify({'error': f'Unknown table: {table}'}), 404
+    start, end = request.args.get('from') or None, request.args.get('to') or None
+    for value in (start, end):
+        if value:
+            try:
+                datetime.strptime(value, '%Y-%m')
+            except ValueError:
+                return jsonify({'error': 'from/to must be YYYY-MM'}), 400
+
+    # The header is the table as it is now: files archived before a column
+    # was added leave it blank (columns are only ever added, see init_db)
+    with db_read() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT column_name FROM information_schema.columns
+                     WHERE table_schema = current_schema() AND table_name = %s
+                     ORDER BY ordinal_position""", (table,))
+        columns = [r['column_name'] for r in c.fetchall()]
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=columns, restval='', extrasaction='ignore')
+        writer.writeheader()
+        for row in read_archive(table, start, end):
+            writer.writerow(row)
+            if buf.tell() >= 8192:
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+        yield buf.getvalue()
+
+    resp = app.response_class(generate(), mimetype='text/csv')
+    span = '_'.join(v for v in (start, end) if v) or 'all'
+    resp.headers['Content-Disposition'] = f'attachment; filename=archived_{table}_{span}.csv'
+    return resp
+
 
 # ─────────────────────────────────────────────────────────────────
 # SALES
@@ -421,7 +2247,7 @@ def add_sale():
             customer   = request.form['customer_name'].strip()
             date       = request.form['date'] or datetime.now().strftime('%Y-%m-%d')
             notes      = request.form.get('notes', '').strip()
-            discount   = float(request.form.get('discount', 0) or 0)
+            discount   = Decimal(request.form.get('discount') or 0)
             item_ids   = request.form.getlist('item_id')
             quantities = request.form.getlist('quantity')
 
@@ -431,41 +2257,42 @@ def add_sale():
                 return jsonify({'success': False, 'error': 'Please add at least one item.'}), 400
 
             needed_ids = [x[0] for x in ids_with_qty]
+            store_id   = current_store()
 
             with db() as conn:
                 c = conn.cursor()
 
                 # Fetch all needed items in one query
-                c.execute("SELECT id,name,price FROM items WHERE id=ANY(%s) AND active=TRUE",
-                          (needed_ids,))
+                c.execute("SELECT id,name,price FROM items WHERE id=ANY(%s) AND store_id=%s AND active=TRUE",
+                          (needed_ids, store_id))
                 item_map = {r['id']: r for r in c.fetchall()}
 
                 entries = []
-                subtotal_sum = 0.0
+                subtotal_sum = Decimal(0)
                 for iid, qty in ids_with_qty:
                     item = item_map.get(iid)
                     if item:
-                        sub = float(item['price']) * qty
+                        sub = item['price'] * qty
                         subtotal_sum += sub
-                        entries.append((item['name'], qty, float(item['price']), sub))
+                        entries.append((item['name'], qty, item['price'], sub))
 
                 if not entries:
                     return jsonify({'success': False, 'error': 'No valid items found.'}), 400
 
-                total = max(0.0, subtotal_sum - discount)
+                total = max(Decimal(0), subtotal_sum - discount)
 
                 # Dedup check: same customer + date + total within last 10 seconds
                 c.execute("""
                     SELECT id, receipt_no FROM sales
-                    WHERE customer_name=%s AND date=%s AND total=%s
+                    WHERE store_id=%s AND customer_name=%s AND date=%s AND total=%s
                       AND created_at >= NOW() - INTERVAL '10 seconds'
                     ORDER BY id DESC LIMIT 1
-                """, (customer, date, total))
+                """, (store_id, customer, date, total))
                 existing = c.fetchone()
                 if existing:
                     sale_id = existing['id']
                     c.execute("SELECT * FROM sale_items WHERE sale_id=%s", (sale_id,))
-                    existing_items = [dict(r) for r in c.fetchall()]
+                    existing_items = c.fetchall()
                     # autocommit not used here — need to commit to release lock
                     return jsonify({
                         'success': True, 'sale_id': sale_id,
@@ -474,26 +2301,30 @@ def add_sale():
                         'notes': notes, 'discount': discount,
                         'subtotal': subtotal_sum, 'total': total,
                         'items': [{'name': i['item_name'], 'quantity': i['quantity'],
-                                   'price': float(i['price']), 'subtotal': float(i['subtotal'])}
-                                  for i in existing_items]
+                                   'price': i['price'], 'subtotal': i['subtotal']}
+                                  for i in existing_items],
+                        'negative_stock': []
                     })
 
-                # Insert sale with receipt_no
-                c.execute("SELECT COALESCE(MAX(receipt_no), 0) + 1 AS next_no FROM sales")
-                next_receipt_no = c.fetchone()['next_no']
-
+                # receipt_no defaults to nextval('sales_receipt_no_seq')
+                customer_id = record_customer_visit(c, customer, total, date)
                 c.execute(
-                    "INSERT INTO sales (customer_name,date,total,discount,notes,receipt_no) VALUES (%s,%s,%s,%s,%s,%s) RETURNING id",
-                    (customer, date, total, discount, notes, next_receipt_no)
+                    "INSERT INTO sales (store_id,customer_name,customer_id,date,total,discount,notes) VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING id, receipt_no",
+                    (store_id, customer, customer_id, date, total, discount, notes)
                 )
-                sale_id = c.fetchone()['id']
+                inserted = c.fetchone()
+                sale_id, next_receipt_no = inserted['id'], inserted['receipt_no']
 
                 # Batch insert sale_items — single round-trip
                 psycopg2.extras.execute_values(
                     c,
-                    "INSERT INTO sale_items (sale_id,item_name,quantity,price,subtotal) VALUES %s",
-                    [(sale_id, e[0], e[1], e[2], e[3]) for e in entries]
+                    "INSERT INTO sale_items (store_id,sale_id,sale_date,item_name,quantity,price,subtotal) VALUES %s",
+                    [(store_id, sale_id, date, e[0], e[1], e[2], e[3]) for e in entries]
                 )
+                reclose_periods(c, [date], store_id)
+                count_baskets(c, store_id, added=[[e[0] for e in entries]])
+                negative_stock = adjust_stock(c, store_id, {e[0]: -e[1] for e in entries}, 'sale', sale_id)
+                bump_versions(c, 'sales', store_id=store_id)
                 # conn.commit() happens automatically via context manager
 
             return jsonify({
@@ -503,31 +2334,179 @@ def add_sale():
                 'notes': notes, 'discount': discount,
                 'subtotal': subtotal_sum, 'total': total,
                 'items': [{'name': e[0], 'quantity': e[1], 'price': e[2], 'subtotal': e[3]}
-                          for e in entries]
+                          for e in entries],
+                'negative_stock': negative_stock
             })
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
 
-    return render_template('add_sale.html', items=get_active_items(),
+    store_id = current_store()
+    return render_template('add_sale.html', items=get_active_items(store_id), store_id=store_id,
                            today=datetime.now().strftime('%Y-%m-%d'))
 
 
+SALES_BATCH_MAX = 200
+
+def _parse_batch_sale(raw):
+    """One /api/sales/batch entry → normalised dict; raises ValueError on bad input."""
+    if not isinstance(raw, dict):
+        raise ValueError('Each sale must be an object.')
+    customer = str(raw.get('customer_name') or '').strip()
+    if not customer:
+        raise ValueError('Customer name is required.')
+    sale_date = raw.get('date') or datetime.now().strftime('%Y-%m-%d')
+    try:
+        datetime.strptime(sale_date, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        raise ValueError('Date must be YYYY-MM-DD.')
+    try:
+        discount = Decimal(str(raw.get('discount') or 0))
+        lines = [(int(i['item_id']), int(i['quantity'])) for i in raw.get('items') or []]
+    except (TypeError, ValueError, KeyError, InvalidOperation):
+        raise ValueError('Items need a numeric item_id and quantity.')
+    lines = [(iid, qty) for iid, qty in lines if qty > 0]
+    if not lines:
+        raise ValueError('Please add at least one item.')
+    return {'customer_name': customer, 'date': sale_date, 'discount': discount,
+            'notes': str(raw.get('notes') or '').strip(), 'lines': lines}
+
+
+@app.route('/api/sales/batch', methods=['POST'])
+def api_sales_batch():
+    """
+    Save many sales for the current store in one transaction: one catalog lookup, one dedup query,
+    one block of receipt numbers, and multi-row inserts for sales and line
+    items. Accepts a JSON array of sales (or {"sales": [...]}) shaped like
+    the add-sale form; results come back in the same order.
+    """
+    payload = request.get_json(silent=True)
+    raw_sales = payload.get('sales') if isinstance(payload, dict) else payload
+    if not isinstance(raw_sales, list) or not raw_sales:
+        return jsonify({'success': False, 'error': 'Expected a non-empty array of sales.'}), 400
+    if len(raw_sales) > SALES_BATCH_MAX:
+        return jsonify({'success': False, 'error': f'At most {SALES_BATCH_MAX} sales per batch.'}), 400
+
+    store_id = current_store()
+    results = [None] * len(raw_sales)
+    parsed = []
+    for idx, raw in enumerate(raw_sales):
+        try:
+            parsed.append((idx, _parse_batch_sale(raw)))
+        except ValueError as e:
+            results[idx] = {'index': idx, 'success': False, 'error': str(e)}
+
+    try:
+        with db() as conn:
+            c = conn.cursor()
+            needed_ids = sorted({iid for _, sale in parsed for iid, _ in sale['lines']})
+            c.execute("SELECT id,name,price FROM items WHERE id=ANY(%s) AND store_id=%s AND active=TRUE",
+                      (needed_ids, store_id))
+            item_map = {r['id']: r for r in c.fetchall()}
+
+            pending = []
+            for idx, sale in parsed:
+                entries = [(item_map[iid]['name'], qty, item_map[iid]['price'], item_map[iid]['price'] * qty)
+                           for iid, qty in sale['lines'] if iid in item_map]
+                if not entries:
+                    results[idx] = {'index': idx, 'success': False, 'error': 'No valid items found.'}
+                    continue
+                subtotal_sum = sum(e[3] for e in entries)
+                sale.update(index=idx, entries=entries, subtotal=subtotal_sum,
+                            total=max(Decimal(0), subtotal_sum - sale['discount']))
+                pending.append(sale)
+
+            duplicates = {}
+            if pending:
+                # Same dedup rule as add_sale, checked for the whole batch at once
+                rows = psycopg2.extras.execute_values(
+                    c,
+                    """SELECT DISTINCT ON (v.idx) v.idx, s.id, s.receipt_no
+                       FROM (VALUES %s) v(idx, store_id, customer_name, date, total)
+                       JOIN sales s ON s.store_id = v.store_id AND s.date = v.date
+                                   AND s.customer_name = v.customer_name AND s.total = v.total
+                                   AND s.created_at >= NOW() - INTERVAL '10 seconds'
+                       ORDER BY v.idx, s.id DESC""",
+                    [(p['index'], store_id, p['customer_name'], p['date'], p['total']) for p in pending],
+                    template="(%s, %s::integer, %s, %s::date, %s::numeric)", page_size=len(pending),
+                    fetch=True
+                )
+                duplicates = {r['idx']: r for r in rows}
+
+            fresh = [p for p in pending if p['index'] not in duplicates]
+            negative_stock = []
+            if fresh:
+                # One nextval per sale: concurrent checkouts draw from the same sequence
+                c.execute("SELECT nextval('sales_receipt_no_seq') AS n FROM generate_series(1, %s)",
+                          (len(fresh),))
+                for p, n in zip(fresh, sorted(r['n'] for r in c.fetchall())):
+                    p['receipt_no'] = n
+
+                customer_ids = record_customer_visits(
+                    c, [(p['customer_name'], p['total'], p['date']) for p in fresh])
+                inserted = psycopg2.extras.execute_values(
+                    c,
+                    """INSERT INTO sales (store_id,customer_name,customer_id,date,total,discount,notes,receipt_no)
+                       VALUES %s RETURNING id, receipt_no""",
+                    [(store_id, p['customer_name'], customer_ids.get(p['customer_name'].lower()), p['date'],
+                      p['total'], p['discount'], p['notes'], p['receipt_no']) for p in fresh],
+                    page_size=len(fresh), fetch=True
+                )
+                sale_ids = {r['receipt_no']: r['id'] for r in inserted}
+                for p in fresh:
+                    p['sale_id'] = sale_ids[p['receipt_no']]
+
+                line_rows = [(store_id, p['sale_id'], p['date'], e[0], e[1], e[2], e[3])
+                             for p in fresh for e in p['entries']]
+                psycopg2.extras.execute_values(
+                    c,
+                    "INSERT INTO sale_items (store_id,sale_id,sale_date,item_name,quantity,price,subtotal) VALUES %s",
+                    line_rows, page_size=len(line_rows)
+                )
+                reclose_periods(c, [p['date'] for p in fresh], store_id)
+                count_baskets(c, store_id, added=[[e[0] for e in p['entries']] for p in fresh])
+                negative_stock = adjust_stock_many(
+                    c, store_id, [(e[0], -e[1], p['sale_id']) for p in fresh for e in p['entries']], 'sale')
+                bump_versions(c, 'sales', store_id=store_id)
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    for p in pending:
+        dup = duplicates.get(p['index'])
+        results[p['index']] = {
+            'index': p['index'], 'success': True, 'duplicate': bool(dup),
+            'sale_id': dup['id'] if dup else p['sale_id'],
+            'receipt_no': dup['receipt_no'] if dup else p['receipt_no'],
+            'customer_name': p['customer_name'], 'date': p['date'],
+            'notes': p['notes'], 'discount': p['discount'],
+            'subtotal': p['subtotal'], 'total': p['total'],
+            'items': [{'name': e[0], 'quantity': e[1], 'price': e[2], 'subtotal': e[3]}
+                      for e in p['entries']],
+        }
+    saved = sum(1 for r in results if r['success'] and not r['duplicate'])
+    failed = sum(1 for r in results if not r['success'])
+    return jsonify({'success': failed == 0, 'saved': saved,
+                    'duplicates': len(duplicates), 'failed': failed, 'results': results,
+                    'negative_stock': negative_stock})
+
+
 @app.route('/sales')
 def view_sales():
     search = request.args.get('search', '')
     with db_read() as conn:
         c = conn.cursor()
         c.execute("""SELECT id,customer_name,date,total,notes,receipt_no
-                     FROM sales WHERE customer_name ILIKE %s
-                     ORDER BY date DESC,id DESC""", (f'%{search}%',))
+                     FROM sales WHERE store_id=%s AND customer_name ILIKE %s
+                     ORDER BY date DESC,id DESC""", (current_store(), f'%{search}%'))
         sales_rows = c.fetchall()
 
         if not sales_rows:
-            return render_template('view_sales.html', sales=[], search=search)
+            return stream_template('view_sales.html', sales=[], search=search)
 
         sale_ids = [s['id'] for s in sales_rows]
+        # The date bounds let a partitioned sale_items skip months outside the list
         c.execute("""SELECT sale_id, item_name as name, quantity, price, subtotal
-                     FROM sale_items WHERE sale_id=ANY(%s)""", (sale_ids,))
+                     FROM sale_items WHERE sale_id=ANY(%s) AND sale_date BETWEEN %s AND %s""",
+                  (sale_ids, sales_rows[-1]['date'], sales_rows[0]['date']))
         all_items = c.fetchall()
 
     items_by_sale = {}
@@ -546,112 +2525,259 @@ def view_sales():
         }
         for sale in sales_rows
     ]
-    return render_template('view_sales.html', sales=expanded, search=search)
+    # Streamed: the page can be long (every sale, its items and receipt modal)
+    return stream_template('view_sales.html', sales=expanded, search=search)
 
 
 @app.route('/sales/delete/<int:sale_id>', methods=['POST'])
 def delete_sale(sale_id):
+    store_id = current_store()
     with db() as conn:
         c = conn.cursor()
-        # CASCADE on sale_items handles child rows automatically
-        c.execute("DELETE FROM sales WHERE id=%s", (sale_id,))
+        c.execute("DELETE FROM sale_items WHERE sale_id=%s AND store_id=%s RETURNING item_name, quantity",
+                  (sale_id, store_id))
+        returned = {}
+        for r in c.fetchall():
+            returned[r['item_name']] = returned.get(r['item_name'], 0) + r['quantity']
+        c.execute("DELETE FROM sales WHERE id=%s AND store_id=%s RETURNING customer_id, date",
+                  (sale_id, store_id))
+        deleted = c.fetchall()
+        refresh_customers(c, [r['customer_id'] for r in deleted])
+        reclose_periods(c, [r['date'] for r in deleted], store_id)
+        count_baskets(c, store_id, removed=[list(returned)])
+        adjust_stock(c, store_id, returned, 'sale_delete', sale_id)
+        bump_versions(c, 'sales', store_id=store_id)
     return redirect(url_for('view_sales'))
 
 
-@app.route('/sales/edit/<int:sale_id>', methods=['GET', 'POST'])
-def edit_sale(sale_id):
-    with db_read() as conn:
-        c = conn.cursor()
-        c.execute("SELECT * FROM sales WHERE id=%s", (sale_id,))
-        sale = c.fetchone()
-        if not sale:
-            return "Sale not found", 404
-        c.execute("SELECT * FROM sale_items WHERE sale_id=%s", (sale_id,))
-        sale_items = [dict(r) for r in c.fetchall()]
+def _edit_sale_context(c, sale_id, store_id):
+    """Everything the edit form renders — sale, its lines and the store's catalog — on one cursor."""
+    c.execute("SELECT * FROM sales WHERE id=%s AND store_id=%s", (sale_id, store_id))
+    sale = c.fetchone()
+    if not sale:
+        return None
+    c.execute("SELECT * FROM sale_items WHERE sale_id=%s AND sale_date=%s ORDER BY id",
+              (sale_id, sale['date']))
+    sale_items = [dict(r) for r in c.fetchall()]
+    items = get_active_items(store_id, c)
+    items_json = app.json.dumps(items)
+    return dict(sale=sale, sale_items=sale_items, items=items, items_json=items_json)
 
-    items = get_active_items()
-    items_json = json.dumps([{**i, 'price': float(i['price'])} for i in items])
 
-    if request.method == 'POST':
-        try:
-            customer   = request.form['customer_name'].strip()
-            date       = request.form['date']
-            notes      = request.form.get('notes', '').strip()
-            discount   = float(request.form.get('discount', 0) or 0)
-            item_ids   = request.form.getlist('item_id')
-            quantities = request.form.getlist('quantity')
+class SaleConflict(Exception):
+    """The sale changed (or vanished) after the edit form was loaded."""
 
-            ids_with_qty = [(int(iid), int(qty)) for iid, qty in zip(item_ids, quantities)
-                            if int(qty) > 0]
-            if not ids_with_qty:
-                return render_template('edit_sale.html', sale=sale, sale_items=sale_items,
-                                       items=items, items_json=items_json,
-                                       error="Please add at least one item.")
 
-            needed_ids = [x[0] for x in ids_with_qty]
+def _diff_sale_items(old_rows, entries):
+    """
+    Compare stored lines with the submitted ones by item name and return
+    (inserts, updates, delete_ids, stock_delta). Unchanged lines produce no
+    statement; stock_delta is {item_name: qty returned to stock}.
+    """
+    wanted = {}
+    for name, qty, price in entries:
+        prev = wanted.get(name)
+        wanted[name] = (prev[0] + qty if prev else qty, price)
+
+    current, delete_ids, stock_delta = {}, [], {}
+    for r in old_rows:
+        stock_delta[r['item_name']] = stock_delta.get(r['item_name'], 0) + r['quantity']
+        if r['item_name'] in wanted and r['item_name'] not in current:
+            current[r['item_name']] = r
+        else:
+            delete_ids.append(r['id'])
+
+    inserts, updates = [], []
+    for name, (qty, price) in wanted.items():
+        stock_delta[name] = stock_delta.get(name, 0) - qty
+        row = current.get(name)
+        if row is None:
+            inserts.append((name, qty, price, price * qty))
+        elif row['quantity'] != qty or row['price'] != price:
+            updates.append((row['id'], qty, price, price * qty))
+    return inserts, updates, delete_ids, stock_delta
 
-            with db() as conn:
-                c = conn.cursor()
-                c.execute("SELECT id,name,price FROM items WHERE id=ANY(%s)", (needed_ids,))
-                item_map = {r['id']: r for r in c.fetchall()}
 
-                updated = []
-                subtotal_sum = 0.0
-                for iid, qty in ids_with_qty:
-                    item = item_map.get(iid)
-                    if item:
-                        sub = float(item['price']) * qty
-                        subtotal_sum += sub
-                        updated.append((item['name'], qty, float(item['price']), sub))
-
-                if not updated:
-                    return render_template('edit_sale.html', sale=sale, sale_items=sale_items,
-                                           items=items, items_json=items_json,
-                                           error="No valid items found.")
+@app.route('/sales/edit/<int:sale_id>', methods=['GET', 'POST'])
+def edit_sale(sale_id):
+    store_id = current_store()
+    if request.method == 'GET':
+        with db_read() as conn:
+            ctx = _edit_sale_context(conn.cursor(), sale_id, store_id)
+        if not ctx:
+            return "Sale not found", 404
+        return render_template('edit_sale.html', **ctx)
 
-                total = max(0.0, subtotal_sum - discount)
-                c.execute(
-                    "UPDATE sales SET customer_name=%s,date=%s,total=%s,discount=%s,notes=%s WHERE id=%s",
-                    (customer, date, total, discount, notes, sale_id)
+    try:
+        customer   = request.form['customer_name'].strip()
+        date       = request.form['date']
+        notes      = request.form.get('notes', '').strip()
+        discount   = Decimal(request.form.get('discount') or 0)
+        version    = int(request.form.get('version', 0))
+        item_ids   = request.form.getlist('item_id')
+        quantities = request.form.getlist('quantity')
+        ids_with_qty = [(int(iid), int(qty)) for iid, qty in zip(item_ids, quantities)
+                        if int(qty) > 0]
+    except (KeyError, ValueError, InvalidOperation):
+        ids_with_qty, version = None, None
+
+    # One checkout and one transaction for the whole save. Validation
+    # failures and conflicts render the form from the same connection;
+    # nothing has been written by then, so the commit on exit is a no-op.
+    try:
+        with db() as conn:
+            c = conn.cursor()
+            if ids_with_qty is None:
+                ctx = _edit_sale_context(c, sale_id, store_id)
+                return render_template('edit_sale.html', **ctx, error="Invalid form data.") \
+                    if ctx else ("Sale not found", 404)
+
+            c.execute("SELECT id,name,price FROM items WHERE id=ANY(%s) AND store_id=%s",
+                      ([x[0] for x in ids_with_qty], store_id))
+            item_map = {r['id']: r for r in c.fetchall()}
+            entries = [(item_map[iid]['name'], qty, item_map[iid]['price'])
+                       for iid, qty in ids_with_qty if iid in item_map]
+            if not entries:
+                ctx = _edit_sale_context(c, sale_id, store_id)
+                if not ctx:
+                    return "Sale not found", 404
+                return render_template('edit_sale.html', **ctx,
+                                       error="Please add at least one item." if not ids_with_qty
+                                             else "No valid items found.")
+
+            total = max(Decimal(0), sum(price * qty for _, qty, price in entries) - discount)
+            customer_id = get_customer_id(c, customer)
+            # Optimistic check and update in one statement: it only matches
+            # if nobody saved this sale since the form was rendered.
+            c.execute("""WITH old AS (SELECT id, customer_id, date FROM sales
+                                      WHERE id=%s AND store_id=%s AND version=%s FOR UPDATE)
+                         UPDATE sales s SET customer_name=%s, customer_id=%s, date=%s, total=%s,
+                                            discount=%s, notes=%s, version=s.version + 1
+                         FROM old WHERE s.id = old.id
+                         RETURNING old.customer_id AS old_customer_id, old.date AS old_date""",
+                      (sale_id, store_id, version, customer, customer_id, date, total, discount, notes))
+            old = c.fetchone()
+            if not old:
+                raise SaleConflict()
+
+            # Partitioned sale_items follow the date via ON UPDATE CASCADE;
+            # otherwise they are moved here. Either way they're found under
+            # one of the two dates.
+            c.execute("""SELECT id, item_name, quantity, price FROM sale_items
+                         WHERE sale_id=%s AND sale_date = ANY(%s::date[]) ORDER BY id""",
+                      (sale_id, [old['old_date'], date]))
+            old_rows = c.fetchall()
+            inserts, updates, delete_ids, stock_delta = _diff_sale_items(old_rows, entries)
+            if str(old['old_date']) != date:
+                c.execute("UPDATE sale_items SET sale_date=%s WHERE sale_id=%s AND sale_date<>%s",
+                          (date, sale_id, date))
+            if delete_ids:
+                c.execute("DELETE FROM sale_items WHERE sale_id=%s AND id=ANY(%s)", (sale_id, delete_ids))
+            if updates:
+                psycopg2.extras.execute_values(
+                    c,
+                    """UPDATE sale_items si SET quantity=v.quantity, price=v.price, subtotal=v.subtotal
+                       FROM (VALUES %s) v(id, quantity, price, subtotal)
+                       WHERE si.id = v.id""",
+                    updates, template="(%s, %s::integer, %s::numeric, %s::numeric)"
                 )
-                c.execute("DELETE FROM sale_items WHERE sale_id=%s", (sale_id,))
+            if inserts:
                 psycopg2.extras.execute_values(
                     c,
-                    "INSERT INTO sale_items (sale_id,item_name,quantity,price,subtotal) VALUES %s",
-                    [(sale_id, u[0], u[1], u[2], u[3]) for u in updated]
+                    "INSERT INTO sale_items (store_id,sale_id,sale_date,item_name,quantity,price,subtotal) VALUES %s",
+                    [(store_id, sale_id, date) + e for e in inserts]
                 )
 
-            return redirect(url_for('view_sales') + '?saved=1')
-        except Exception as e:
-            return render_template('edit_sale.html', sale=sale, sale_items=sale_items,
-                                   items=items, items_json=items_json, error=f"Error: {str(e)}")
+            refresh_customers(c, [old['old_customer_id'], customer_id])
+            reclose_periods(c, [old['old_date'], date], store_id)
+            if inserts or delete_ids:
+                count_baskets(c, store_id, removed=[[r['item_name'] for r in old_rows]],
+                              added=[[e[0] for e in entries]])
+            adjust_stock(c, store_id, stock_delta, 'sale_edit', sale_id)
+            bump_versions(c, 'sales', store_id=store_id)
+    except SaleConflict:
+        with db_read() as conn:
+            ctx = _edit_sale_context(conn.cursor(), sale_id, store_id)
+        if not ctx:
+            return "Sale not found", 404
+        return render_template('edit_sale.html', **ctx,
+                               error="Someone else saved this sale while you were editing. "
+                                     "The form now shows their version; re-apply your changes "
+                                     "and save again."), 409
+    except Exception as e:
+        with db_read() as conn:
+            ctx = _edit_sale_context(conn.cursor(), sale_id, store_id)
+        if not ctx:
+            return "Sale not found", 404
+        return render_template('edit_sale.html', **ctx, error=f"Error: {str(e)}")
 
-    return render_template('edit_sale.html', sale=sale, sale_items=sale_items,
-                           items=items, items_json=items_json)
+    return redirect(url_for('view_sales') + '?saved=1')
 
 
 @app.route('/sales/delete-item/<item_name>', methods=['POST'])
 def delete_item_sales(item_name):
+    store_id = current_store()
     with db() as conn:
         c = conn.cursor()
-        c.execute("SELECT DISTINCT sale_id FROM sale_items WHERE item_name=%s", (item_name,))
-        sale_ids = [r['sale_id'] for r in c.fetchall()]
-        c.execute("DELETE FROM sale_items WHERE item_name=%s", (item_name,))
-        for sid in sale_ids:
-            c.execute("SELECT SUM(subtotal) as s FROM sale_items WHERE sale_id=%s", (sid,))
-            new_subtotal = c.fetchone()['s']
-            if not new_subtotal:
-                c.execute("DELETE FROM sales WHERE id=%s", (sid,))
-            else:
-                # Get discount for this sale to calculate correct total
-                c.execute("SELECT discount FROM sales WHERE id=%s", (sid,))
-                discount_row = c.fetchone()
-                discount = float(discount_row['discount']) if discount_row else 0
-                new_total = max(0.0, new_subtotal - discount)
-                c.execute("UPDATE sales SET total=%s WHERE id=%s", (new_total, sid))
+        c.execute("""SELECT array_agg(DISTINCT item_name) AS names FROM sale_items
+                     WHERE sale_id IN (SELECT sale_id FROM sale_items WHERE store_id=%(store)s AND item_name=%(name)s)
+                     GROUP BY sale_id""", {'store': store_id, 'name': item_name})
+        baskets = [r['names'] for r in c.fetchall()]
+        c.execute("DELETE FROM sale_items WHERE store_id=%s AND item_name=%s RETURNING sale_id, quantity",
+                  (store_id, item_name))
+        returned = c.fetchall()
+        affected = recompute_sale_totals(c, [r['sale_id'] for r in returned])
+        refresh_customers(c, [r['customer_id'] for r in affected])
+        reclose_periods(c, [r['date'] for r in affected], store_id)
+        count_baskets(c, store_id, removed=baskets, added=[[n for n in b if n != item_name] for b in baskets])
+        adjust_stock(c, store_id, {item_name: sum(r['quantity'] for r in returned)}, 'sale_delete')
+        bump_versions(c, 'sales', store_id=store_id)
     return redirect(url_for('dashboard'))
 
 
+# ─────────────────────────────────────────────────────────────────
+# CUSTOMERS
+# ─────────────────────────────────────────────────────────────────
+@app.route('/api/customers/suggest')
+def api_customer_suggest():
+    q = request.args.get('q', '').strip().lower()
+    if not q:
+        return jsonify([])
+    # Escape LIKE wildcards so the prefix stays a prefix (idx_customers_name_lower)
+    prefix = q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    with db_read(tuples=True) as conn:
+        c = conn.cursor()
+        c.execute("""SELECT id, name, visit_count, last_visit FROM customers
+                     WHERE lower(name) LIKE %s
+                     ORDER BY visit_count DESC, name LIMIT 8""", (prefix,))
+        return rows_json(c)
+
+
+@app.route('/api/customers/top')
+def api_top_customers():
+    limit = min(request.args.get('limit', 10, type=int), 100)
+    with db_read(tuples=True) as conn:
+        c = conn.cursor()
+        c.execute("""SELECT id, name, lifetime_revenue, visit_count, last_visit FROM customers
+                     WHERE visit_count > 0
+                     ORDER BY lifetime_revenue DESC LIMIT %s""", (limit,))
+        return rows_json(c)
+
+
+@app.route('/api/customers/<int:customer_id>/sales')
+def api_customer_sales(customer_id):
+    with db_read() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id, name, lifetime_revenue, visit_count, last_visit FROM customers WHERE id=%s",
+                  (customer_id,))
+        customer = c.fetchone()
+        if not customer:
+            return jsonify({'error': 'Customer not found'}), 404
+        c.execute("""SELECT id, receipt_no, date, total, discount, notes FROM sales
+                     WHERE customer_id=%s ORDER BY date DESC, id DESC""", (customer_id,))
+        return jsonify({**customer, 'sales': c.fetchall()})
+
+
 # ─────────────────────────────────────────────────────────────────
 # ITEMS
 # ─────────────────────────────────────────────────────────────────
@@ -659,14 +2785,16 @@ def delete_item_sales(item_name):
 def manage_items():
     with db_read() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM items ORDER BY sort_order ASC, id ASC")
+        c.execute("SELECT * FROM items WHERE store_id=%s ORDER BY sort_order ASC, id ASC", (current_store(),))
         items = [dict(i) for i in c.fetchall()]
-    return render_template('manage_items.html', items=items)
+    low_stock = [i for i in items if i['active'] and i['on_hand'] <= i['reorder_level']]
+    return render_template('manage_items.html', items=items, low_stock=low_stock)
 
 
 @app.route('/items/add', methods=['POST'])
 def add_item():
     error = None
+    store_id = current_store()
     try:
         name  = request.form['name'].strip()
         price = float(request.form['price'])
@@ -674,12 +2802,14 @@ def add_item():
             raise ValueError("Item name cannot be empty.")
         with db() as conn:
             c = conn.cursor()
-            c.execute("SELECT COALESCE(MAX(sort_order),0)+1 as next_order FROM items")
+            c.execute("SELECT COALESCE(MAX(sort_order),0)+1 as next_order FROM items WHERE store_id=%s",
+                      (store_id,))
             next_order = c.fetchone()['next_order']
             c.execute(
-                "INSERT INTO items (name,price,active,sort_order) VALUES (%s,%s,TRUE,%s)",
-                (name, price, next_order)
+                "INSERT INTO items (store_id,name,price,active,sort_order) VALUES (%s,%s,%s,TRUE,%s)",
+                (store_id, name, price, next_order)
             )
+            bump_versions(c, 'items', store_id=store_id)
     except Exception as e:
         error = str(e)
         print(f"Error adding item: {e}")
@@ -687,7 +2817,7 @@ def add_item():
     if error:
         with db_read() as conn:
             c = conn.cursor()
-            c.execute("SELECT * FROM items ORDER BY sort_order ASC, id ASC")
+            c.execute("SELECT * FROM items WHERE store_id=%s ORDER BY sort_order ASC, id ASC", (store_id,))
             items = [dict(i) for i in c.fetchall()]
         return render_template('manage_items.html', items=items, add_error=error)
     return redirect(url_for('manage_items'))
@@ -695,22 +2825,64 @@ def add_item():
 
 @app.route('/items/edit/<int:item_id>', methods=['POST'])
 def edit_item(item_id):
+    store_id = current_store()
     try:
         with db() as conn:
             c = conn.cursor()
-            c.execute("UPDATE items SET name=%s,price=%s WHERE id=%s",
-                      (request.form['name'].strip(), float(request.form['price']), item_id))
+            c.execute("UPDATE items SET name=%s,price=%s WHERE id=%s AND store_id=%s",
+                      (request.form['name'].strip(), float(request.form['price']), item_id, store_id))
+            bump_versions(c, 'items', store_id=store_id)
     except Exception as e:
         print(f"Error editing item: {e}")
     return redirect(url_for('manage_items'))
 
 
+@app.route('/items/stock/<int:item_id>', methods=['POST'])
+def stock_item(item_id):
+    try:
+        qty = int(request.form.get('qty', 0) or 0)
+        reason = 'restock' if request.form.get('reason') == 'restock' else 'adjust'
+        store_id = current_store()
+        with db() as conn:
+            c = conn.cursor()
+            if qty:
+                c.execute("""WITH moved AS (INSERT INTO stock_movements (item_id, qty_change, reason)
+                                           SELECT id, %s, %s FROM items WHERE id=%s AND store_id=%s)
+                             UPDATE items SET on_hand = on_hand + %s WHERE id=%s AND store_id=%s""",
+                          (qty, reason, item_id, store_id, qty, item_id, store_id))
+            if request.form.get('reorder_level', '') != '':
+                c.execute("UPDATE items SET reorder_level=%s WHERE id=%s AND store_id=%s",
+                          (int(request.form['reorder_level']), item_id, store_id))
+            bump_versions(c, 'items', store_id=store_id)
+    except Exception as e:
+        print(f"Error adjusting stock: {e}")
+    return redirect(url_for('manage_items'))
+
+
+def get_low_stock_items(store_id):
+    """A store's active items at or below their reorder level — reads only the cached counters."""
+    with db_read() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT id, name, on_hand, reorder_level FROM items
+                     WHERE store_id=%s AND active=TRUE AND on_hand <= reorder_level
+                     ORDER BY on_hand - reorder_level, sort_order""", (store_id,))
+        return [dict(r) for r in c.fetchall()]
+
+
+@app.route('/api/stock/low')
+def api_low_stock():
+    return jsonify(get_low_stock_items(current_store()))
+
+
 @app.route('/items/toggle/<int:item_id>', methods=['POST'])
 def toggle_item(item_id):
+    store_id = current_store()
     try:
         with db() as conn:
             c = conn.cursor()
-            c.execute("UPDATE items SET active = NOT active WHERE id=%s", (item_id,))
+            c.execute("UPDATE items SET active = NOT active WHERE id=%s AND store_id=%s",
+                      (item_id, store_id))
+            bump_versions(c, 'items', store_id=store_id)
     except Exception as e:
         print(f"Error toggling: {e}")
     return redirect(url_for('manage_items'))
@@ -718,17 +2890,21 @@ def toggle_item(item_id):
 
 @app.route('/items/delete/<int:item_id>', methods=['POST'])
 def delete_item(item_id):
+    store_id = current_store()
     try:
         with db() as conn:
             c = conn.cursor()
             c.execute(
-                "SELECT COUNT(*) as cnt FROM sale_items WHERE item_name=(SELECT name FROM items WHERE id=%s)",
-                (item_id,)
+                """SELECT COUNT(*) as cnt FROM sale_items
+                   WHERE store_id=%(store)s
+                     AND item_name=(SELECT name FROM items WHERE id=%(id)s AND store_id=%(store)s)""",
+                {'store': store_id, 'id': item_id}
             )
             if c.fetchone()['cnt'] > 0:
-                c.execute("UPDATE items SET active=FALSE WHERE id=%s", (item_id,))
+                c.execute("UPDATE items SET active=FALSE WHERE id=%s AND store_id=%s", (item_id, store_id))
             else:
-                c.execute("DELETE FROM items WHERE id=%s", (item_id,))
+                c.execute("DELETE FROM items WHERE id=%s AND store_id=%s", (item_id, store_id))
+            bump_versions(c, 'items', store_id=store_id)
     except Exception as e:
         print(f"Error deleting item: {e}")
     return redirect(url_for('manage_items'))
@@ -737,34 +2913,98 @@ def delete_item(item_id):
 # ─────────────────────────────────────────────────────────────────
 # EXPENSES
 # ─────────────────────────────────────────────────────────────────
+EXPENSES_PAGE_SIZE = 50
+
 @app.route('/expenses')
 def view_expenses():
-    search = request.args.get('search', '')
+    search   = request.args.get('search', '')
+    category = request.args.get('category', '')
+    before   = request.args.get('before', '')
+    pattern  = f'%{search}%'
+    store_id = current_store()
+
+    where  = ["store_id=%s", "(description ILIKE %s OR category ILIKE %s)"]
+    params = [store_id, pattern, pattern]
+    if category:
+        # One idx_expenses_store_category_date range instead of a text match
+        where.append("category_id=(SELECT id FROM expense_categories WHERE lower(name)=lower(%s))")
+        params.append(normalize_category(category))
+    # Keyset cursor "<date>_<id>" of the last row on the previous page
+    try:
+        before_date, before_id = before.rsplit('_', 1)
+        before_id = int(before_id)
+        datetime.strptime(before_date, '%Y-%m-%d')
+        where.append("(date,id) < (%s,%s)")
+        params += [before_date, before_id]
+    except ValueError:
+        before = ''
+
     with db_read() as conn:
         c = conn.cursor()
-        c.execute("""SELECT id,description,amount,category,date,notes FROM expenses
-                     WHERE description ILIKE %s OR category ILIKE %s
-                     ORDER BY date DESC,id DESC""", (f'%{search}%', f'%{search}%'))
+        c.execute(f"""SELECT id,description,amount,category,date,notes FROM expenses
+                      WHERE {' AND '.join(where)}
+                      ORDER BY date DESC,id DESC LIMIT %s""", params + [EXPENSES_PAGE_SIZE + 1])
         expenses = [dict(e) for e in c.fetchall()]
-        c.execute("SELECT COALESCE(SUM(amount),0) as v FROM expenses")
-        total_expenses = c.fetchone()['v']
-    return render_template('view_expenses.html', expenses=expenses,
-                           search=search, total_expenses=total_expenses)
+
+        # Per-category facets (search-filtered) plus the grand row, which also
+        # carries the unfiltered total — one pass over the table. Archived
+        # expenses only count toward the unfiltered total.
+        c.execute("""SELECT ec.name AS category, GROUPING(ec.id) AS is_grand,
+                            COUNT(*) FILTER (WHERE hit) AS cnt,
+                            COALESCE(SUM(amount) FILTER (WHERE hit),0) AS total,
+                            COALESCE(SUM(amount),0) AS all_total
+                     FROM (SELECT category_id, amount,
+                                  (description ILIKE %(pattern)s OR category ILIKE %(pattern)s) AS hit
+                           FROM expenses WHERE store_id = %(store)s
+                           UNION ALL
+                           SELECT ec2.id, a.amount, FALSE
+                           FROM archived_totals a JOIN expense_categories ec2 ON lower(ec2.name) = lower(a.key)
+                           WHERE a.store_id = %(store)s AND a.kind = 'expense') x
+                     LEFT JOIN expense_categories ec ON ec.id = x.category_id
+                     GROUP BY GROUPING SETS ((ec.id, ec.name), ())
+                     ORDER BY is_grand DESC, total DESC""", {'pattern': pattern, 'store': store_id})
+        rows = c.fetchall()
+
+    grand  = rows[0]
+    facets = [dict(r) for r in rows[1:] if r['cnt']]
+    if category:
+        selected = next((f for f in facets
+                         if (f['category'] or '').lower() == normalize_category(category).lower()), None)
+        filtered_total = selected['total'] if selected else 0
+    else:
+        filtered_total = grand['total']
+
+    next_cursor = None
+    if len(expenses) > EXPENSES_PAGE_SIZE:
+        expenses = expenses[:EXPENSES_PAGE_SIZE]
+        last = expenses[-1]
+        next_cursor = f"{str(last['date'])[:10]}_{last['id']}"
+
+    return stream_template('view_expenses.html', expenses=expenses,
+                           search=search, category=category, facets=facets,
+                           total_expenses=grand['all_total'], filtered_total=filtered_total,
+                           is_filtered=bool(search or category),
+                           before=before, next_cursor=next_cursor)
 
 
 @app.route('/expenses/add', methods=['GET', 'POST'])
 def add_expense():
     if request.method == 'POST':
         try:
+            store_id = current_store()
             with db() as conn:
                 c = conn.cursor()
+                category = get_expense_category(c, request.form['category'])
                 c.execute(
-                    "INSERT INTO expenses (description,amount,category,date,notes) VALUES (%s,%s,%s,%s,%s)",
-                    (request.form['description'].strip(), float(request.form['amount']),
-                     request.form['category'].strip(),
+                    """INSERT INTO expenses (store_id,description,amount,category,category_id,date,notes)
+                       VALUES (%s,%s,%s,%s,%s,%s,%s) RETURNING date""",
+                    (store_id, request.form['description'].strip(), float(request.form['amount']),
+                     category['name'], category['id'],
                      request.form['date'] or datetime.now().strftime('%Y-%m-%d'),
                      request.form.get('notes', '').strip())
                 )
+                reclose_periods(c, [c.fetchone()['date']], store_id)
+                bump_versions(c, 'expenses', store_id=store_id)
             return redirect(url_for('view_expenses'))
         except Exception as e:
             return render_template('add_expense.html', error=str(e),
@@ -774,9 +3014,10 @@ def add_expense():
 
 @app.route('/expenses/edit/<int:expense_id>', methods=['GET', 'POST'])
 def edit_expense(expense_id):
+    store_id = current_store()
     with db_read() as conn:
         c = conn.cursor()
-        c.execute("SELECT * FROM expenses WHERE id=%s", (expense_id,))
+        c.execute("SELECT * FROM expenses WHERE id=%s AND store_id=%s", (expense_id, store_id))
         expense = c.fetchone()
     if not expense:
         return "Expense not found", 404
@@ -785,12 +3026,16 @@ def edit_expense(expense_id):
         try:
             with db() as conn:
                 c = conn.cursor()
+                category = get_expense_category(c, request.form['category'])
                 c.execute(
-                    "UPDATE expenses SET description=%s,amount=%s,category=%s,date=%s,notes=%s WHERE id=%s",
+                    """UPDATE expenses SET description=%s,amount=%s,category=%s,category_id=%s,date=%s,notes=%s
+                       WHERE id=%s AND store_id=%s""",
                     (request.form['description'].strip(), float(request.form['amount']),
-                     request.form['category'].strip(), request.form['date'],
-                     request.form.get('notes', '').strip(), expense_id)
+                     category['name'], category['id'], request.form['date'],
+                     request.form.get('notes', '').strip(), expense_id, store_id)
                 )
+                reclose_periods(c, [expense['date'], request.form['date']], store_id)
+                bump_versions(c, 'expenses', store_id=store_id)
             return redirect(url_for('view_expenses'))
         except Exception as e:
             return render_template('edit_expense.html', expense=expense, error=str(e))
@@ -799,17 +3044,24 @@ def edit_expense(expense_id):
 
 @app.route('/expenses/delete/<int:expense_id>', methods=['POST'])
 def delete_expense(expense_id):
+    store_id = current_store()
     with db() as conn:
         c = conn.cursor()
-        c.execute("DELETE FROM expenses WHERE id=%s", (expense_id,))
+        c.execute("DELETE FROM expenses WHERE id=%s AND store_id=%s RETURNING date", (expense_id, store_id))
+        reclose_periods(c, [r['date'] for r in c.fetchall()], store_id)
+        bump_versions(c, 'expenses', store_id=store_id)
     return redirect(url_for('view_expenses'))
 
 
-@app.route('/expenses/delete-category/<category>', methods=['POST'])
-def delete_category_expenses(category):
+@app.route('/expenses/delete-category/<int:category_id>', methods=['POST'])
+def delete_category_expenses(category_id):
+    store_id = current_store()
     with db() as conn:
         c = conn.cursor()
-        c.execute("DELETE FROM expenses WHERE category=%s", (category,))
+        c.execute("DELETE FROM expenses WHERE store_id=%s AND category_id=%s RETURNING date",
+                  (store_id, category_id))
+        reclose_periods(c, [r['date'] for r in c.fetchall()], store_id)
+        bump_versions(c, 'expenses', store_id=store_id)
     return redirect(url_for('dashboard'))
 
 
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+Microfauna — archive_transactions.py
+Moves closed months of sales, sale_items and expenses out of the hot
+tables into compressed files on local disk.
+
+Run from your project root (DATABASE_URL must be set):
+    python3 archive_transactions.py run        # archive months older than the horizon
+    python3 archive_transactions.py run 12     # ...or older than 12 months
+    python3 archive_transactions.py list       # show the manifest
+
+The horizon defaults to ARCHIVE_HORIZON_MONTHS (24). Only months that are
+closed in period_snapshots are archived, so the monthly charts keep their
+numbers. Each month is one transaction: its rows are written to
+ARCHIVE_DIR/<YYYY-MM>/<table>.<stamp>.csv.gz (or .parquet when pyarrow is
+installed), per-day rollups are added to archived_totals — which the
+item, category, customer and analytics queries union in — and the rows
+are deleted. manifest.json records every file with its row count, id
+range and sha256; app.py reads archived rows back through it for receipt
+lookups and /archive/export/<table>.
+"""
+import csv, gzip, hashlib, json, os, sys
+from datetime import datetime, timedelta
+
+from app import (db, db_read, bump_versions, load_archive_manifest,
+                 ARCHIVE_DIR, ARCHIVE_MANIFEST)
+
+try:
+    import pyarrow
+    import pyarrow.parquet as pq
+except ImportError:
+    pyarrow = None
+
+ARCHIVE_HORIZON_MONTHS = int(os.environ.get('ARCHIVE_HORIZON_MONTHS', 24))
+
+# table -> date column; sale_items carries its sale's date (see init_db)
+DATE_COLUMNS = {'sales': 'date', 'sale_items': 'sale_date', 'expenses': 'date'}
+
+# One pass per source table over the month being archived, rolled up per store
+STUBS_SQL = """
+    INSERT INTO archived_totals (store_id, day, kind, key, quantity, amount, txns)
+    SELECT store_id, date, 'sales', '', 0, SUM(total), COUNT(*)
+      FROM sales WHERE date >= %(lo)s AND date < %(hi)s GROUP BY store_id, date
+    UNION ALL
+    SELECT store_id, date, 'customer', customer_id::text, 0, SUM(total), COUNT(*)
+      FROM sales WHERE date >= %(lo)s AND date < %(hi)s AND customer_id IS NOT NULL
+      GROUP BY store_id, date, customer_id
+    UNION ALL
+    SELECT store_id, sale_date, 'item', COALESCE(item_name, ''), SUM(quantity), SUM(subtotal), COUNT(DISTINCT sale_id)
+      FROM sale_items WHERE sale_date >= %(lo)s AND sale_date < %(hi)s GROUP BY store_id, sale_date, item_name
+    UNION ALL
+    SELECT store_id, date, 'expense', category, 0, SUM(amount), COUNT(*)
+      FROM expenses WHERE date >= %(lo)s AND date < %(hi)s GROUP BY store_id, date, category
+    ON CONFLICT (store_id, kind, day, key) DO UPDATE SET
+        quantity = archived_totals.quantity + EXCLUDED.quantity,
+        amount   = archived_totals.amount + EXCLUDED.amount,
+        txns     = archived_totals.txns + EXCLUDED.txns
+"""
+
+
+def _write_file(path, columns, rows):
+    """Write rows to path + extension; returns the name relative to ARCHIVE_DIR and its sha256."""
+    if pyarrow:
+        path += '.parquet'
+        table = pyarrow.Table.from_pylist([dict(r) for r in rows]) if rows else \
+            pyarrow.table({col: [] for col in columns})
+        pq.write_table(table, path + '.tmp', compression='zstd')
+    else:
+        path += '.csv.gz'
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8', newline='', compresslevel=9) as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for r in rows:
+                writer.writerow(['' if r[col] is None else r[col] for col in columns])
+    os.replace(path + '.tmp', path)
+    with open(path, 'rb') as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    return os.path.relpath(path, ARCHIVE_DIR), digest
+
+
+def _save_manifest(manifest):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    with open(ARCHIVE_MANIFEST + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(ARCHIVE_MANIFEST + '.tmp', ARCHIVE_MANIFEST)
+
+
+def archive_month(month):
+    lo = month
+    hi = (month + timedelta(days=32)).replace(day=1)
+    stamp = datetime.now().strftime('%Y%m%dT%H%M%S')
+    folder = os.path.join(ARCHIVE_DIR, f"{month:%Y-%m}")
+    os.makedirs(folder, exist_ok=True)
+
+    previous = load_archive_manifest()
+    batch = {'month': f"{month:%Y-%m}", 'archived_at': stamp, 'tables': {}}
+    try:
+        with db() as conn:
+            c = conn.cursor()
+            for table, col in DATE_COLUMNS.items():
+                # FOR UPDATE: a concurrent edit can't slip in between export and delete
+                c.execute(f"SELECT * FROM {table} WHERE {col} >= %s AND {col} < %s ORDER BY id FOR UPDATE",
+                          (lo, hi))
+                rows = c.fetchall()
+                columns = [d[0] for d in c.description]
+                name, digest = _write_file(os.path.join(folder, f"{table}.{stamp}"), columns, rows)
+                batch['tables'][table] = {
+                    'file': name, 'rows': len(rows), 'sha256': digest,
+                    'min_id': rows[0]['id'] if rows else None,
+                    'max_id': rows[-1]['id'] if rows else None,
+                }
+
+            c.execute(STUBS_SQL, {'lo': lo, 'hi': hi})
+            # Archiving isn't a business delete: keep it out of the change feed
+            # so mirrors retain the rows
+            c.execute("SET LOCAL microfauna.skip_changes = 'on'")
+            # Children first; sale_items references sales
+            for table in ('sale_items', 'sales', 'expenses'):
+                col = DATE_COLUMNS[table]
+                c.execute(f"DELETE FROM {table} WHERE {col} >= %s AND {col} < %s", (lo, hi))
+            bump_versions(c, 'sales', 'expenses')
+
+            # Recorded before the commit so a crash never leaves deleted rows
+            # without a manifest entry; rolled back below if the commit fails.
+            _save_manifest({'batches': previous['batches'] + [batch]})
+    except Exception:
+        _save_manifest(previous)
+        raise
+    return batch
+
+
+def run(horizon):
+    # Keep the current month plus `horizon` full months before it
+    cutoff = datetime.now().date().replace(day=1)
+    for _ in range(horizon):
+        cutoff = (cutoff - timedelta(days=1)).replace(day=1)
+
+    with db_read() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT DISTINCT date_trunc('month', d::timestamp)::date AS month FROM (
+                         SELECT date AS d FROM sales WHERE date < %(cutoff)s
+                         UNION SELECT date FROM expenses WHERE date < %(cutoff)s) x
+                     ORDER BY month""", {'cutoff': cutoff})
+        candidates = [r['month'] for r in c.fetchall()]
+        c.execute("SELECT DISTINCT month FROM period_snapshots WHERE month = ANY(%s::date[])",
+                  ([str(m) for m in candidates],))
+        closed = {r['month'] for r in c.fetchall()}
+
+    if not candidates:
+        print(f"  —  nothing older than {cutoff:%Y-%m} to archive")
+        return 0
+
+    skipped = 0
+    for month in candidates:
+        if month not in closed:
+            print(f"    ✗  {month:%Y-%m} is not closed; close it first (POST /periods/close)")
+            skipped += 1
+            continue
+        batch = archive_month(month)
+        counts = ', '.join(f"{t} {e['rows']}" for t, e in batch['tables'].items())
+        print(f"    ✓  {month:%Y-%m} archived ({counts})")
+    print(f"\n  Archive written to {ARCHIVE_DIR}")
+    return 1 if skipped else 0
+
+
+def show():
+    batches = load_archive_manifest()['batches']
+    if not batches:
+        print("  —  nothing archived yet")
+        return
+    for batch in batches:
+        counts = ', '.join(f"{t} {e['rows']}" for t, e in batch['tables'].items())
+        print(f"    {batch['month']}  ({batch['archived_at']})  {counts}")
+
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ''
+    if cmd == 'run' and len(sys.argv) <= 3:
+        sys.exit(run(int(sys.argv[2]) if len(sys.argv) == 3 else ARCHIVE_HORIZON_MONTHS))
+    elif cmd == 'list':
+        show()
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Microfauna — build_assets.py
+Minifies, fingerprints and precompresses the files the templates load
+from static/.
+
+Run from your project root whenever a file in ASSETS changes:
+    python3 build_assets.py           # rebuild static/dist
+    python3 build_assets.py --check   # exit 1 if static/dist is out of date
+
+Writes static/dist/<name>.<hash>.<ext> (plus .gz, and .br when the
+`brotli` package is installed) and static/dist/manifest.json. Templates
+reference assets through asset('style.css') etc.; without a manifest
+they fall back to the plain /static files, so development needs no build.
+
+static/dist is committed: the @vercel/python build in vercel.json only
+packages the repo and runs no build step, so what is committed is what
+gets served. Commit static/dist together with the asset change, and run
+--check before deploying.
+"""
+import gzip, hashlib, json, os, shutil, sys
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+STATIC   = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST     = os.path.join(STATIC, 'dist')
+MANIFEST = os.path.join(DIST, 'manifest.json')
+
+ASSETS = [
+    'style.css',
+    'theme.js',
+    'receipt.js',
+    'click-guard.js',
+    'js/dashboard.js',
+    'js/add_sale.js',
+    'logo.png',
+    'gcash-qr.png',
+]
+COMPRESSIBLE = ('.css', '.js')
+
+
+# ── Minifiers ─────────────────────────────────────────────────────────────────
+# rjsmin/rcssmin (requirements.txt). Without them files are copied as they
+# are: anything short of a real tokenizer can mangle strings and template
+# literals, and gzip/brotli recover most of the difference anyway.
+
+def minify_js(src):
+    return rjsmin.jsmin(src) if rjsmin else src
+
+def minify_css(src):
+    return rcssmin.cssmin(src) if rcssmin else src
+
+
+# ── Build ─────────────────────────────────────────────────────────────────────
+
+def render(name):
+    """(hashed name, minified bytes) of one asset."""
+    with open(os.path.join(STATIC, name), 'rb') as f:
+        data = f.read()
+    root, ext = os.path.splitext(name)
+    if ext == '.js':
+        data = minify_js(data.decode('utf-8')).encode('utf-8')
+    elif ext == '.css':
+        data = minify_css(data.decode('utf-8')).encode('utf-8')
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    return f"{root}.{digest}{ext}", data
+
+
+def build_one(name):
+    hashed, data = render(name)
+    ext = os.path.splitext(name)[1]
+    target = os.path.join(DIST, hashed)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, 'wb') as f:
+        f.write(data)
+
+    sizes = [len(data)]
+    if ext in COMPRESSIBLE:
+        # mtime=0 keeps the .gz byte-identical across builds
+        gz = gzip.compress(data, compresslevel=9, mtime=0)
+        with open(target + '.gz', 'wb') as f:
+            f.write(gz)
+        sizes.append(len(gz))
+        if brotli:
+            br = brotli.compress(data, quality=11)
+            with open(target + '.br', 'wb') as f:
+                f.write(br)
+            sizes.append(len(br))
+    return hashed, sizes
+
+
+def check():
+    """Exit status 1 when static/dist doesn't match a fresh build of ASSETS."""
+    try:
+        with open(MANIFEST, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        print(f"    ✗  {MANIFEST} missing — run build_assets.py")
+        return 1
+    stale = 0
+    for name in ASSETS:
+        if not os.path.exists(os.path.join(STATIC, name)):
+            continue
+        hashed = render(name)[0]
+        if manifest.get(name) != hashed or not os.path.isfile(os.path.join(DIST, hashed)):
+            print(f"    ✗  {name} changed since the last build")
+            stale += 1
+    if stale:
+        print(f"\n  {stale} asset(s) out of date — run build_assets.py and commit static/dist")
+        return 1
+    print("    ✓  static/dist is up to date")
+    return 0
+
+
+def main():
+    if os.path.isdir(DIST):
+        shutil.rmtree(DIST)
+    os.makedirs(DIST)
+
+    manifest = {}
+    for name in ASSETS:
+        if not os.path.exists(os.path.join(STATIC, name)):
+            print(f"    —  {name} not found, skipped")
+            continue
+        hashed, sizes = build_one(name)
+        manifest[name] = hashed
+        print(f"    ✓  {name} → dist/{hashed}  ({' / '.join(str(s) for s in sizes)} bytes)")
+
+    with open(MANIFEST, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if not brotli:
+        print("    (brotli not installed — only .gz variants written)")
+    if not (rjsmin and rcssmin):
+        print("    (rjsmin/rcssmin not installed — .js/.css copied unminified)")
+    print(f"\n  Wrote {len(manifest)} assets to {DIST}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--check']:
+        sys.exit(check())
+    if sys.argv[1:]:
+        print(__doc__)
+        sys.exit(2)
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Microfauna — partition_tables.py
+Opt-in migration of sales, sale_items and expenses to monthly range
+partitions, plus tools to verify pruning and to detach old months.
+
+Run from your project root (DATABASE_URL must be set):
+    python3 partition_tables.py migrate          # convert the three tables
+    python3 partition_tables.py check            # EXPLAIN the analytics queries
+    python3 partition_tables.py detach 2023-01   # detach a closed month
+
+migrate runs in a single transaction: the old tables are renamed, new
+partitioned parents are created with the same columns, one partition per
+month of existing data (plus PARTITION_MONTHS_AHEAD future months and a
+DEFAULT partition) is created, rows are copied and the old tables are
+dropped. Any error rolls the whole thing back. Indexes are recreated on
+the parents by init_db(), so every partition gets them. On tables that are
+already partitioned, migrate adds any LAYOUT foreign key the parents
+lack and gives every month with rows in a DEFAULT partition its own
+partition, moving the rows there; check reports both.
+
+Partitioned tables need the partition key in every unique constraint, so
+the primary keys become (id, date) / (id, sale_date), and sale_items
+references sales by (sale_id, sale_date) with ON UPDATE CASCADE, which
+carries a sale's date change to its line items. That needs PostgreSQL 15
+or later: before 15, moving a row to another partition was a DELETE plus
+an INSERT, so the FK's ON DELETE CASCADE removed the sale's line items.
+migrate refuses to run on an older server and check reports one.
+
+detach writes the month's per-day rollups to archived_totals (the same
+stubs archive_transactions.py writes) in the transaction that detaches
+its partitions, so the item, category, customer and analytics queries
+keep counting the month once its rows are gone from the parents.
+"""
+import json, re, sys
+from datetime import datetime, timedelta
+
+from app import db, db_read, init_db, bump_versions, ensure_partitions, PARTITIONED_TABLES
+from archive_transactions import STUBS_SQL
+
+# Cross-partition UPDATEs fire ON UPDATE CASCADE from PostgreSQL 15 on
+MIN_SERVER_VERSION = 150000
+
+# table -> (partition key, primary key, extra DDL run after the parent exists)
+LAYOUT = {
+    'sales': ('date', '(id, date)', [
+        "ALTER TABLE sales ADD FOREIGN KEY (customer_id) REFERENCES customers(id)",
+        "ALTER TABLE sales ADD FOREIGN KEY (store_id) REFERENCES stores(id)",
+    ]),
+    'sale_items': ('sale_date', '(id, sale_date)', [
+        """ALTER TABLE sale_items ADD FOREIGN KEY (sale_id, sale_date)
+           REFERENCES sales(id, date) ON DELETE CASCADE ON UPDATE CASCADE""",
+        "ALTER TABLE sale_items ADD FOREIGN KEY (store_id) REFERENCES stores(id)",
+    ]),
+    'expenses': ('date', '(id, date)', [
+        "ALTER TABLE expenses ADD FOREIGN KEY (store_id) REFERENCES stores(id)",
+        "ALTER TABLE expenses ADD FOREIGN KEY (category_id) REFERENCES expense_categories(id)",
+    ]),
+}
+
+# Queries shaped like the date-filtered ones in app.py (which all run
+# within one store); each should touch only the partitions its date range
+# covers.
+CHECKS = {
+    'analytics daily (30d)': (
+        """SELECT date, SUM(total) FROM sales
+           WHERE store_id = 1 AND date BETWEEN CURRENT_DATE - 30 AND CURRENT_DATE GROUP BY date""", ()),
+    # app.py passes open_period_start() in as a parameter; a scalar subquery
+    # gets the same run-time pruning, a join against a CTE would get none
+    'open-period revenue': (
+        """SELECT SUM(total) FROM sales WHERE store_id = 1 AND date >= (
+               SELECT COALESCE((MAX(month) + INTERVAL '1 month')::date, '-infinity'::date)
+               FROM period_snapshots)""", ()),
+    'open-period expenses': (
+        """SELECT SUM(amount) FROM expenses WHERE store_id = 1 AND date >= (
+               SELECT COALESCE((MAX(month) + INTERVAL '1 month')::date, '-infinity'::date)
+               FROM period_snapshots)""", ()),
+    'analytics monthly (12m)': (
+        """SELECT date_trunc('month', date::timestamp), SUM(amount) FROM expenses
+           WHERE store_id = 1 AND date BETWEEN CURRENT_DATE - 365 AND CURRENT_DATE GROUP BY 1""", ()),
+    'receipt line items': (
+        """SELECT * FROM sale_items WHERE sale_id = 1 AND sale_date = CURRENT_DATE""", ()),
+}
+
+
+def missing_foreign_keys(c):
+    """[(table, columns, referenced table, DDL)] for the LAYOUT foreign keys the parents don't have."""
+    c.execute("""SELECT cl.relname AS tbl, rf.relname AS ref,
+                        (SELECT string_agg(a.attname, ', ' ORDER BY k.n)
+                         FROM unnest(co.conkey) WITH ORDINALITY k(attnum, n)
+                         JOIN pg_attribute a ON a.attrelid = co.conrelid AND a.attnum = k.attnum) AS cols
+                 FROM pg_constraint co
+                 JOIN pg_class cl ON cl.oid = co.conrelid
+                 JOIN pg_class rf ON rf.oid = co.confrelid
+                 WHERE co.contype = 'f' AND co.conparentid = 0 AND cl.relname = ANY(%s)""",
+              (list(PARTITIONED_TABLES),))
+    present = {(r['tbl'], r['cols'], r['ref']) for r in c.fetchall()}
+    missing = []
+    for table, (_, _, extra) in LAYOUT.items():
+        for ddl in extra:
+            m = re.search(r'FOREIGN KEY \(([^)]+)\)\s+REFERENCES (\w+)', ddl)
+            if m and (table, m.group(1), m.group(2)) not in present:
+                missing.append((table, m.group(1), m.group(2), ddl))
+    return missing
+
+
+def default_range(c):
+    """(first, last) partition key in the DEFAULT partitions, or (None, None) when they're empty."""
+    c.execute(" UNION ALL ".join(
+        f"SELECT MIN({LAYOUT[t][0]}) AS first, MAX({LAYOUT[t][0]}) AS last FROM {t}_default"
+        for t in PARTITIONED_TABLES))
+    rows = [r for r in c.fetchall() if r['first']]
+    if not rows:
+        return None, None
+    return min(r['first'] for r in rows), max(r['last'] for r in rows)
+
+
+def server_too_old(c):
+    """The server's version string when it predates MIN_SERVER_VERSION, else None."""
+    c.execute("SELECT current_setting('server_version_num')::int AS num, current_setting('server_version') AS v")
+    r = c.fetchone()
+    return r['v'] if r['num'] < MIN_SERVER_VERSION else None
+
+
+def is_partitioned(c, table):
+    c.execute("""SELECT 1 FROM pg_partitioned_table pt JOIN pg_class cl ON cl.oid = pt.partrelid
+                 WHERE cl.relname = %s""", (table,))
+    return c.fetchone() is not None
+
+
+def migrate():
+    with db() as conn:
+        c = conn.cursor()
+        version = server_too_old(c)
+        if version:
+            print(f"  ✗  PostgreSQL {version}: partitioning needs 15 or later, or editing a "
+                  f"sale's date would delete its line items")
+            return 1
+        todo = [t for t in PARTITIONED_TABLES if not is_partitioned(c, t)]
+        if not todo:
+            print("  —  all tables already partitioned")
+            # Parents partitioned before a LAYOUT foreign key was added
+            for table, cols, ref, ddl in missing_foreign_keys(c):
+                c.execute(ddl)
+                print(f"    ✓  {table} ({cols}) → {ref} foreign key added")
+            first, last = default_range(c)
+            if first:
+                created = ensure_partitions(c, start=first, end=last)
+                print(f"    ✓  {len(created)} monthly partitions created for rows in the default partitions")
+            return 0
+
+        c.execute("""SELECT LEAST((SELECT MIN(date) FROM sales), (SELECT MIN(date) FROM expenses)) AS first,
+                            GREATEST((SELECT MAX(date) FROM sales), (SELECT MAX(date) FROM expenses)) AS last""")
+        bounds = c.fetchone()
+        first = bounds['first'] or datetime.now().date()
+
+        # Children first so their FKs to the old parents go with them
+        for table in ('sale_items', 'sales', 'expenses'):
+            if table not in todo:
+                continue
+            c.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY NONE")
+            c.execute(f"ALTER TABLE {table} RENAME TO {table}_unpartitioned")
+            # Frees the {table}_pkey index name for the new parent
+            c.execute(f"ALTER TABLE {table}_unpartitioned RENAME CONSTRAINT {table}_pkey TO {table}_unpartitioned_pkey")
+
+        for table in ('sales', 'sale_items', 'expenses'):
+            if table not in todo:
+                continue
+            key, pk, extra = LAYOUT[table]
+            c.execute(f"""CREATE TABLE {table} (LIKE {table}_unpartitioned INCLUDING DEFAULTS)
+                          PARTITION BY RANGE ({key})""")
+            c.execute(f"ALTER TABLE {table} ALTER COLUMN {key} SET NOT NULL")
+            c.execute(f"ALTER TABLE {table} ADD PRIMARY KEY {pk}")
+            c.execute(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT")
+            for ddl in extra:
+                c.execute(ddl)
+            print(f"    ✓  {table} → partitioned by {key}")
+
+        created = ensure_partitions(c, start=first, end=bounds['last'])
+        print(f"    ✓  {len(created)} monthly partitions created")
+
+        for table in ('sales', 'sale_items', 'expenses'):
+            if table not in todo:
+                continue
+            key = LAYOUT[table][0]
+            c.execute(f"INSERT INTO {table} SELECT * FROM {table}_unpartitioned WHERE {key} IS NOT NULL")
+            print(f"    ✓  {table}: {c.rowcount} rows copied")
+
+        for table in ('sale_items', 'sales', 'expenses'):
+            if table in todo:
+                c.execute(f"DROP TABLE {table}_unpartitioned")
+                c.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+
+    # Recreate the app's indexes on the new parents (cascades to partitions)
+    init_db()
+    print("\n  Migration complete.")
+    return 0
+
+
+def _scanned(plan, found):
+    """Collect (relation, executed?) for every scan node in an EXPLAIN tree."""
+    if 'Relation Name' in plan:
+        found.append((plan['Relation Name'], plan.get('Actual Loops', 1) > 0))
+    for child in plan.get('Plans', []):
+        _scanned(child, found)
+    return found
+
+
+def check():
+    with db_read() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT parent.relname AS parent, COUNT(*) AS n FROM pg_inherits i
+                     JOIN pg_class parent ON parent.oid = i.inhparent
+                     WHERE parent.relname = ANY(%s) GROUP BY parent.relname""",
+                  (list(PARTITIONED_TABLES),))
+        totals = {r['parent']: r['n'] for r in c.fetchall()}
+        if not totals:
+            print("  —  tables are not partitioned; run `migrate` first")
+            return 1
+
+        failed = 0
+        for label, (sql, params) in CHECKS.items():
+            c.execute("EXPLAIN (ANALYZE, FORMAT JSON) " + sql, params)
+            plan = c.fetchone()['QUERY PLAN']
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            scans = _scanned(plan[0]['Plan'], [])
+            executed = sorted({rel for rel, ran in scans
+                               if ran and rel.rsplit('_', 1)[0] in totals})
+            parents = {rel.rsplit('_', 1)[0] for rel in executed}
+            pruned = all(len([r for r in executed if r.startswith(p + '_')]) < totals.get(p, 0)
+                         for p in parents)
+            failed += not pruned
+            mark = '✓' if pruned else '✗'
+            print(f"    {mark}  {label}: {len(executed)} partition(s) scanned — {', '.join(executed) or 'none'}")
+
+        # Rows here make CREATE TABLE ... PARTITION OF fail for their month
+        for table in PARTITIONED_TABLES:
+            key = LAYOUT[table][0]
+            c.execute(f"SELECT COUNT(*) AS n, MIN({key}) AS first, MAX({key}) AS last FROM {table}_default")
+            r = c.fetchone()
+            if r['n']:
+                failed += 1
+                print(f"    ✗  {table}_default: {r['n']} row(s) from {r['first']} to {r['last']}; "
+                      f"run `migrate` to move them into monthly partitions")
+            else:
+                print(f"    ✓  {table}_default: empty")
+
+        for table, cols, ref, _ in missing_foreign_keys(c):
+            failed += 1
+            print(f"    ✗  {table} ({cols}) → {ref}: foreign key missing; run `migrate` to add it")
+
+        version = server_too_old(c)
+        if version:
+            failed += 1
+            print(f"    ✗  PostgreSQL {version}: moving a sale to another month deletes its line "
+                  f"items before 15; upgrade the server")
+        return 1 if failed else 0
+
+
+def detach(month):
+    month = datetime.strptime(month, '%Y-%m').date()
+    suffix = f"{month:%Y%m}"
+    with db() as conn:
+        c = conn.cursor()
+        # Charts and totals keep working only if the month is in period_snapshots
+        c.execute("SELECT 1 FROM period_snapshots WHERE month=%s LIMIT 1", (month,))
+        if not c.fetchone():
+            print(f"  ✗  {month:%Y-%m} is not closed; close it first (POST /periods/close)")
+            return 1
+        # Queries that read the raw rows plus archived_totals need the
+        # month's rollups once its partitions leave the parents. A month
+        # archive_transactions.py already emptied adds nothing here.
+        hi = (month + timedelta(days=32)).replace(day=1)
+        c.execute(STUBS_SQL, {'lo': month, 'hi': hi})
+        print(f"    ✓  {c.rowcount} archived_totals rows written for {month:%Y-%m}")
+        # sale_items first: it references the sales partition being detached
+        for table in ('sale_items', 'sales', 'expenses'):
+            c.execute(f"ALTER TABLE {table} DETACH PARTITION {table}_{suffix}")
+            print(f"    ✓  detached {table}_{suffix}")
+            if table == 'sale_items':
+                # A detached partition keeps its own copy of the FK to sales,
+                # which would block detaching the sales month next. Only the
+                # top-level one: dropping it drops its per-partition clones.
+                c.execute("""SELECT conname FROM pg_constraint
+                             WHERE conrelid = %s::regclass AND contype = 'f' AND conparentid = 0""",
+                          (f"sale_items_{suffix}",))
+                for r in c.fetchall():
+                    c.execute(f'ALTER TABLE sale_items_{suffix} DROP CONSTRAINT "{r["conname"]}"')
+        bump_versions(c, 'sales', 'expenses')
+    print("\n  Detached tables are left in place; archive or DROP them when ready.")
+    return 0
+
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ''
+    if cmd == 'migrate':
+        sys.exit(migrate())
+    elif cmd == 'check':
+        sys.exit(check())
+    elif cmd == 'detach' and len(sys.argv) == 3:
+        sys.exit(detach(sys.argv[2]))
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,463 @@
+#!/usr/bin/env python3
+"""
+Microfauna — plan_check.py
+Query-plan regression check for the SQL app.py's routes run.
+
+Run from your project root (PostgreSQL server binaries must be installed;
+set PG_BIN to their directory if initdb isn't on PATH):
+    python3 plan_check.py run       # compare against plan_baselines.json
+    python3 plan_check.py record    # rewrite plan_baselines.json
+
+A throwaway cluster is created with initdb in a temp dir, init_db() builds
+the schema and a deterministic dataset of PLAN_CHECK_SALES sales (default
+50000) is generated with dates relative to today, so the date-window
+queries always see the same shape. Sales and expenses alternate between
+PLAN_CHECK_STORES stores (default 2) and the routes run in the default
+store, so a query that stops using its store_id index shows up here. The
+oldest ARCHIVE_MONTHS months are archived with archive_transactions.py,
+so archived_totals and the archive files hold real data. Every route in
+ROUTES is then requested once through the Flask test client while
+auto_explain logs EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) for each
+statement it issues.
+
+Each statement is checked on its own, by both commands:
+    - no Seq Scan on a LARGE_TABLES table, unless SEQ_SCAN_OK lists the
+      route and table with the reason it's the right plan
+    - no node's row estimate off by more than ESTIMATE_FACTOR; nodes
+      under a Limit stop early, so their over-estimates don't count
+and then against its baseline:
+    - shared buffers and duration within BUFFER_FACTOR / TIME_FACTOR of it
+Failures print the plan outline as a diff against the baseline. A route
+whose statements raise an error in the server log fails both commands, so
+a broken request can't be recorded as its baseline. After an intended plan
+change, run `record` and commit plan_baselines.json.
+"""
+import csv, datetime, difflib, glob, hashlib, json, os, re, shutil, subprocess, sys, tempfile, time
+from collections import Counter
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plan_baselines.json')
+SALES     = int(os.environ.get('PLAN_CHECK_SALES', 50000))
+STORES    = max(int(os.environ.get('PLAN_CHECK_STORES', 2)), 1)
+CUSTOMERS = max(SALES // 25, 10)
+EXPENSES  = max(SALES // 5, 10)
+DAYS      = 3 * 365
+
+# Partitions (sales_202401, sales_default) count as their parent
+LARGE_TABLES    = {'sales', 'sale_items', 'expenses', 'customers', 'stock_movements',
+                   'changes', 'archived_totals'}
+ESTIMATE_FACTOR = 100
+BUFFER_FACTOR   = 1.5
+BUFFER_SLACK    = 50     # blocks
+TIME_FACTOR     = 3
+TIME_SLACK_MS   = 5
+
+# Sales the routes below read and write: ids that land in the default store
+EDIT_SALE   = 1000 // STORES * STORES
+DELETE_SALE = 2000 // STORES * STORES
+# Expenses alternate stores the same way; categories are numbered in seed order
+EDIT_EXPENSE    = 100 // STORES * STORES
+DELETE_EXPENSE  = 200 // STORES * STORES
+DELETE_CATEGORY = 4   # Marketing
+# Months archived by seed(): the oldest ones, so archive-merge queries read real rollups
+ARCHIVE_MONTHS  = 6
+TODAY       = datetime.date.today().isoformat()
+
+# (label, method, url, form or JSON body). Reads first; the writes at the
+# end change data, so the order is part of the baseline.
+ROUTES = [
+    ('dashboard',            'GET',  '/', None),
+    ('dashboard fragments',  'GET',  '/api/dashboard/fragments?tables=sales,expenses', None),
+    ('monthly sales',        'GET',  '/api/charts/monthly-sales', None),
+    ('item sales',           'GET',  '/api/charts/item-sales', None),
+    ('expense breakdown',    'GET',  '/api/charts/expense-breakdown', None),
+    ('monthly comparison',   'GET',  '/api/charts/monthly-comparison', None),
+    ('periods',              'GET',  '/api/periods', None),
+    ('stores summary',       'GET',  '/api/stores/summary', None),
+    ('analytics daily',      'GET',  '/api/analytics/daily', None),
+    ('analytics weekly',     'GET',  '/api/analytics/weekly', None),
+    ('analytics monthly',    'GET',  '/api/analytics/monthly', None),
+    ('analytics yearly',     'GET',  '/api/analytics/yearly', None),
+    ('analytics custom',     'GET',  '/api/analytics?granularity=week&metrics=revenue,txns,expenses,profit', None),
+    ('forecast',             'GET',  '/api/forecast', None),
+    ('baskets',              'GET',  '/api/analytics/baskets?item=Culture 3', None),
+    ('changes',              'GET',  '/api/changes?limit=500', None),
+    ('receipt',              'GET',  f'/sales/{EDIT_SALE}/receipt', None),
+    ('sales',                'GET',  '/sales', None),
+    ('sales search',         'GET',  '/sales?search=Customer 12', None),
+    ('customer suggest',     'GET',  '/api/customers/suggest?q=customer 12', None),
+    ('top customers',        'GET',  '/api/customers/top', None),
+    ('versions',             'GET',  '/api/versions', None),
+    ('customer sales',       'GET',  '/api/customers/5/sales', None),
+    ('items',                'GET',  '/items', None),
+    ('low stock',            'GET',  '/api/stock/low', None),
+    ('expenses',             'GET',  '/expenses', None),
+    ('expenses by category', 'GET',  '/expenses?category=Shipping', None),
+    ('expenses search',      'GET',  '/expenses?search=Expense 12', None),
+    ('edit sale form',       'GET',  f'/sales/edit/{EDIT_SALE}', None),
+    ('add sale',             'POST', '/add-sale', {'customer_name': 'Customer 7', 'date': '', 'discount': '0',
+                                                   'item_id': ['1', '2'], 'quantity': ['2', '1']}),
+    ('batch sales',          'JSON', '/api/sales/batch', {'sales': [
+        {'customer_name': 'Customer 8', 'items': [{'item_id': 1, 'quantity': 1}]},
+        {'customer_name': 'Customer 9', 'items': [{'item_id': 3, 'quantity': 2}], 'discount': 10}]}),
+    ('edit sale',            'POST', f'/sales/edit/{EDIT_SALE}', {'customer_name': 'Customer 11', 'date': TODAY,
+                                                          'discount': '0', 'version': '1',
+                                                          'item_id': ['1', '3'], 'quantity': ['1', '4']}),
+    ('add expense',          'POST', '/expenses/add', {'description': 'Substrate', 'amount': '350',
+                                                       'category': 'Supplies', 'date': '', 'notes': ''}),
+    ('delete sale',          'POST', f'/sales/delete/{DELETE_SALE}', None),
+    ('edit expense',         'POST', f'/expenses/edit/{EDIT_EXPENSE}', {'description': 'Shipping crate', 'amount': '420',
+                                                                    'category': 'Shipping', 'date': TODAY, 'notes': ''}),
+    ('delete expense',       'POST', f'/expenses/delete/{DELETE_EXPENSE}', None),
+    ('delete category',      'POST', f'/expenses/delete-category/{DELETE_CATEGORY}', None),
+    ('add item',             'POST', '/items/add', {'name': 'Culture 99', 'price': '180'}),
+    ('edit item',            'POST', '/items/edit/6', {'name': 'Culture 2', 'price': '95'}),
+    ('stock item',           'POST', '/items/stock/7', {'qty': '25', 'reason': 'restock', 'reorder_level': '15'}),
+    ('toggle item',          'POST', '/items/toggle/8', None),
+    ('delete item',          'POST', '/items/delete/9', None),
+    ('reorder items',        'JSON', '/items/reorder', {'ids': list(range(44, 0, -1))}),
+    ('delete item sales',    'POST', '/sales/delete-item/Culture 10', None),
+    ('close periods',        'POST', '/periods/close', None),
+    ('archive export',       'GET',  '/archive/export/sale_items', None),
+]
+
+# Seq scans on LARGE_TABLES that are the right plan: (route, table) -> why.
+# Any other seq scan on them fails, whatever the baseline recorded.
+_WHOLE_STORE = "totals over every sale or expense the store has, live and archived"
+SEQ_SCAN_OK = {
+    ('dashboard', 'sale_items'):             _WHOLE_STORE,
+    ('dashboard', 'archived_totals'):        _WHOLE_STORE,
+    ('dashboard', 'expenses'):               _WHOLE_STORE,
+    ('item sales', 'sale_items'):            _WHOLE_STORE,
+    ('item sales', 'archived_totals'):       _WHOLE_STORE,
+    ('expense breakdown', 'expenses'):       _WHOLE_STORE,
+    ('analytics yearly', 'sales'):           _WHOLE_STORE,
+    # The category totals above the list cover every expense; the search is a
+    # substring ILIKE, which no btree index serves
+    ('expenses', 'expenses'):                _WHOLE_STORE,
+    ('expenses by category', 'expenses'):    _WHOLE_STORE,
+    ('expenses search', 'expenses'):         "substring ILIKE; category totals cover every expense",
+    # /sales lists every sale in the store, unpaginated, with its line items
+    ('sales', 'sales'):                      "the listing is every sale in the store",
+    ('sales', 'sale_items'):                 "line items of every sale in the store",
+    ('sales search', 'sales'):               "substring ILIKE on customer_name",
+    ('top customers', 'customers'):          "one row per customer; an index on lifetime_revenue would "
+                                             "cost every checkout a non-HOT update",
+    # Removing an item from every sale touches a large share of the store's
+    # sales, all of their customers and most closed months
+    ('delete item sales', 'sales'):          "recomputes the totals of every sale the item was in",
+    ('delete item sales', 'sale_items'):     "recomputes the totals of every sale the item was in",
+    ('delete item sales', 'customers'):      "refreshes every customer who bought the item",
+    ('delete item sales', 'archived_totals'): "refreshes every customer who bought the item",
+    # Both re-close every closed month the change reaches
+    ('delete item sales', 'expenses'):       "re-closes every closed month",
+    ('delete category', 'sales'):            "re-closes every closed month",
+    ('delete category', 'expenses'):         "re-closes every closed month",
+}
+
+SEED_SQL = [
+    """INSERT INTO stores (name) SELECT 'Store ' || g FROM generate_series(2, %(stores)s) g
+       ON CONFLICT (name) DO NOTHING""",
+    """INSERT INTO items (store_id, name, price, active, sort_order, on_hand, reorder_level)
+       SELECT st.id, 'Culture ' || g, 50 + (g * 37) %% 400, g %% 10 <> 0, 100 + g, (g * 13) %% 200, 20
+       FROM stores st CROSS JOIN generate_series(1, 40) g
+       ORDER BY st.id, g
+       ON CONFLICT (store_id, name) DO NOTHING""",
+    """INSERT INTO customers (name) SELECT 'Customer ' || g FROM generate_series(1, %(customers)s) g
+       ON CONFLICT ((lower(name))) DO NOTHING""",
+    """INSERT INTO sales (store_id, customer_name, customer_id, date, total, discount)
+       SELECT 1 + g %% %(stores)s, cu.name, cu.id, CURRENT_DATE - (g * 7) %% %(days)s, 0,
+              CASE WHEN g %% 10 = 0 THEN 20 ELSE 0 END
+       FROM generate_series(1, %(sales)s) g
+       JOIN customers cu ON cu.name = 'Customer ' || (1 + (g * 7919) %% %(customers)s)
+       ORDER BY g""",
+    """WITH it AS (SELECT row_number() OVER (ORDER BY id) - 1 AS n, name, price FROM items WHERE store_id = 1),
+            cnt AS (SELECT COUNT(*) AS n FROM it)
+       INSERT INTO sale_items (store_id, sale_id, sale_date, item_name, quantity, price, subtotal)
+       SELECT s.store_id, s.id, s.date, it.name, 1 + (s.id + k) %% 4, it.price, it.price * (1 + (s.id + k) %% 4)
+       FROM sales s CROSS JOIN cnt
+       CROSS JOIN LATERAL generate_series(1, 1 + s.id %% 3) k
+       JOIN it ON it.n = (s.id * 31 + k * 17) %% cnt.n""",
+    """UPDATE sales s SET total = GREATEST(0, t.sub - s.discount)
+       FROM (SELECT sale_id, SUM(subtotal) AS sub FROM sale_items GROUP BY sale_id) t
+       WHERE s.id = t.sale_id""",
+    """INSERT INTO expense_categories (name)
+       SELECT unnest(ARRAY['Supplies', 'Shipping', 'Equipment', 'Marketing',
+                           'Utilities', 'Maintenance', 'Other'])
+       ON CONFLICT ((lower(name))) DO NOTHING""",
+    """WITH ec AS (SELECT row_number() OVER (ORDER BY id) - 1 AS n, id, name FROM expense_categories),
+            cnt AS (SELECT COUNT(*) AS n FROM expense_categories)
+       INSERT INTO expenses (store_id, description, amount, category, category_id, date)
+       SELECT 1 + g %% %(stores)s, 'Expense ' || g, 100 + (g * 53) %% 5000, ec.name, ec.id,
+              CURRENT_DATE - (g * 11) %% %(days)s
+       FROM generate_series(1, %(expenses)s) g CROSS JOIN cnt
+       JOIN ec ON ec.n = g %% cnt.n""",
+    """INSERT INTO stock_movements (item_id, qty_change, reason)
+       SELECT id, 50, 'restock' FROM items, generate_series(1, 25)""",
+]
+
+
+def _pg(cmd):
+    return os.path.join(os.environ['PG_BIN'], cmd) if os.environ.get('PG_BIN') else cmd
+
+
+def start_cluster(tmp):
+    """initdb + start a socket-only server in tmp with auto_explain preloaded; returns (datadir, URL)."""
+    data = os.path.join(tmp, 'data')
+    subprocess.run([_pg('initdb'), '-D', data, '-U', 'postgres', '-A', 'trust', '--no-sync'],
+                   check=True, stdout=subprocess.DEVNULL)
+    options = ' '.join([
+        # seed() runs VACUUM ANALYZE itself; autovacuum kicking in mid-capture
+        # would shift timings and statistics from one run to the next
+        f"-k {tmp}", "-c listen_addresses=''", "-c fsync=off", "-c autovacuum=off",
+        "-c shared_preload_libraries=auto_explain",
+        "-c logging_collector=on", "-c log_destination=csvlog", f"-c log_directory={tmp}/log",
+        "-c auto_explain.log_format=json", "-c auto_explain.log_analyze=on",
+        "-c auto_explain.log_buffers=on", "-c auto_explain.log_nested_statements=off",
+    ])
+    subprocess.run([_pg('pg_ctl'), '-D', data, '-o', options, '-w', '-l', os.path.join(tmp, 'server.log'),
+                    'start'], check=True, stdout=subprocess.DEVNULL)
+    return data, f"postgresql://postgres@/postgres?host={tmp}"
+
+
+def stop_cluster(data):
+    subprocess.run([_pg('pg_ctl'), '-D', data, '-m', 'fast', '-w', 'stop'],
+                   check=False, stdout=subprocess.DEVNULL)
+
+
+def seed(app):
+    params = {'sales': SALES, 'customers': CUSTOMERS, 'expenses': EXPENSES, 'days': DAYS, 'stores': STORES}
+    with app.db() as conn:
+        c = conn.cursor()
+        for sql in SEED_SQL:
+            c.execute(sql, params)
+        c.execute("SELECT id FROM customers")
+        app.refresh_customers(c, [r['id'] for r in c.fetchall()])
+        # Close everything but the last three months, so reports read both
+        # period_snapshots and the open period
+        c.execute("""SELECT generate_series(date_trunc('month', MIN(date)),
+                                            date_trunc('month', CURRENT_DATE) - INTERVAL '3 months',
+                                            INTERVAL '1 month')::date AS month FROM sales""")
+        months = [r['month'] for r in c.fetchall()]
+        app.snapshot_months(c, months)
+    # The oldest months go through archive_transactions.py, so the queries
+    # that union in archived_totals (and the archive export) read real data
+    import archive_transactions
+    for month in months[:ARCHIVE_MONTHS]:
+        archive_transactions.archive_month(month)
+    with app.db_read() as conn:
+        conn.cursor().execute("VACUUM ANALYZE")
+    print(f"    ✓  seeded {SALES} sales, {CUSTOMERS} customers, {EXPENSES} expenses in {STORES} store(s), "
+          f"{min(ARCHIVE_MONTHS, len(months))} month(s) archived")
+
+
+def _normalize(query):
+    """Query text with literals blanked, so the key survives changing dates and ids."""
+    query = re.sub(r"'(?:[^']|'')*'", '?', query)
+    query = re.sub(r'\b\d+(?:\.\d+)?\b', '?', query)
+    return ' '.join(query.split())
+
+
+def _base_table(rel):
+    return re.sub(r'_(?:\d{6}|default)$', '', rel or '')
+
+
+def summarize(entry, ms):
+    """Outline, seq scans on large tables, worst estimate ratio and buffers of one auto_explain plan."""
+    outline, seq_scans, worst = [], set(), 1.0
+
+    def walk(node, depth, limited):
+        nonlocal worst
+        label = node['Node Type']
+        if node.get('Relation Name'):
+            label += f" on {_base_table(node['Relation Name'])}"
+        if node.get('Index Name'):
+            label += f" using {node['Index Name']}"
+        outline.append('  ' * depth + label)
+        if node['Node Type'] == 'Seq Scan' and _base_table(node.get('Relation Name')) in LARGE_TABLES:
+            seq_scans.add(_base_table(node['Relation Name']))
+        if node.get('Actual Loops'):
+            actual, estimate = node['Actual Rows'], node['Plan Rows']
+            # Under a Limit the scan is cut short, not misestimated
+            if not (limited and actual < estimate):
+                worst = max(worst, max(actual, estimate, 1) / max(min(actual, estimate), 1))
+        limited = limited or node['Node Type'] == 'Limit'
+        for child in node.get('Plans', []):
+            walk(child, depth + 1, limited)
+
+    plan = entry['Plan']
+    walk(plan, 0, False)
+    return {
+        'query':          ' '.join(entry.get('Query Text', '').split())[:300],
+        'outline':        outline,
+        'seq_scans':      sorted(seq_scans),
+        'worst_estimate': round(worst, 1),
+        'buffers':        plan.get('Shared Hit Blocks', 0) + plan.get('Shared Read Blocks', 0),
+        'ms':             round(ms, 2),
+    }
+
+
+def read_log(log_dir):
+    """(query text, duration ms, plan) for every auto_explain entry in the csv logs, in order;
+    statements that raised an error come through as (query text, None, message)."""
+    csv.field_size_limit(sys.maxsize)  # JSON plans of the report queries run past the 128 KiB default
+    for path in sorted(glob.glob(os.path.join(log_dir, '*.csv'))):
+        with open(path, encoding='utf-8', newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 20:
+                    continue
+                # csvlog columns: 11 severity, 13 message, 19 statement
+                if row[11] == 'ERROR':
+                    yield row[19], None, row[13]
+                    continue
+                m = re.match(r'duration: ([\d.]+) ms\s+plan:\s*(.*)', row[13], re.S)
+                if m:
+                    entry = json.loads(m.group(2))
+                    yield entry.get('Query Text', ''), float(m.group(1)), entry
+
+
+def capture(app, url):
+    """Request every route once with auto_explain logging every statement."""
+    import psycopg2
+    marker = psycopg2.connect(url, sslmode='disable')
+    marker.autocommit = True
+    mc = marker.cursor()
+    mc.execute("ALTER SYSTEM SET auto_explain.log_min_duration = 0")
+    mc.execute("SELECT pg_reload_conf()")
+    time.sleep(0.5)
+
+    client = app.app.test_client()
+    for label, method, path, body in ROUTES:
+        if method == 'GET':
+            resp = client.get(path)
+        elif method == 'JSON':
+            resp = client.post(path, json=body)
+        else:
+            resp = client.post(path, data=body or {})
+        resp.get_data()  # drain streamed templates
+        if resp.status_code >= 400:
+            print(f"    ✗  {label}: HTTP {resp.status_code}")
+        # Delimits this route's statements in the log
+        mc.execute("SELECT %s AS plan_check_marker", (label,))
+    marker.close()
+
+
+def collect(log_dir):
+    """({"<route>: <query hash>#<n>": summary}, [(route, error)]) for the statements
+    logged between route markers."""
+    results, errors, seen, pending = {}, [], Counter(), []
+    for query, ms, entry in read_log(log_dir):
+        if 'plan_check_marker' in query:
+            label = re.search(r"'((?:[^']|'')*)' AS plan_check_marker", query).group(1).replace("''", "'")
+            for q, m, e in pending:
+                if m is None:
+                    errors.append((label, f"{e}: {' '.join(q.split())[:200]}"))
+                    continue
+                digest = hashlib.sha1(_normalize(q).encode()).hexdigest()[:10]
+                seen[(label, digest)] += 1
+                results[f"{label}: {digest}#{seen[(label, digest)]}"] = summarize(e, m)
+            pending = []
+            continue
+        if 'pg_reload_conf' in query or 'ALTER SYSTEM' in query:
+            continue
+        pending.append((query, ms, entry))
+    return results, errors
+
+
+def check_plan(key, cur):
+    """Problems with one statement's plan on its own, baseline or not."""
+    label = key.split(': ', 1)[0]
+    problems = [f"Seq Scan on {table}" for table in cur['seq_scans'] if (label, table) not in SEQ_SCAN_OK]
+    if cur['worst_estimate'] > ESTIMATE_FACTOR:
+        problems.append(f"row estimate off by {cur['worst_estimate']}× (limit {ESTIMATE_FACTOR}×)")
+    return problems
+
+
+def compare(key, cur, base):
+    """Problems with one statement's plan: check_plan, then against its baseline."""
+    problems = check_plan(key, cur)
+    if base is None:
+        return problems + ['no baseline — new statement? run `record` if intended']
+    if cur['buffers'] > base['buffers'] * BUFFER_FACTOR + BUFFER_SLACK:
+        problems.append(f"buffers {cur['buffers']} vs baseline {base['buffers']}")
+    if cur['ms'] > base['ms'] * TIME_FACTOR + TIME_SLACK_MS:
+        problems.append(f"{cur['ms']} ms vs baseline {base['ms']} ms")
+    return problems
+
+
+def main(cmd):
+    tmp = tempfile.mkdtemp(prefix='plan_check_')
+    data = None
+    try:
+        data, url = start_cluster(tmp)
+        # Before the import: app.py builds its pool and runs init_db() on import
+        os.environ['DATABASE_URL'] = url
+        os.environ['PGSSLMODE'] = 'disable'
+        os.environ['ARCHIVE_DIR'] = os.path.join(tmp, 'archive')
+        import app
+        seed(app)
+        capture(app, url)
+        stop_cluster(data)  # flushes the log collector
+        data = None
+        results, errors = collect(os.path.join(tmp, 'log'))
+    finally:
+        if data:
+            stop_cluster(data)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    for label, error in errors:
+        print(f"    ✗  {label}: {error}")
+    if errors:
+        print(f"\n  {len(errors)} statement(s) failed; fix the route or its request before comparing plans")
+        return 1
+
+    if cmd == 'record':
+        # A baseline only records cost; plans that fail check_plan aren't blessed
+        bad = {key: check_plan(key, cur) for key, cur in results.items()}
+        bad = {key: problems for key, problems in bad.items() if problems}
+        for key, problems in bad.items():
+            print(f"\n    ✗  {key}\n       {results[key]['query']}")
+            for p in problems:
+                print(f"       - {p}")
+        if bad:
+            print(f"\n  {len(bad)} plan(s) fail the absolute checks; nothing recorded")
+            return 1
+        with open(BASELINES, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n  {len(results)} plans recorded to {os.path.basename(BASELINES)}")
+        return 0
+
+    try:
+        with open(BASELINES, encoding='utf-8') as f:
+            baselines = json.load(f)
+    except OSError:
+        print(f"  ✗  {os.path.basename(BASELINES)} not found; run `record` first")
+        return 1
+
+    failed = 0
+    for key, cur in results.items():
+        base = baselines.get(key)
+        problems = compare(key, cur, base)
+        if not problems:
+            continue
+        failed += 1
+        print(f"\n    ✗  {key}\n       {cur['query']}")
+        for p in problems:
+            print(f"       - {p}")
+        if base:
+            for line in difflib.unified_diff(base['outline'], cur['outline'],
+                                             'baseline', 'current', lineterm='', n=2):
+                print(f"       {line}")
+    for key in sorted(set(baselines) - set(results)):
+        print(f"    —  {key} no longer runs: {baselines[key]['query'][:80]}")
+    print(f"\n  {len(results)} plans checked, {failed} regressed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ''
+    if cmd in ('run', 'record') and len(sys.argv) == 2:
+        sys.exit(main(cmd))
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Microfauna — rebuild_baskets.py
+Recounts the item_pairs co-purchase counters behind /api/analytics/baskets
+from scratch.
+
+Run from your project root (DATABASE_URL must be set):
+    python3 rebuild_baskets.py            # count live sales in chunks of 5000 ids
+    python3 rebuild_baskets.py 20000      # ...or of 20000
+
+Needed once after upgrading, since sales recorded before item_pairs
+existed aren't counted, and whenever the counters are suspect. Day to day
+the sale routes keep them current through count_baskets().
+
+The rebuild is one transaction holding an EXCLUSIVE lock on item_pairs:
+reports keep reading the old counts, and checkouts wait for it at their
+count_baskets() step, then count on top of the new numbers. Live sales are
+counted one id chunk at a time, with a self-join bounded by the chunk.
+Archived sales are read back from ARCHIVE_DIR and counted too, so
+archiving a month doesn't change the numbers.
+"""
+import sys
+
+from app import db, count_baskets, read_archive, DEFAULT_STORE_ID
+
+BATCH_SIZE = 5000
+
+# Pairs (and the diagonal) per sale in one id chunk, counted under the
+# sale's store
+CHUNK_SQL = """
+    WITH b AS (SELECT DISTINCT store_id, sale_id, item_name FROM sale_items
+               WHERE sale_id >= %(lo)s AND sale_id < %(hi)s AND item_name IS NOT NULL)
+    INSERT INTO item_pairs (store_id, item_a, item_b, baskets)
+    SELECT x.store_id, x.item_name, y.item_name, COUNT(*)
+    FROM b x JOIN b y ON y.sale_id = x.sale_id AND x.item_name <= y.item_name
+    GROUP BY x.store_id, x.item_name, y.item_name
+    ON CONFLICT (store_id, item_a, item_b) DO UPDATE SET baskets = item_pairs.baskets + EXCLUDED.baskets
+"""
+
+
+def _archived_baskets():
+    """{store id: [basket, ...]}; archives written before stores belong to the default store."""
+    baskets = {}
+    for row in read_archive('sale_items'):
+        if row.get('item_name'):
+            store_id = int(row.get('store_id') or DEFAULT_STORE_ID)
+            baskets.setdefault(store_id, {}).setdefault(row['sale_id'], set()).add(row['item_name'])
+    return {store_id: list(sales.values()) for store_id, sales in baskets.items()}
+
+
+def rebuild(batch):
+    with db() as conn:
+        c = conn.cursor()
+        c.execute("LOCK TABLE item_pairs IN EXCLUSIVE MODE")
+        c.execute("DELETE FROM item_pairs")
+        c.execute("SELECT MIN(sale_id) AS lo, MAX(sale_id) AS hi FROM sale_items")
+        bounds = c.fetchone()
+        if bounds['lo'] is not None:
+            for lo in range(bounds['lo'], bounds['hi'] + 1, batch):
+                c.execute(CHUNK_SQL, {'lo': lo, 'hi': lo + batch})
+                print(f"    ✓  sales {lo}–{min(lo + batch, bounds['hi'] + 1) - 1}")
+        archived = _archived_baskets()
+        for store_id, baskets in archived.items():
+            count_baskets(c, store_id, added=baskets)
+        c.execute("SELECT COUNT(*) AS pairs FROM item_pairs")
+        pairs = c.fetchone()['pairs']
+    print(f"\n  {pairs} item pairs counted ({sum(len(b) for b in archived.values())} sales from the archive)")
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2:
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(rebuild(int(sys.argv[1]) if len(sys.argv) == 2 else BATCH_SIZE))
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Microfauna — repair_totals.py
+Finds and fixes sales whose stored total has drifted from their line items.
+
+Run from your project root (DATABASE_URL must be set):
+    python3 repair_totals.py check           # report drift, change nothing
+    python3 repair_totals.py repair          # fix it
+    python3 repair_totals.py repair 5000     # ...in chunks of 5000 sale ids
+
+A sale has drifted when a line's subtotal isn't price × quantity, when
+total isn't max(0, SUM(subtotal) - discount), or when it has no line items
+left. The table is walked in id ranges of BATCH_SIZE; each chunk is its
+own transaction, so a long repair never holds locks on the whole table
+and can be interrupted and re-run. Totals are recomputed with
+recompute_sale_totals() from app.py, the same statement the bulk deletes
+use, and customers, closed months and the dashboard are refreshed per
+chunk. Sales without line items are only reported; delete or re-enter
+them by hand.
+"""
+import sys
+
+from app import (db, db_read, recompute_sale_totals, refresh_customers,
+                 reclose_periods, bump_versions)
+
+BATCH_SIZE = 2000
+
+# One pass over a chunk of sales and their lines
+DRIFT_SQL = """
+    SELECT s.id, s.date, s.total, COUNT(si.id) AS lines,
+           COUNT(si.id) FILTER (WHERE si.subtotal IS DISTINCT FROM si.price * si.quantity) AS bad_lines,
+           GREATEST(0, COALESCE(SUM(si.price * si.quantity), 0) - COALESCE(s.discount, 0)) AS expected
+    FROM sales s LEFT JOIN sale_items si ON si.sale_id = s.id
+    WHERE s.id >= %s AND s.id < %s
+    GROUP BY s.id
+    HAVING COUNT(si.id) = 0
+        OR COUNT(si.id) FILTER (WHERE si.subtotal IS DISTINCT FROM si.price * si.quantity) > 0
+        OR s.total IS DISTINCT FROM GREATEST(0, COALESCE(SUM(si.price * si.quantity), 0) - COALESCE(s.discount, 0))
+    ORDER BY s.id
+"""
+
+
+def _id_range():
+    with db_read() as conn:
+        c = conn.cursor()
+        c.execute("SELECT MIN(id) AS lo, MAX(id) AS hi FROM sales")
+        r = c.fetchone()
+    return r['lo'], r['hi']
+
+
+def _chunks(batch):
+    lo, hi = _id_range()
+    if lo is None:
+        return
+    for start in range(lo, hi + 1, batch):
+        yield start, start + batch
+
+
+def check(batch):
+    drifted = empty = 0
+    for start, end in _chunks(batch):
+        with db_read() as conn:
+            c = conn.cursor()
+            c.execute(DRIFT_SQL, (start, end))
+            for r in c.fetchall():
+                if not r['lines']:
+                    empty += 1
+                    print(f"    ✗  sale #{r['id']}: no line items")
+                    continue
+                drifted += 1
+                lines = f", {r['bad_lines']} line subtotal(s) off" if r['bad_lines'] else ''
+                print(f"    ✗  sale #{r['id']}: total {r['total']} ≠ {r['expected']}{lines}")
+    print(f"\n  {drifted} drifted, {empty} without line items")
+    return 1 if drifted or empty else 0
+
+
+def repair(batch):
+    fixed = empty = 0
+    for start, end in _chunks(batch):
+        with db() as conn:
+            c = conn.cursor()
+            # Lock the chunk first (FOR UPDATE can't go on a GROUP BY) so a
+            # concurrent edit can't change it between check and fix
+            c.execute("SELECT id FROM sales WHERE id >= %s AND id < %s ORDER BY id FOR UPDATE", (start, end))
+            c.execute(DRIFT_SQL, (start, end))
+            rows = c.fetchall()
+            empty += sum(1 for r in rows if not r['lines'])
+            ids = [r['id'] for r in rows if r['lines']]
+            if not ids:
+                continue
+            c.execute("""UPDATE sale_items SET subtotal = price * quantity
+                         WHERE sale_id = ANY(%s) AND subtotal IS DISTINCT FROM price * quantity""", (ids,))
+            changed = recompute_sale_totals(c, ids, only_drifted=True, delete_empty=False)
+            refresh_customers(c, [r['customer_id'] for r in changed])
+            # Fixed line subtotals change a closed month's item mix even when the total held
+            reclose_periods(c, [r['date'] for r in rows if r['lines']])
+            bump_versions(c, 'sales')
+            fixed += len(ids)
+            print(f"    ✓  ids {start}–{end - 1}: {len(ids)} sale(s) repaired")
+    print(f"\n  {fixed} repaired, {empty} without line items left as they are")
+    return 0
+
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else ''
+    batch = int(sys.argv[2]) if len(sys.argv) == 3 else BATCH_SIZE
+    if cmd == 'check' and len(sys.argv) <= 3:
+        sys.exit(check(batch))
+    elif cmd == 'repair' and len(sys.argv) <= 3:
+        sys.exit(repair(batch))
+    else:
+        print(__doc__)
+        sys.exit(2)
@@ -0,0 +1,14 @@
+(function(){'use strict';const activeOperations=new Set();window.guardClick=function(element,asyncFn){const key=element.id||element.getAttribute('data-guard-key')||Math.random().toString(36);if(activeOperations.has(key)){return Promise.resolve();}
+activeOperations.add(key);const wasDisabled=element.disabled;element.disabled=true;element.classList.add('is-loading');const originalText=element.textContent;const originalCursor=element.style.cursor;element.style.cursor='wait';return Promise.resolve().then(()=>asyncFn()).finally(()=>{setTimeout(()=>{element.disabled=wasDisabled;element.classList.remove('is-loading');element.style.cursor=originalCursor;element.textContent=originalText;activeOperations.delete(key);},150);});};function protectNavigation(){document.addEventListener('click',function(e){const link=e.target.closest('a[href]');if(!link)return;const href=link.getAttribute('href');if(!href||href.startsWith('#')||href.startsWith('http')||href.startsWith('mailto')){return;}
+if(link.classList.contains('is-navigating')){e.preventDefault();return;}
+link.classList.add('is-navigating');link.style.opacity='0.6';link.style.pointerEvents='none';setTimeout(()=>{link.classList.remove('is-navigating');link.style.opacity='';link.style.pointerEvents='';},3000);},true);}
+function protectForms(){document.addEventListener('submit',function(e){const form=e.target;const submitBtn=form.querySelector('button[type="submit"], input[type="submit"]');if(submitBtn&&submitBtn.disabled){e.preventDefault();return;}
+if(submitBtn){submitBtn.disabled=true;submitBtn.classList.add('is-loading');}},true);}
+function protectActionButtons(){document.addEventListener('click',function(e){const btn=e.target.closest('button:not([type="submit"])');if(!btn||btn.disabled){if(btn&&btn.disabled){e.preventDefault();e.stopPropagation();}
+return;}
+if(btn.onclick){const key=btn.id||`btn-${Date.now()}`;if(activeOperations.has(key)){e.preventDefault();e.stopPropagation();return;}
+activeOperations.add(key);setTimeout(()=>activeOperations.delete(key),500);}},true);}
+function addInstantFeedback(){document.addEventListener('mousedown',function(e){const target=e.target.closest('button, a, input[type="submit"]');if(target&&!target.disabled){target.classList.add('is-pressed');}},true);document.addEventListener('mouseup',function(e){const target=e.target.closest('button, a, input[type="submit"]');if(target){setTimeout(()=>target.classList.remove('is-pressed'),100);}},true);}
+if(document.readyState==='loading'){document.addEventListener('DOMContentLoaded',init);}else{init();}
+function init(){protectNavigation();protectForms();protectActionButtons();addInstantFeedback();}
+window.ClickGuard={protect:guardClick,isActive:(key)=>activeOperations.has(key),clear:()=>activeOperations.clear()};})();
\ No newline at end of file
@@ -0,0 +1,42 @@
+function storeUrl(path){return path+(path.includes('?')?'&':'?')+'store='+encodeURIComponent(document.body.dataset.store);}
+(function(){const list=document.getElementById('itemsList');if(!list)return;let dragSrc=null;function saveOrder(){const ids=[...list.querySelectorAll('.item-row')].map(r=>r.dataset.id);fetch(storeUrl('/items/reorder'),{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({ids})}).then(r=>r.json()).then(data=>{if(!data.success)console.error('Reorder failed to save:',data.error);}).catch(err=>console.error('Reorder request failed:',err));}
+list.addEventListener('dragstart',e=>{const row=e.target.closest('.item-row');if(!row)return;dragSrc=row;setTimeout(()=>row.classList.add('dragging'),0);});list.addEventListener('dragend',()=>{list.querySelectorAll('.item-row').forEach(r=>r.classList.remove('dragging','drag-over'));dragSrc=null;});list.addEventListener('dragover',e=>{e.preventDefault();const row=e.target.closest('.item-row');list.querySelectorAll('.drag-over').forEach(r=>r.classList.remove('drag-over'));if(row&&row!==dragSrc)row.classList.add('drag-over');});list.addEventListener('drop',e=>{e.preventDefault();const row=e.target.closest('.item-row');if(!row||!dragSrc||row===dragSrc)return;const rows=[...list.querySelectorAll('.item-row')];if(rows.indexOf(dragSrc)<rows.indexOf(row))row.after(dragSrc);else row.before(dragSrc);row.classList.remove('drag-over');saveOrder();});list.querySelectorAll('.item-row').forEach(r=>r.setAttribute('draggable','true'));let touchRow=null,touchClone=null,touchOffY=0;list.addEventListener('touchstart',e=>{const handle=e.target.closest('.drag-handle');if(!handle)return;touchRow=handle.closest('.item-row');const rect=touchRow.getBoundingClientRect();touchOffY=e.touches[0].clientY-rect.top;touchClone=touchRow.cloneNode(true);Object.assign(touchClone.style,{position:'fixed',left:rect.left+'px',top:rect.top+'px',width:rect.width+'px',opacity:'.85',zIndex:'9999',pointerEvents:'none',borderRadius:'12px',boxShadow:'0 8px 24px rgba(0,0,0,.25)',background:'var(--bg-secondary)'});document.body.appendChild(touchClone);touchRow.classList.add('dragging');e.preventDefault();},{passive:false});document.addEventListener('touchmove',e=>{if(!touchRow||!touchClone)return;touchClone.style.top=(e.touches[0].clientY-touchOffY)+'px';touchClone.style.display='none';const below=document.elementFromPoint(e.touches[0].clientX,e.touches[0].clientY);touchClone.style.display='';const target=below?below.closest('.item-row'):null;list.querySelectorAll('.drag-over').forEach(r=>r.classList.remove('drag-over'));if(target&&target!==touchRow)target.classList.add('drag-over');e.preventDefault();},{passive:false});document.addEventListener('touchend',e=>{if(!touchRow)return;touchClone&&touchClone.remove();touchClone=null;touchRow.classList.remove('dragging');const touch=e.changedTouches[0];const below=document.elementFromPoint(touch.clientX,touch.clientY);const target=below?below.closest('.item-row'):null;list.querySelectorAll('.drag-over').forEach(r=>r.classList.remove('drag-over'));if(target&&target!==touchRow){const rows=[...list.querySelectorAll('.item-row')];if(rows.indexOf(touchRow)<rows.indexOf(target))target.after(touchRow);else target.before(touchRow);saveOrder();}
+touchRow=null;});})();(function(){const input=document.getElementById('customer_name');const list=document.getElementById('customerSuggestions');let timer=null,lastQuery='';input.addEventListener('input',()=>{clearTimeout(timer);const q=input.value.trim();if(q.length<2||q===lastQuery)return;timer=setTimeout(()=>{lastQuery=q;fetch('/api/customers/suggest?q='+encodeURIComponent(q)).then(r=>r.json()).then(rows=>{list.innerHTML='';rows.forEach(c=>{const opt=document.createElement('option');opt.value=c.name;list.appendChild(opt);});}).catch(()=>{});},150);});})();let updateTotalTimeout=null;function changeQty(btn,delta){const input=btn.parentElement.querySelector('input[type=number]');input.value=Math.max(0,(parseInt(input.value)||0)+delta);if(updateTotalTimeout)clearTimeout(updateTotalTimeout);updateTotalTimeout=setTimeout(updateTotal,50);}
+function debouncedUpdateTotal(){if(updateTotalTimeout)clearTimeout(updateTotalTimeout);updateTotalTimeout=setTimeout(updateTotal,50);}
+function updateTotal(){const inputs=document.querySelectorAll('#itemsList .qty-stepper input[type=number]');const discount=parseFloat(document.getElementById('discount').value)||0;let subtotal=0,html='',count=0;inputs.forEach(inp=>{const qty=parseInt(inp.value)||0;if(qty>0){const price=parseFloat(inp.dataset.price);const line=qty*price;subtotal+=line;count++;const name=inp.closest('.item-row').querySelector('.item-name').textContent.trim();html+=`<p>${name} × ${qty} = ₱${line.toFixed(2)}</p>`;}});document.getElementById('orderSummary').innerHTML=count?html:'<p style="color:var(--text-secondary);">Add items to see summary</p>';const dl=document.getElementById('discountLine');if(discount>0&&count>0){document.getElementById('discountAmt').textContent=discount.toFixed(2);dl.style.display='block';}else dl.style.display='none';document.getElementById('totalAmount').textContent='₱'+Math.max(0,subtotal-discount).toFixed(2);}
+function withLoadingBtn(btn,asyncFn){if(btn.disabled)return;const original=btn.textContent;btn.disabled=true;btn.style.opacity='0.65';btn.textContent='Saving…';return Promise.resolve().then(asyncFn).finally(()=>{btn.disabled=false;btn.style.opacity='';btn.textContent=original;});}
+document.getElementById('saleForm').addEventListener('submit',async function(e){e.preventDefault();const inputs=document.querySelectorAll('#itemsList .qty-stepper input[type=number]');let hasItems=false;inputs.forEach(i=>{if(parseInt(i.value)>0)hasItems=true;});if(!hasItems){alert('Please add at least one item.');return;}
+const btn=document.getElementById('submitBtn');withLoadingBtn(btn,async()=>{const res=await fetch(storeUrl('/add-sale'),{method:'POST',body:new FormData(this)});const data=await res.json();if(data.success){btn.disabled=true;btn.style.opacity='0.65';btn.textContent='Saved ✓';pendingSaleData=data;warnNegativeStock(data.negative_stock);document.getElementById('confirmDialog').style.display='block';}else{alert('Error: '+data.error);}});});function warnNegativeStock(items){if(!items||!items.length)return;alert('Stock is now below zero for: '+
+items.map(i=>i.name+' ('+i.on_hand+')').join(', ')+'. Record a restock on the Items page.');}
+const QUEUE_KEY='saleQueue@'+document.body.dataset.store;let batchResults=[];(function(){const legacy=localStorage.getItem('saleQueue');if(legacy===null)return;try{localStorage.setItem(QUEUE_KEY,JSON.stringify(loadQueue().concat(JSON.parse(legacy)||[])));}
+catch(e){}
+localStorage.removeItem('saleQueue');})();function loadQueue(){try{return JSON.parse(localStorage.getItem(QUEUE_KEY))||[];}
+catch(e){return[];}}
+function saveQueue(queue){localStorage.setItem(QUEUE_KEY,JSON.stringify(queue));renderQueue();}
+function queueSale(){const form=document.getElementById('saleForm');const customer=form.customer_name.value.trim();if(!customer){alert('Please enter a customer name.');return;}
+const items=[];let subtotal=0;document.querySelectorAll('#itemsList .item-row').forEach(row=>{const input=row.querySelector('input[type=number]');const qty=parseInt(input.value)||0;if(qty>0){items.push({item_id:parseInt(row.dataset.id),quantity:qty});subtotal+=qty*parseFloat(input.dataset.price);}});if(!items.length){alert('Please add at least one item.');return;}
+const discount=parseFloat(form.discount.value)||0;const queue=loadQueue();queue.push({customer_name:customer,date:form.date.value,notes:form.notes.value.trim(),discount,items,total:Math.max(0,subtotal-discount)});saveQueue(queue);form.customer_name.value='';form.notes.value='';form.discount.value=0;document.querySelectorAll('#itemsList .qty-stepper input[type=number]').forEach(i=>{i.value=0;});updateTotal();form.customer_name.focus();}
+function clearQueue(){if(!loadQueue().length||confirm('Discard all queued sales?')){batchResults=[];saveQueue([]);}}
+function flushQueue(btn){const queue=loadQueue();if(!queue.length)return;withLoadingBtn(btn,async()=>{let data;try{const res=await fetch(storeUrl('/api/sales/batch'),{method:'POST',headers:{'Content-Type':'application/json'},body:JSON.stringify({sales:queue})});data=await res.json();}catch(err){alert('Could not reach the server. The queue is kept — try again.');return;}
+if(!data.results){alert('Error: '+data.error);return;}
+const failed=[];data.results.forEach((r,i)=>{if(r.success)batchResults.push(r);else failed.push(Object.assign(queue[i],{error:r.error}));});saveQueue(failed.concat(loadQueue().slice(queue.length)));if(failed.length)alert(failed.length+' sale(s) could not be saved — see the queue.');warnNegativeStock(data.negative_stock);});}
+function renderQueue(){const queue=loadQueue();document.getElementById('queueCard').style.display=queue.length||batchResults.length?'block':'none';document.getElementById('queueCount').textContent=queue.length;document.getElementById('flushBtn').style.display=queue.length?'':'none';document.getElementById('queueList').innerHTML=queue.map(s=>'<p>'+esc(s.customer_name)+' — ₱'+parseFloat(s.total||0).toFixed(2)+
+(s.error?' <span style="color:var(--accent-danger);">('+esc(s.error)+')</span>':'')+'</p>').join('');document.getElementById('batchResults').innerHTML=batchResults.map((r,i)=>'<p>#'+r.receipt_no+' '+esc(r.customer_name)+' — ₱'+parseFloat(r.total).toFixed(2)+
+(r.duplicate?' (already saved)':'')+' <button type="button" class="rbtn" onclick="displayReceipt(batchResults['+i+'])">Receipt</button></p>').join('');}
+renderQueue();let pendingSaleData=null;function viewReceiptFromDialog(){document.getElementById('confirmDialog').style.display='none';displayReceipt(pendingSaleData);}
+function skipReceipt(){document.getElementById('confirmDialog').style.display='none';window.location.href='/';}
+function closeReceiptModal(){document.getElementById('receiptModal').style.display='none';if(!batchResults.length)window.location.href='/';}
+function esc(s){return String(s).replace(/&/g,'&amp;').replace(/</g,'&lt;').replace(/>/g,'&gt;').replace(/"/g,'&quot;').replace(/'/g,'&#39;');}
+function buildReceiptHTML(data){let rows='';(data.items||[]).forEach(item=>{rows+='<tr>'+'<td style="padding:9px 8px;border-bottom:1px dashed #bbb;color:#000;font-size:13px;">'+esc(item.name)+'</td>'+'<td style="padding:9px 8px;border-bottom:1px dashed #bbb;text-align:center;color:#000;font-size:13px;">'+item.quantity+'</td>'+'<td style="padding:9px 8px;border-bottom:1px dashed #bbb;text-align:right;color:#000;font-size:13px;">&#8369;'+parseFloat(item.price).toFixed(2)+'</td>'+'<td style="padding:9px 8px;border-bottom:1px dashed #bbb;text-align:right;color:#000;font-size:13px;font-weight:600;">&#8369;'+parseFloat(item.subtotal).toFixed(2)+'</td>'+'</tr>';});const discount=data.discount>0?'<div style="text-align:right;color:#cc0000;font-size:13px;margin-top:4px;">Discount: -&#8369;'+parseFloat(data.discount).toFixed(2)+'</div>':'';const notes=data.notes?'<div style="color:#000;"><b>Notes:</b> '+esc(data.notes)+'</div>':'';return'<!DOCTYPE html><html><head><meta charset="utf-8">'+'<style>'+'html,body{margin:0;padding:0;background:#fff!important;color:#000!important;}'+'body{font-family:"Courier New",Courier,monospace;font-size:13px;line-height:1.6;'+'background:#fff!important;color:#000!important;padding:28px 24px;box-sizing:border-box;width:480px;}'+'*{box-sizing:border-box;color:#000!important;background-color:transparent;}'+'table{width:100%;border-collapse:collapse;}'+'thead tr{background:#000!important;}'+'thead th{color:#fff!important;background:#000!important;}'+'@media(prefers-color-scheme:dark){html,body{background:#fff!important;color:#000!important;}'+'thead tr{background:#000!important;}thead th{color:#fff!important;background:#000!important;}}'+'</style></head><body>'+'<div style="text-align:center;margin-bottom:20px;padding-bottom:16px;border-bottom:2px solid #000;">'+'<div style="font-size:22px;font-weight:700;letter-spacing:3px;color:#000!important;">MICROFAUNA</div>'+'<div style="font-size:12px;margin-top:4px;color:#000!important;letter-spacing:1px;">Sales Receipt</div>'+'</div>'+'<div style="margin-bottom:16px;font-size:13px;color:#000!important;line-height:2;">'+'<div><b>Receipt #:</b> '+esc(String(data.sale_id))+'</div>'+'<div><b>Customer:</b> '+esc(data.customer_name)+'</div>'+'<div><b>Date:</b> '+esc(data.date)+'</div>'+
+notes+'</div>'+'<table>'+'<thead><tr style="background:#000!important;">'+'<th style="padding:9px 8px;text-align:left;color:#fff!important;font-size:11px;letter-spacing:1px;background:#000!important;">ITEM</th>'+'<th style="padding:9px 8px;text-align:center;color:#fff!important;font-size:11px;letter-spacing:1px;background:#000!important;">QTY</th>'+'<th style="padding:9px 8px;text-align:right;color:#fff!important;font-size:11px;letter-spacing:1px;background:#000!important;">PRICE</th>'+'<th style="padding:9px 8px;text-align:right;color:#fff!important;font-size:11px;letter-spacing:1px;background:#000!important;">TOTAL</th>'+'</tr></thead>'+'<tbody>'+rows+'</tbody>'+'</table>'+'<div style="margin-top:16px;padding-top:12px;border-top:2px solid #000;">'+
+discount+'<div style="text-align:right;font-size:18px;font-weight:700;color:#000!important;margin-top:6px;">TOTAL: &#8369;'+parseFloat(data.total).toFixed(2)+'</div>'+'</div>'+'<div style="margin-top:22px;padding-top:14px;border-top:1px dashed #bbb;text-align:center;font-size:12px;color:#000!important;line-height:2;">'+'<div>Thank you for your purchase!</div><div>Visit us again soon</div>'+'</div>'+'</body></html>';}
+function displayReceipt(data){MFReceipt.renderInModal(document.getElementById('receiptContent'),data);const toggleBtn=document.getElementById('gcashToggleBtn');toggleBtn.textContent=MFReceipt.isGcashOn()?'Hide GCash':'Show GCash';toggleBtn.onclick=()=>{const isOn=MFReceipt.toggleGcash();toggleBtn.textContent=isOn?'Hide GCash':'Show GCash';MFReceipt.renderInModal(document.getElementById('receiptContent'),data);};document.getElementById('receiptModal').style.display='block';document.getElementById('goDashBtn').onclick=()=>{window.location.href='/';};document.getElementById('downloadPngBtn').onclick=()=>MFReceipt.captureAsPng('download',data.sale_id,data.customer_name,data);document.getElementById('copyReceiptBtn').onclick=()=>MFReceipt.captureAsPng('copy',data.sale_id,data.customer_name,data);}
+async function captureReceipt(action,saleId,customerName,data){const filename='receipt_'+saleId+'_'+(customerName||'').replace(/\s+/g,'_')+'.png';const isIOS=/iPhone|iPad|iPod/.test(navigator.userAgent);const iframe=document.createElement('iframe');iframe.style.cssText='position:fixed;left:-9999px;top:0;width:480px;height:1px;border:none;visibility:hidden;';document.body.appendChild(iframe);const iDoc=iframe.contentDocument||iframe.contentWindow.document;iDoc.open();iDoc.write(buildReceiptHTML(data));iDoc.close();setTimeout(async()=>{iframe.style.height=(iDoc.body.scrollHeight+56)+'px';let canvas;try{canvas=await html2canvas(iDoc.body,{backgroundColor:'#ffffff',scale:2,useCORS:true,logging:false,windowWidth:480,width:480});}catch(err){document.body.removeChild(iframe);alert('Could not capture receipt. Please try again.');return;}
+document.body.removeChild(iframe);const dataUrl=canvas.toDataURL('image/png');if(action==='copy'){canvas.toBlob(async blob=>{const file=new File([blob],filename,{type:'image/png'});if(navigator.canShare&&navigator.canShare({files:[file]})){try{await navigator.share({files:[file],title:'Microfauna Receipt'});return;}
+catch(e){if(e.name==='AbortError')return;}}
+if(window.ClipboardItem&&navigator.clipboard&&navigator.clipboard.write){try{await navigator.clipboard.write([new ClipboardItem({'image/png':blob})]);alert('Receipt image copied! Paste in any chat.');return;}catch(e){}}
+_openReceiptTab(dataUrl);},'image/png');}else{if(!isIOS){const a=document.createElement('a');a.download=filename;a.href=dataUrl;document.body.appendChild(a);a.click();document.body.removeChild(a);}else{canvas.toBlob(async blob=>{const file=new File([blob],filename,{type:'image/png'});if(navigator.canShare&&navigator.canShare({files:[file]})){try{await navigator.share({files:[file],title:'Microfauna Receipt'});return;}
+catch(e){if(e.name==='AbortError')return;}}
+_openReceiptTab(dataUrl);},'image/png');}}},150);}
+function _openReceiptTab(dataUrl){window.open(dataUrl,'_blank');alert('Receipt opened in new tab — long-press the image to save or copy it.');}
+window.addEventListener('click',e=>{if(e.target===document.getElementById('receiptModal'))closeReceiptModal();if(e.target===document.getElementById('confirmDialog'))skipReceipt();});
\ No newline at end of file
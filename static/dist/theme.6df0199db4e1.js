@@ -0,0 +1 @@
+(function(){var t=localStorage.getItem('theme')||'dark';document.documentElement.setAttribute('data-theme',t);})();function toggleTheme(){var html=document.documentElement;var current=html.getAttribute('data-theme');var next=current==='light'?'dark':'light';html.setAttribute('data-theme',next);localStorage.setItem('theme',next);}
\ No newline at end of file
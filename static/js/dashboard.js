@@ -0,0 +1,581 @@
+let charts = {};
+let reportChart = null;
+let activeReportPeriod = 'daily';
+
+// Requests name the store this page shows, not whichever one the cookie
+// last picked in another tab
+function storeUrl(path) {
+    return path + (path.includes('?') ? '&' : '?') + 'store=' + encodeURIComponent(document.body.dataset.store);
+}
+
+// ── Chart Modal ──────────────────────────────
+function openChartModal() {
+    document.getElementById('chartModal').style.display = 'block';
+    document.body.classList.add('modal-open');
+    loadAllCharts();
+}
+function closeChartModal() {
+    document.getElementById('chartModal').style.display = 'none';
+    document.body.classList.remove('modal-open');
+}
+
+function showChart(chartType, btn) {
+    document.querySelectorAll('.chart-container').forEach(c => c.style.display = 'none');
+    document.querySelectorAll('.modal-body > .chart-tabs .tab-btn').forEach(b => b.classList.remove('active'));
+    document.getElementById(`chart-${chartType}`).style.display = 'block';
+    if (btn) btn.classList.add('active');
+    if (chartType === 'report') loadReport(activeReportPeriod);
+}
+
+// ── Standard charts ──────────────────────────
+async function loadAllCharts() {
+    await loadMonthlyChart();
+    await loadItemsChart();
+    await loadExpensesChart();
+    await loadComparisonChart();
+}
+
+async function loadMonthlyChart() {
+    const data = await fetch(storeUrl('/api/charts/monthly-sales')).then(r => r.json());
+    const ctx = document.getElementById('monthlyChart').getContext('2d');
+    if (charts.monthly) charts.monthly.destroy();
+    charts.monthly = new Chart(ctx, {
+        type: 'line',
+        data: {
+            labels: data.map(d => d.month),
+            datasets: [{
+                label: 'Monthly Revenue',
+                data: data.map(d => d.revenue),
+                borderColor: '#00ff88',
+                backgroundColor: 'rgba(0,255,136,0.1)',
+                tension: 0.4, fill: true
+            }]
+        },
+        options: chartOptions()
+    });
+}
+
+async function loadItemsChart() {
+    const data = await fetch(storeUrl('/api/charts/item-sales')).then(r => r.json());
+    const ctx = document.getElementById('itemsChart').getContext('2d');
+    if (charts.items) charts.items.destroy();
+    const colors = ['#00ff88','#00ccff','#ffaa00','#ff4444','#aa00ff'];
+    charts.items = new Chart(ctx, {
+        type: 'doughnut',
+        data: {
+            labels: data.map(d => d.item_name),
+            datasets: [{
+                data: data.map(d => d.total_sales),
+                backgroundColor: colors,
+                borderColor: getComputedStyle(document.body).getPropertyValue('--bg-primary'),
+                borderWidth: 2
+            }]
+        },
+        options: { responsive: true, maintainAspectRatio: true,
+            plugins: { legend: { position: 'bottom', labels: { color: textColor(), padding: 15 } } } }
+    });
+}
+
+async function loadExpensesChart() {
+    const data = await fetch(storeUrl('/api/charts/expense-breakdown')).then(r => r.json());
+    const ctx = document.getElementById('expensesChart').getContext('2d');
+    if (charts.expenses) charts.expenses.destroy();
+    charts.expenses = new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: data.map(d => d.category),
+            datasets: [{ label: 'Expenses', data: data.map(d => d.total),
+                backgroundColor: '#ff4444', borderColor: '#ff6666', borderWidth: 1 }]
+        },
+        options: chartOptions()
+    });
+}
+
+async function loadComparisonChart() {
+    const data = await fetch(storeUrl('/api/charts/monthly-comparison')).then(r => r.json());
+    const ctx = document.getElementById('comparisonChart').getContext('2d');
+    if (charts.comparison) charts.comparison.destroy();
+    charts.comparison = new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels: data.map(d => d.month),
+            datasets: [
+                { label: 'Revenue', data: data.map(d => d.revenue), backgroundColor: '#00ff88', borderColor: '#00ff88', borderWidth: 1 },
+                { label: 'Expenses', data: data.map(d => d.expenses), backgroundColor: '#ff4444', borderColor: '#ff4444', borderWidth: 1 }
+            ]
+        },
+        options: chartOptions()
+    });
+}
+
+// ── Sales Report ─────────────────────────────
+async function loadReport(period) {
+    activeReportPeriod = period;
+    // Highlight the active report sub-button
+    ['daily','weekly','monthly','yearly'].forEach(p => {
+        document.getElementById(`report-btn-${p}`).classList.toggle('active', p === period);
+    });
+
+    const data = await fetch(storeUrl(`/api/analytics/${period}`)).then(r => r.json());
+
+    const labelKey   = period === 'daily' ? 'day' : period === 'weekly' ? 'week_start' : period === 'monthly' ? 'month' : 'year';
+    const labels     = data.map(d => d[labelKey]);
+    const revenue    = data.map(d => parseFloat(d.revenue));
+    const txns       = data.map(d => parseInt(d.transactions));
+
+    const ctx = document.getElementById('reportChart').getContext('2d');
+    if (reportChart) reportChart.destroy();
+
+    reportChart = new Chart(ctx, {
+        type: 'bar',
+        data: {
+            labels,
+            datasets: [
+                { label: 'Revenue (₱)', data: revenue, backgroundColor: 'rgba(0,255,136,0.7)', borderColor: '#00ff88', borderWidth: 1, yAxisID: 'y' },
+                { label: 'Transactions', data: txns, type: 'line', borderColor: '#00ccff', backgroundColor: 'rgba(0,204,255,0.1)', tension: 0.4, fill: false, yAxisID: 'y1' }
+            ]
+        },
+        options: {
+            responsive: true, maintainAspectRatio: true,
+            plugins: { legend: { labels: { color: textColor() } } },
+            scales: {
+                y:  { beginAtZero: true, position: 'left',  ticks: { color: subColor(), callback: v => '₱' + v }, grid: { color: borderColor() } },
+                y1: { beginAtZero: true, position: 'right', ticks: { color: subColor() }, grid: { drawOnChartArea: false } },
+                x:  { ticks: { color: subColor() }, grid: { color: borderColor() } }
+            }
+        }
+    });
+
+    // Summary table
+    const totalRev  = revenue.reduce((a,b) => a+b, 0);
+    const totalTxns = txns.reduce((a,b) => a+b, 0);
+    const avgRev    = data.length ? totalRev / data.length : 0;
+    const best      = data.reduce((a,b) => parseFloat(b.revenue) > parseFloat(a.revenue) ? b : a, data[0] || {});
+
+    document.getElementById('reportTable').innerHTML = `
+        <table style="width:100%; border-collapse:collapse; font-size:0.9rem; color:var(--text-primary);">
+            <thead>
+                <tr style="border-bottom:2px solid var(--border-color);">
+                    <th style="padding:10px; text-align:left;">Period</th>
+                    <th style="padding:10px; text-align:right;">Revenue</th>
+                    <th style="padding:10px; text-align:right;">Transactions</th>
+                </tr>
+            </thead>
+            <tbody>
+                ${data.map(d => `
+                <tr style="border-bottom:1px solid var(--border-color);">
+                    <td style="padding:8px 10px;">${d[labelKey]}</td>
+                    <td style="padding:8px 10px; text-align:right; color:var(--accent-success);">${fmtMoney(d.revenue)}</td>
+                    <td style="padding:8px 10px; text-align:right;">${d.transactions}</td>
+                </tr>`).join('')}
+            </tbody>
+            <tfoot>
+                <tr style="border-top:2px solid var(--border-color); font-weight:700;">
+                    <td style="padding:10px;">TOTAL</td>
+                    <td style="padding:10px; text-align:right; color:var(--accent-success);">${fmtMoney(totalRev)}</td>
+                    <td style="padding:10px; text-align:right;">${totalTxns}</td>
+                </tr>
+                <tr style="color:var(--text-secondary); font-size:0.85rem;">
+                    <td style="padding:6px 10px;">Average per period</td>
+                    <td style="padding:6px 10px; text-align:right;">${fmtMoney(avgRev)}</td>
+                    <td></td>
+                </tr>
+                ${best && best[labelKey] ? `
+                <tr style="color:var(--text-secondary); font-size:0.85rem;">
+                    <td style="padding:6px 10px;">Best period</td>
+                    <td style="padding:6px 10px; text-align:right;" colspan="2">${best[labelKey]} — ${fmtMoney(best.revenue)}</td>
+                </tr>` : ''}
+            </tfoot>
+        </table>`;
+}
+
+// ── Helpers ──────────────────────────────────
+function textColor()   { return getComputedStyle(document.body).getPropertyValue('--text-primary'); }
+function subColor()    { return getComputedStyle(document.body).getPropertyValue('--text-secondary'); }
+function borderColor() { return getComputedStyle(document.body).getPropertyValue('--border-color'); }
+function fmtMoney(v)   { return '₱' + parseFloat(v).toLocaleString('en-PH', {minimumFractionDigits:2, maximumFractionDigits:2}); }
+
+function chartOptions() {
+    return {
+        responsive: true, maintainAspectRatio: true,
+        plugins: { legend: { labels: { color: textColor() } } },
+        scales: {
+            y: { beginAtZero: true, ticks: { color: subColor() }, grid: { color: borderColor() } },
+            x: { ticks: { color: subColor() }, grid: { color: borderColor() } }
+        }
+    };
+}
+
+// ── Edit Item Modal ───────────────────────────
+function openEditItemModal(btn) {
+    const id    = btn.dataset.itemId;
+    const name  = btn.dataset.itemName;
+    const price = parseFloat(btn.dataset.itemPrice);
+    document.getElementById('edit_item_id').value    = id;
+    document.getElementById('edit_item_name').value  = name;
+    document.getElementById('edit_item_price').value = price.toFixed(2);
+    document.getElementById('editItemForm').action   = `/items/edit/${id}`;
+    document.getElementById('editItemModal').style.display = 'block';
+    document.body.classList.add('modal-open');
+}
+function closeEditItemModal() {
+    document.getElementById('editItemModal').style.display = 'none';
+    document.body.classList.remove('modal-open');
+}
+
+// ── Receipt ───────────────────────────────────
+
+// ── Receipt helpers ────────────────────────────────────────
+function escapeHTML(str) {
+    return String(str)
+        .replace(/&/g,'&amp;').replace(/</g,'&lt;')
+        .replace(/>/g,'&gt;').replace(/"/g,'&quot;').replace(/'/g,'&#39;');
+}
+function fmtMoney(v) {
+    return '\u20b1' + parseFloat(v).toLocaleString('en-PH',
+        {minimumFractionDigits:2, maximumFractionDigits:2});
+}
+
+// Builds a fully self-contained receipt HTML string — zero page CSS dependency.
+function buildReceiptHTML(data) {
+    var items = '';
+    (data.items || []).forEach(function(item) {
+        items +=
+            '<tr>' +
+            '<td style="padding:9px 8px;border-bottom:1px dashed #bbb;color:#000;font-size:13px;">' + escapeHTML(item.name) + '</td>' +
+            '<td style="padding:9px 8px;border-bottom:1px dashed #bbb;text-align:center;color:#000;font-size:13px;">' + item.quantity + '</td>' +
+            '<td style="padding:9px 8px;border-bottom:1px dashed #bbb;text-align:right;color:#000;font-size:13px;">' + fmtMoney(item.price) + '</td>' +
+            '<td style="padding:9px 8px;border-bottom:1px dashed #bbb;text-align:right;color:#000;font-size:13px;font-weight:600;">' + fmtMoney(item.subtotal) + '</td>' +
+            '</tr>';
+    });
+    var discount = data.discount > 0
+        ? '<div style="text-align:right;color:#cc0000;font-size:13px;margin-top:4px;">Discount: -' + fmtMoney(data.discount) + '</div>'
+        : '';
+    var notes = data.notes
+        ? '<div style="color:#000;"><b>Notes:</b> ' + escapeHTML(data.notes) + '</div>'
+        : '';
+    return '<!DOCTYPE html><html><head><meta charset="utf-8">' +
+        '<style>' +
+        'html,body{margin:0;padding:0;background:#fff;color:#000;}' +
+        'body{font-family:"Courier New",Courier,monospace;font-size:13px;' +
+        'line-height:1.6;background:#fff;color:#000;padding:28px 24px;box-sizing:border-box;width:480px;}' +
+        '*{box-sizing:border-box;}' +
+        'table{width:100%;border-collapse:collapse;background:#fff;color:#000;}' +
+        'th,td{color:#000;background:#fff;}' +
+        '</style></head><body>' +
+        '<div style="text-align:center;margin-bottom:20px;padding-bottom:16px;border-bottom:2px solid #000;">' +
+        '<div style="font-size:22px;font-weight:700;letter-spacing:3px;color:#000;">MICROFAUNA</div>' +
+        '<div style="font-size:12px;margin-top:4px;color:#000;letter-spacing:1px;">SALES RECEIPT</div>' +
+        '</div>' +
+        '<div style="margin-bottom:16px;font-size:13px;color:#000;line-height:2;">' +
+        '<div><b>Receipt #:</b> ' + escapeHTML(String(data.sale_id)) + '</div>' +
+        '<div><b>Customer:</b> ' + escapeHTML(data.customer_name) + '</div>' +
+        '<div><b>Date:</b> ' + escapeHTML(data.date) + '</div>' +
+        notes +
+        '</div>' +
+        '<table>' +
+        '<thead><tr style="background:#000;">' +
+        '<th style="padding:9px 8px;text-align:left;color:#fff;font-size:11px;letter-spacing:1px;background:#000;">ITEM</th>' +
+        '<th style="padding:9px 8px;text-align:center;color:#fff;font-size:11px;letter-spacing:1px;background:#000;">QTY</th>' +
+        '<th style="padding:9px 8px;text-align:right;color:#fff;font-size:11px;letter-spacing:1px;background:#000;">PRICE</th>' +
+        '<th style="padding:9px 8px;text-align:right;color:#fff;font-size:11px;letter-spacing:1px;background:#000;">TOTAL</th>' +
+        '</tr></thead>' +
+        '<tbody>' + items + '</tbody>' +
+        '</table>' +
+        '<div style="margin-top:16px;padding-top:12px;border-top:2px solid #000;">' +
+        discount +
+        '<div style="text-align:right;font-size:18px;font-weight:700;color:#000;margin-top:6px;">TOTAL: ' + fmtMoney(data.total) + '</div>' +
+        '</div>' +
+        '<div style="margin-top:22px;padding-top:14px;border-top:1px dashed #bbb;text-align:center;font-size:12px;color:#000;line-height:2;">' +
+        '<div>Thank you for your purchase!</div>' +
+        '<div>Visit us again soon</div>' +
+        '</div>' +
+        '</body></html>';
+}
+
+// Captures receipt as PNG using a hidden iframe — fully isolated from page CSS.
+function captureReceiptPng(action, saleId, customerName, receiptData) {
+    var filename = 'receipt_' + saleId + '_' +
+                   (customerName || '').replace(/\s+/g, '_') + '.png';
+    var isIOS = /iPhone|iPad|iPod/.test(navigator.userAgent);
+
+    var iframe = document.createElement('iframe');
+    iframe.style.cssText = 'position:fixed;left:-9999px;top:0;width:480px;height:1px;border:none;visibility:hidden;';
+    document.body.appendChild(iframe);
+
+    var iDoc = iframe.contentDocument || iframe.contentWindow.document;
+    iDoc.open();
+    iDoc.write(buildReceiptHTML(receiptData));
+    iDoc.close();
+
+    setTimeout(async function() {
+        iframe.style.height = (iDoc.body.scrollHeight + 56) + 'px';
+
+        var canvas;
+        try {
+            canvas = await html2canvas(iDoc.body, {
+                backgroundColor: '#ffffff',
+                scale: 2,
+                useCORS: true,
+                logging: false,
+                windowWidth: 480,
+                width: 480
+            });
+        } catch(err) {
+            console.error('html2canvas error:', err);
+            document.body.removeChild(iframe);
+            alert('Could not capture receipt. Please try again.');
+            return;
+        }
+        document.body.removeChild(iframe);
+
+        var dataUrl = canvas.toDataURL('image/png');
+
+        if (action === 'share') {
+            canvas.toBlob(async function(blob) {
+                var file = new File([blob], filename, { type: 'image/png' });
+                if (navigator.canShare && navigator.canShare({ files: [file] })) {
+                    try {
+                        await navigator.share({ files: [file], title: 'Microfauna Receipt' });
+                        return;
+                    } catch(e) { if (e.name === 'AbortError') return; }
+                }
+                if (window.ClipboardItem && navigator.clipboard && navigator.clipboard.write) {
+                    try {
+                        await navigator.clipboard.write([new ClipboardItem({ 'image/png': blob })]);
+                        alert('Receipt image copied! Paste in any chat.');
+                        return;
+                    } catch(e) { /* fall through */ }
+                }
+                showImagePreviewModal(dataUrl, filename, blob);
+            }, 'image/png');
+
+        } else {
+            if (!isIOS) {
+                var a = document.createElement('a');
+                a.download = filename;
+                a.href = dataUrl;
+                document.body.appendChild(a);
+                a.click();
+                document.body.removeChild(a);
+            } else {
+                canvas.toBlob(async function(blob) {
+                    var file = new File([blob], filename, { type: 'image/png' });
+                    if (navigator.canShare && navigator.canShare({ files: [file] })) {
+                        try {
+                            await navigator.share({ files: [file], title: 'Microfauna Receipt' });
+                            return;
+                        } catch(e) { if (e.name === 'AbortError') return; }
+                    }
+                    showImagePreviewModal(dataUrl, filename, blob);
+                }, 'image/png');
+            }
+        }
+    }, 150);
+}
+
+function showImagePreviewModal(dataUrl, filename, blob) {
+    var existing = document.getElementById('imgPreviewModal');
+    if (existing) existing.remove();
+
+    var overlay = document.createElement('div');
+    overlay.id = 'imgPreviewModal';
+    overlay.style.cssText = 'position:fixed;inset:0;z-index:9999;background:rgba(0,0,0,0.92);display:flex;flex-direction:column;align-items:center;justify-content:center;padding:20px;gap:14px;backdrop-filter:blur(6px);-webkit-backdrop-filter:blur(6px);';
+
+    var img = document.createElement('img');
+    img.src = dataUrl;
+    img.style.cssText = 'max-width:100%;max-height:calc(100vh - 160px);border-radius:10px;box-shadow:0 8px 32px rgba(0,0,0,0.6);object-fit:contain;';
+    img.alt = 'Receipt';
+
+    var hint = document.createElement('p');
+    hint.textContent = 'Long-press image to Copy or Save to Photos';
+    hint.style.cssText = 'color:rgba(255,255,255,0.6);font-size:12px;font-family:-apple-system,sans-serif;margin:0;text-align:center;';
+
+    var btnRow = document.createElement('div');
+    btnRow.style.cssText = 'display:flex;gap:10px;justify-content:center;width:100%;max-width:320px;';
+
+    var shareBtn = document.createElement('button');
+    shareBtn.textContent = 'Share';
+    shareBtn.style.cssText = 'flex:1;padding:13px;background:#00cc77;color:#fff;border:none;border-radius:10px;font-weight:700;font-size:0.95rem;cursor:pointer;touch-action:manipulation;';
+    shareBtn.onclick = async function() {
+        if (blob) {
+            var file = new File([blob], filename, { type: 'image/png' });
+            if (navigator.canShare && navigator.canShare({ files: [file] })) {
+                try { await navigator.share({ files: [file], title: 'Microfauna Receipt' }); return; }
+                catch(e) { if (e.name === 'AbortError') return; }
+            }
+        }
+        if (window.ClipboardItem && navigator.clipboard && navigator.clipboard.write && blob) {
+            try {
+                await navigator.clipboard.write([new ClipboardItem({ 'image/png': blob })]);
+                alert('Copied to clipboard!');
+            } catch(e) { alert('Share not available on this browser.'); }
+        }
+    };
+
+    var closeBtn = document.createElement('button');
+    closeBtn.textContent = 'Close';
+    closeBtn.style.cssText = 'flex:1;padding:13px;background:rgba(255,255,255,0.1);color:#fff;border:1px solid rgba(255,255,255,0.2);border-radius:10px;font-weight:600;font-size:0.95rem;cursor:pointer;touch-action:manipulation;';
+    closeBtn.onclick = function() { overlay.remove(); };
+    overlay.addEventListener('click', function(e) { if (e.target === overlay) overlay.remove(); });
+
+    btnRow.appendChild(shareBtn);
+    btnRow.appendChild(closeBtn);
+    overlay.appendChild(img);
+    overlay.appendChild(hint);
+    overlay.appendChild(btnRow);
+    document.body.appendChild(overlay);
+}
+
+async function showReceipt(saleId) {
+    try {
+        const res  = await fetch(storeUrl('/sales/' + saleId + '/receipt'));
+        const data = await res.json();
+        if (data.error) { alert(data.error); return; }
+
+        MFReceipt.renderInModal(document.getElementById('receiptContent'), data);
+
+        const toggleBtn = document.getElementById('gcashToggleBtn');
+        toggleBtn.textContent = MFReceipt.isGcashOn() ? 'Hide GCash' : 'Show GCash';
+        toggleBtn.onclick = () => {
+            const isOn = MFReceipt.toggleGcash();
+            toggleBtn.textContent = isOn ? 'Hide GCash' : 'Show GCash';
+            MFReceipt.renderInModal(document.getElementById('receiptContent'), data);
+        };
+
+        document.getElementById('downloadReceiptPngBtn').onclick = () =>
+            MFReceipt.captureAsPng('download', data.sale_id, data.customer_name, data);
+        document.getElementById('shareReceiptBtn').onclick = () =>
+            MFReceipt.captureAsPng('share', data.sale_id, data.customer_name, data);
+
+        document.getElementById('receiptModal').style.display = 'flex';
+        document.body.classList.add('modal-open');
+    } catch(e) {
+        alert('Could not load receipt: ' + e.message);
+    }
+}
+
+function closeReceiptModal() {
+    var m = document.getElementById('receiptModal');
+    if (m) m.style.display = 'none';
+    document.body.classList.remove('modal-open');
+}
+
+// ── Dropdowns ─────────────────────────────────
+function toggleDropdown(dropdownId) {
+    const fullId = 'dropdown-' + dropdownId;
+    document.querySelectorAll('.dropdown-content').forEach(d => {
+        if (d.id !== fullId) d.classList.remove('show');
+    });
+    const el = document.getElementById(fullId);
+    if (el) el.classList.toggle('show');
+}
+
+window.onclick = function(event) {
+    if (event.target === document.getElementById('chartModal'))    closeChartModal();
+    if (event.target === document.getElementById('editItemModal')) closeEditItemModal();
+    if (event.target === document.getElementById('receiptModal'))  closeReceiptModal();
+    if (!event.target.matches('.actions-btn')) {
+        document.querySelectorAll('.dropdown-content').forEach(d => d.classList.remove('show'));
+    }
+};
+
+// ── Store switcher ───────────────────────────
+function switchStore(select) {
+    if (select.value !== 'new') {
+        select.form.submit();
+        return;
+    }
+    const name = (prompt('Name of the new store (starts with a copy of this store\'s items):') || '').trim();
+    if (!name) {
+        select.value = document.body.dataset.store;
+        return;
+    }
+    const form = document.createElement('form');
+    form.method = 'post';
+    form.action = '/stores/add';
+    const input = document.createElement('input');
+    input.type = 'hidden';
+    input.name = 'name';
+    input.value = name;
+    form.appendChild(input);
+    document.body.appendChild(form);
+    form.submit();
+}
+
+// ── Live updates ─────────────────────────────
+// /events pushes {table: version} whenever a write commits; where the
+// server runs without it (data-live="poll", e.g. serverless) the versions
+// are polled from /api/versions instead. Sections that read a changed
+// table are re-fetched as rendered fragments and swapped in place; open
+// charts reload only if their data changed.
+const VERSIONS_POLL_MS = 15000;
+
+(function() {
+    const known = JSON.parse(document.body.dataset.versions || '{}');
+    const pending = new Set();
+    let inflight = false;
+
+    function reloadCharts(tables) {
+        const sales = tables.includes('sales'), expenses = tables.includes('expenses');
+        if (sales) { loadMonthlyChart(); loadItemsChart(); }
+        if (expenses) loadExpensesChart();
+        if (sales || expenses) {
+            loadComparisonChart();
+            if (document.getElementById('chart-report').style.display !== 'none') loadReport(activeReportPeriod);
+        }
+    }
+
+    function refresh() {
+        if (inflight || !pending.size) return;
+        const tables = [...pending];
+        pending.clear();
+        inflight = true;
+        fetch(storeUrl('/api/dashboard/fragments?tables=' + encodeURIComponent(tables.join(','))))
+            .then(r => r.json())
+            .then(data => {
+                Object.entries(data.fragments).forEach(([name, html]) => {
+                    const slot = document.querySelector(`[data-fragment="${name}"]`);
+                    if (slot) slot.innerHTML = html;
+                });
+                if (data.fragments.stats) applyStatsVisibility(localStorage.getItem('mf_hide_stats') === 'true');
+                if (document.getElementById('chartModal').style.display === 'block') reloadCharts(tables);
+            })
+            .catch(err => console.error('Live update failed:', err))
+            .finally(() => { inflight = false; refresh(); });
+    }
+
+    function apply(versions) {
+        Object.entries(versions).forEach(([table, version]) => {
+            if (version > (known[table] || 0)) {
+                known[table] = version;
+                pending.add(table);
+            }
+        });
+        refresh();
+    }
+
+    if (document.body.dataset.live === 'events' && window.EventSource) {
+        // Versions are named "<table>@<store id>"; other stores' writes are ignored
+        const store = '@' + document.body.dataset.store;
+        new EventSource('/events').addEventListener('versions', e => {
+            const versions = {};
+            Object.entries(JSON.parse(e.data)).forEach(([name, version]) => {
+                if (name.endsWith(store)) versions[name.slice(0, -store.length)] = version;
+            });
+            apply(versions);
+        });
+        return;
+    }
+
+    // Polling: only while the tab is visible, and once right away on return
+    function poll() {
+        if (document.hidden) return;
+        fetch(storeUrl('/api/versions'))
+            .then(r => r.json())
+            .then(apply)
+            .catch(err => console.error('Live update failed:', err));
+    }
+    setInterval(poll, VERSIONS_POLL_MS);
+    document.addEventListener('visibilitychange', poll);
+})();